@@ -1,77 +1,95 @@
 import cv2 #test
-import face_recognition
-import pickle
 import os
+import metrics
+from face_store import FaceStore
+from enroll_capture import CaptureWorker, select_samples
+from enroll_encoder import crop_around_box, encode_samples, prototypes, save_boxes
+
+NUM_SAMPLES = 20        # 最终保存并编码的样本数
+NUM_CANDIDATES = 60     # 先采集这么多合格的候选，再从中挑出最清晰、角度最分散的 NUM_SAMPLES 张
+DATABASE_DIR = "face_db"
+
+
+def capture_samples(person_name, output_folder):
+    """采集人脸样本，返回 [(帧, 人脸框)]，人脸框直接复用给后面的编码"""
+    print("\n[INFO] Preparing camera...")
+    with metrics.phase("camera"):
+        cap = cv2.VideoCapture(0)
+    metrics.report_startup()
+    print(f"[INFO] Look at camera, we will pick the best {NUM_SAMPLES} of {NUM_CANDIDATES} photos of your face.")
+    print("turn your head slowly left/right and up/down, change your expression, smile, etc. to get diverse samples.")
+
+    # 检测和打分在后台线程里做，界面不会卡住，也不需要每存一张就停下来等
+    worker = CaptureWorker(model='hog', max_candidates=NUM_CANDIDATES).start() # cnn is more accurate but need dlib with gpu support
+    while not worker.done:
+        ret, frame = cap.read()
+        if not ret:
+            print("[ERROR] could not read from camera. Please check your camera connection.")
+            break
+        worker.submit(frame)
+
+        display = frame.copy()
+        for top, right, bottom, left in worker.last_boxes:
+            cv2.rectangle(display, (left, top), (right, bottom), (0, 255, 0), 2)
+        cv2.putText(display, f"Collecting samples {len(worker.candidates)}/{NUM_CANDIDATES}", (10, 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+        cv2.imshow("Face Enrollment", display)
+
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            break
+    worker.stop()
+
+    print("\n[INFO] finished collecting samples.")
+    cap.release()
+    cv2.destroyAllWindows()
+
+    selected = select_samples(worker.candidates, NUM_SAMPLES)
+    print(f"[INFO] Kept {len(selected)} of {len(worker.candidates)} candidates "
+          f"({worker.blurry} blurry frames skipped).")
+    captured = []
+    boxes_by_file = {}
+    for count, sample in enumerate(selected):
+        file_name = f"{person_name}_{count}.jpg"
+        file_path = os.path.join(output_folder, file_name)
+        cv2.imwrite(file_path, sample.frame)
+        print(f"已保存: {file_path}")
+        captured.append((sample.frame, sample.box))
+        boxes_by_file[file_name] = sample.box
+    # 保存人脸框，以后可以用 enroll_encoder.py 从文件夹重新注册而不必再检测
+    save_boxes(output_folder, boxes_by_file)
+    return captured
 
-PERSON_NAME = input("Enter your name in English: ")
-PERSON_PREFERENCE = input(f"Enter {PERSON_NAME}'s favorite drink: ")
-NUM_SAMPLES = 20  
-DATABASE_FILE = "face_database.pkl" 
-
-output_folder = f"dataset/{PERSON_NAME}"
-if not os.path.exists(output_folder):
-    os.makedirs(output_folder)
-
-print("\n[INFO] Preparing camera...")
-cap = cv2.VideoCapture(0)
-print(f"[INFO] Look at camera, we will collect {NUM_SAMPLES} photos of your face.")
-print("change your expression, look left/right, smile, etc. to get diverse samples.")
-
-count = 0
-while count < NUM_SAMPLES:
-    ret, frame = cap.read()
-    if not ret:
-        print("[ERROR] could not read from camera. Please check your camera connection.")
-        break
-
-    cv2.putText(frame, f"Collecting sample {count+1}/{NUM_SAMPLES}", (10, 30), 
-                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-    cv2.imshow("Face Enrollment", frame)
-
-    boxes = face_recognition.face_locations(frame, model='hog') # cnn is more accurate but need dlib with gpu support
 
-    if len(boxes) == 1: #ensure we only capture one face
-        file_path = os.path.join(output_folder, f"{PERSON_NAME}_{count}.jpg")
-        cv2.imwrite(file_path, frame)
-        print(f"已保存: {file_path}")
-        count += 1
-        cv2.waitKey(200) 
-    
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
+def main():
+    person_name = input("Enter your name in English: ")
+    person_preference = input(f"Enter {person_name}'s favorite drink: ")
 
-print("\n[INFO] finished collecting samples.")
-cap.release()
-cv2.destroyAllWindows()
+    output_folder = f"dataset/{person_name}"
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
 
+    captured = capture_samples(person_name, output_folder)
 
-print("[INFO] Processing collected images to create face embeddings...")
+    print("[INFO] Processing collected images to create face embeddings...")
 
-known_encodings = []
-image_paths = [os.path.join(output_folder, f) for f in os.listdir(output_folder)]
+    # 直接使用内存中的帧和采集时的人脸框，只把人脸附近的区域发给编码进程
+    samples = [crop_around_box(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), box) for frame, box in captured]
+    known_encodings = [encoding for encoding in encode_samples(samples) if encoding is not None]
 
-for image_path in image_paths:
-    image = face_recognition.load_image_file(image_path)
-    encoding = face_recognition.face_encodings(image)[0]
-    known_encodings.append(encoding)
+    if known_encodings:
+        # 按角度/表情聚成几个原型，每个原型存一行
+        person_prototypes = prototypes(known_encodings)
 
-if known_encodings:
-    prototype_encoding = sum(known_encodings) / len(known_encodings)
+        # 只追加这一个人的记录，不需要读出并重写整个数据库
+        store = FaceStore(DATABASE_DIR)
+        store.upsert(person_name, person_prototypes, person_preference, num_samples=len(known_encodings))
 
-    if os.path.exists(DATABASE_FILE):
-        with open(DATABASE_FILE, 'rb') as f:
-            database = pickle.load(f)
+        print(f"[SUCCESS] {person_name} has been enrolled successfully with preference: {person_preference} "
+              f"({len(person_prototypes)} prototypes).")
     else:
-        database = {}
-
-    database[PERSON_NAME] = {
-        "embedding": prototype_encoding,
-        "preference": PERSON_PREFERENCE
-    }
+        print("[ERROR] No valid face encodings found. Please try again with clearer images.")
 
-    with open(DATABASE_FILE, 'wb') as f:
-        pickle.dump(database, f)
 
-    print(f"[SUCCESS] {PERSON_NAME} has been enrolled successfully with preference: {PERSON_PREFERENCE}.")
-else:
-    print("[ERROR] No valid face encodings found. Please try again with clearer images.")
\ No newline at end of file
+if __name__ == "__main__":
+    # 编码使用进程池，子进程会重新导入本文件，所以入口必须放在 main 保护下
+    main()
@@ -0,0 +1 @@
+# 离线基准测试：回放服务器 + 无界面的状态机运行器
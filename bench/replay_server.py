@@ -0,0 +1,190 @@
+# -----------------------------------------------------------------------------
+# bench/replay_server.py
+# 作用：离线测试用的"假树莓派"。把录好的图片文件夹或视频文件当作 /video_feed 的 MJPEG 流播放，
+#       /command 只记录收到的指令和时间戳，/commands 返回记录，用来在没有小车的情况下测性能。
+# 用法：python -m bench.replay_server --source recordings/ --fps 15 --port 5000
+# -----------------------------------------------------------------------------
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import cv2
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+DEFAULT_FPS = 15.0
+
+
+def load_frames(source, quality=90):
+    """读取一个图片文件夹或视频文件，返回 JPEG 字节列表"""
+    frames = []
+    if os.path.isdir(source):
+        for file_name in sorted(os.listdir(source)):
+            path = os.path.join(source, file_name)
+            if file_name.lower().endswith((".jpg", ".jpeg")):
+                with open(path, "rb") as f:
+                    frames.append(f.read())
+            elif file_name.lower().endswith(IMAGE_EXTENSIONS):
+                _, buffer = cv2.imencode(".jpg", cv2.imread(path), [cv2.IMWRITE_JPEG_QUALITY, quality])
+                frames.append(buffer.tobytes())
+    else:
+        cap = cv2.VideoCapture(source)
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            _, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            frames.append(buffer.tobytes())
+        cap.release()
+    if not frames:
+        raise ValueError(f"No frames found in {source}")
+    return frames
+
+
+class ReplayServer:
+    """在后台线程运行的回放服务器"""
+
+    def __init__(self, source, fps=DEFAULT_FPS, host="127.0.0.1", port=0, loop=True):
+        self.frames = load_frames(source)
+        self.fps = fps
+        self.loop = loop
+        self.commands = []          # {"seq", "command", "issued_at", "received_at"}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def stream_url(self):
+        return self.base_url + "/video_feed"
+
+    @property
+    def command_url(self):
+        return self.base_url + "/command"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="replay-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def record_command(self, data):
+        record = {
+            "seq": data.get("seq"),
+            "command": data.get("command"),
+            "issued_at": data.get("issued_at"),
+            "received_at": time.time(),
+        }
+        with self._lock:
+            self.commands.append(record)
+        return record
+
+    def command_log(self):
+        with self._lock:
+            return list(self.commands)
+
+
+def _make_handler(replay):
+    class Handler(BaseHTTPRequestHandler):
+        # 和树莓派服务器一样：pi_robot_server.main() 把 Werkzeug 设成了 HTTP/1.1，
+        # 视频流因此按 chunked 编码发送，客户端的 _Dechunked 路径在基准测试里也会被用到
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True  # 头和正文分两次写，不关 Nagle 会多出几十毫秒的延迟确认
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, payload, status=200):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/video_feed":
+                fps = float(parse_qs(url.query).get("fps", [0])[0]) or replay.fps
+                self._stream(fps)
+            elif url.path == "/commands":
+                self._send_json(replay.command_log())
+            else:
+                self._send_json({"status": "error", "message": "Not found"}, 404)
+
+        def do_POST(self):
+            if urlparse(self.path).path != "/command":
+                self._send_json({"status": "error", "message": "Not found"}, 404)
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                data = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                data = {}
+            if "command" not in data:
+                self._send_json({"status": "error", "message": "Invalid command format"}, 400)
+                return
+            record = replay.record_command(data)
+            self._send_json({"status": "success", "command_received": record["command"], "seq": record["seq"]})
+
+        def _stream(self, fps):
+            self.close_connection = True
+            self.send_response(200)
+            self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            interval = 1.0 / fps
+            next_frame = time.perf_counter()
+            seq = 0
+            try:
+                while True:
+                    for jpeg in replay.frames:
+                        seq += 1
+                        # Werkzeug 把生成器产出的每一段写成一个 chunk，这里每帧也是一个 chunk
+                        self._write_chunk(b'--frame\r\n'
+                                          b'Content-Type: image/jpeg\r\n'
+                                          b'Content-Length: ' + str(len(jpeg)).encode() + b'\r\n'
+                                          b'X-Frame-Seq: ' + str(seq).encode() + b'\r\n\r\n' + jpeg + b'\r\n')
+                        next_frame += interval
+                        delay = next_frame - time.perf_counter()
+                        if delay > 0:
+                            time.sleep(delay)
+                    if not replay.loop:
+                        break
+                self.wfile.write(b"0\r\n\r\n")    # 结束块
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def _write_chunk(self, data):
+            self.wfile.write(b"%x\r\n" % len(data) + data + b"\r\n")
+
+    return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve recorded frames as a stand-in Pi robot server.")
+    parser.add_argument("--source", required=True, help="folder of images or a video file")
+    parser.add_argument("--fps", type=float, default=DEFAULT_FPS)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--once", action="store_true", help="stop the stream after one pass instead of looping")
+    args = parser.parse_args()
+
+    server = ReplayServer(args.source, args.fps, args.host, args.port, loop=not args.once).start()
+    print(f"[BENCH INFO] Replaying {len(server.frames)} frames at {args.fps} fps on {server.stream_url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,167 @@
+# -----------------------------------------------------------------------------
+# bench/run_bench.py
+# 作用：离线基准测试。启动回放服务器（或连接到指定的视频流/指令地址），
+#       用真实的模型无界面地驱动完整状态机，统计 FPS、各阶段延迟分位数和指令下发延迟，
+#       结果写成 JSON，方便比较不同版本之间的性能回退。
+# 用法：python -m bench.run_bench --source recordings/ --frames 300 --output bench_results.json
+#       python -m bench.run_bench --source recordings/ --state ROTATING_TO_FIND_DRINK --drink Coke
+# -----------------------------------------------------------------------------
+import argparse
+import json
+import platform
+import subprocess
+import time
+from collections import Counter
+
+from bench.replay_server import ReplayServer, DEFAULT_FPS
+from command_channel import CommandDispatcher
+from face_detector import DEFAULT_MODEL as FACE_DETECTION_MODEL
+from face_store import STORE_DIR
+from mjpeg_reader import MJPEGFrameGrabber
+from perception import build_local_perception, YOLO_MODEL_PATH
+from vending_state_machine import VendingStateMachine
+from metrics import summarize
+import metrics
+import model_registry
+
+READ_TIMEOUT = 5.0
+
+
+class TimedPerception:
+    """包装感知对象，记录每次 identify / find_drink 的耗时"""
+
+    def __init__(self, perception, stage_samples):
+        self.perception = perception
+        self.stage_samples = stage_samples
+
+    def _timed(self, stage, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.stage_samples.setdefault(stage, []).append(time.perf_counter() - start)
+
+    def identify(self, frame):
+        return self._timed("identify", self.perception.identify, frame)
+
+    def find_drink(self, frame, drink_name):
+        return self._timed("find_drink", self.perception.find_drink, frame, drink_name)
+
+    def preference(self, name):
+        return self.perception.preference(name)
+
+    def reset(self):
+        self.perception.reset()
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    server = None
+    if args.stream_url:
+        stream_url, command_url = args.stream_url, args.command_url
+    else:
+        server = ReplayServer(args.source, fps=args.fps).start()
+        stream_url, command_url = server.stream_url, server.command_url
+
+    load_start = time.perf_counter()
+    perception = build_local_perception(store_dir=args.store, yolo_model_path=args.yolo,
+                                        face_detection_model=args.face_model)
+    load_time = time.perf_counter() - load_start
+
+    stage_samples = {}
+    dispatcher = CommandDispatcher(command_url, verbose=False).start()
+    machine = VendingStateMachine(TimedPerception(perception, stage_samples),
+                                  lambda command, force_send=False: dispatcher.send(command, force=force_send))
+    if args.state:
+        # 直接从指定状态开始，例如只测饮料检测相关的状态
+        machine.state = args.state
+        machine.target_drink_name = args.drink or ""
+
+    grabber = MJPEGFrameGrabber(stream_url, reconnect=False).start()
+    states = Counter()
+    frame_ages = []
+    frames = 0
+    start = time.perf_counter()
+    try:
+        while frames < args.frames and time.perf_counter() - start < args.duration:
+            read_start = time.perf_counter()
+            ret, frame, info = grabber.read(timeout=READ_TIMEOUT)
+            stage_samples.setdefault("read", []).append(time.perf_counter() - read_start)
+            if not ret:
+                break
+            frame_ages.append(info.age)
+            step_start = time.perf_counter()
+            state = machine.step(frame)
+            stage_samples.setdefault("step", []).append(time.perf_counter() - step_start)
+            states[state] += 1
+            frames += 1
+    finally:
+        elapsed = time.perf_counter() - start
+        grabber_stats = grabber.stats()
+        grabber.release()
+        dispatcher.close()
+
+    command_log = server.command_log() if server else []
+    issue_latencies = [c["received_at"] - c["issued_at"] for c in command_log if c.get("issued_at")]
+    if server:
+        server.stop()
+
+    return {
+        "revision": git_revision(),
+        "timestamp": time.time(),
+        "host": platform.node(),
+        "config": {
+            "source": args.source, "stream_url": args.stream_url, "fps": args.fps,
+            "face_model": args.face_model, "yolo": args.yolo, "initial_state": args.state,
+        },
+        "model_load_s": load_time,
+        "model_timings": model_registry.timings(),
+        "frames": frames,
+        "duration_s": elapsed,
+        "fps": frames / elapsed if elapsed else 0.0,
+        "stages": {stage: summarize(samples) for stage, samples in stage_samples.items()},
+        "frame_age": summarize(frame_ages),
+        "grabber": grabber_stats,
+        "commands": {
+            "count": len(command_log),
+            "issue_latency": summarize(issue_latencies),
+            "ack_latency": summarize(list(dispatcher.latencies)),
+            "dispatcher": dispatcher.stats(),
+        },
+        "states": dict(states),
+        "metrics": metrics.snapshot(),   # 各模型阶段（人脸检测/编码/比对、YOLO）的细分耗时
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless replay benchmark for the PC vision loop.")
+    parser.add_argument("--source", help="folder of images or a video file to replay")
+    parser.add_argument("--stream-url", help="use an existing stream instead of the replay server")
+    parser.add_argument("--command-url", help="command endpoint to use with --stream-url")
+    parser.add_argument("--fps", type=float, default=DEFAULT_FPS, help="replay frame rate")
+    parser.add_argument("--frames", type=int, default=300, help="stop after this many processed frames")
+    parser.add_argument("--duration", type=float, default=120.0, help="stop after this many seconds")
+    parser.add_argument("--state", help="start the state machine in this state")
+    parser.add_argument("--drink", help="target drink when starting in a drink state")
+    parser.add_argument("--store", default=STORE_DIR)
+    parser.add_argument("--yolo", default=YOLO_MODEL_PATH)
+    parser.add_argument("--face-model", default=FACE_DETECTION_MODEL, choices=("hog", "cnn"))
+    parser.add_argument("--output", help="write results JSON to this file")
+    args = parser.parse_args()
+    if not args.source and not (args.stream_url and args.command_url):
+        parser.error("give --source, or both --stream-url and --command-url")
+
+    results = run(args)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"[BENCH INFO] Results written to {args.output}")
+    print(text)
@@ -0,0 +1,145 @@
+# -----------------------------------------------------------------------------
+# command_channel.py
+# 作用：PC -> 机器人的异步指令通道。后台线程通过持久连接（HTTP keep-alive）发送指令，
+#       识别主循环只负责把指令放进队列，永远不会因为网络卡住。
+#       队列规则：STOP / STATUS:Idle 优先发送；还没发出去的运动指令会被新的运动指令覆盖；
+#       其他动作指令（FETCH 等）按顺序发送，不会被丢弃。
+# -----------------------------------------------------------------------------
+import itertools
+import threading
+import time
+from collections import deque
+
+import requests
+
+import metrics
+
+PRIORITY_COMMANDS = ("STOP", "STATUS:Idle")
+MOTION_PREFIXES = ("MOVE:", "TURN:")
+CONNECT_TIMEOUT = 1.0
+READ_TIMEOUT = 1.0
+LATENCY_HISTORY = 200
+
+
+def is_priority(command):
+    return command in PRIORITY_COMMANDS
+
+
+def is_motion(command):
+    return command.startswith(MOTION_PREFIXES)
+
+
+class CommandDispatcher:
+    """非阻塞的指令发送器：带序号、合并被取代的运动指令、记录确认延迟"""
+
+    def __init__(self, url, verbose=True):
+        self.url = url
+        self.verbose = verbose
+        self.session = requests.Session()   # 复用 TCP 连接（树莓派服务器以 HTTP/1.1 应答），不再每条指令都重新握手
+        self._cond = threading.Condition()
+        self._pending = deque()             # (seq, command, 入队时间, 入队的系统时间)
+        self._seq = itertools.count(1)
+        self._running = False
+        self._busy = False
+        self._thread = None
+        self.last_command = ""              # 最后一条入队的指令，用于去重；和队列一起由 _cond 保护
+        self.last_acked_seq = 0
+        self.sent = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.latencies = deque(maxlen=LATENCY_HISTORY)  # 入队到收到确认的秒数
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="command-dispatcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def send(self, command, force=False):
+        """把指令放进发送队列，立即返回序号；与上一条相同且没有 force 时返回 None"""
+        with self._cond:
+            # 去重检查和更新 last_command 必须和发送线程失败时的重置在同一把锁下，
+            # 否则重置可能插在检查和更新之间，指令被错误地去重或重复发送
+            if command == self.last_command and not force:
+                return None
+            self.last_command = command
+            seq = next(self._seq)
+            item = (seq, command, time.perf_counter(), time.time())
+            if is_priority(command) or is_motion(command):
+                # 停止指令和新的运动指令都会取代还没发出去的运动指令
+                before = len(self._pending)
+                self._pending = deque(p for p in self._pending if not is_motion(p[1]))
+                if before > len(self._pending):
+                    self.coalesced += before - len(self._pending)
+                    metrics.count("command.coalesced", before - len(self._pending))
+            if is_priority(command):
+                # 插到其他优先指令之后、普通指令之前
+                index = sum(1 for p in self._pending if is_priority(p[1]))
+                self._pending.insert(index, item)
+            else:
+                self._pending.append(item)
+            self._cond.notify_all()
+        if self.verbose:
+            print(f"[PC CMD] Queued command #{seq}: '{command}'")
+        return seq
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or not self._running)
+                if not self._pending:
+                    return
+                seq, command, queued_at, issued_at = self._pending.popleft()
+                self._busy = True
+            metrics.observe("command.queue_wait", time.perf_counter() - queued_at)
+            try:
+                # issued_at 是状态机发出指令的时间，接收端可以据此统计指令下发延迟
+                response = self.session.post(self.url, json={"command": command, "seq": seq,
+                                                             "issued_at": issued_at},
+                                             timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+                response.raise_for_status()
+                self.latencies.append(time.perf_counter() - queued_at)
+                metrics.observe("command.ack", self.latencies[-1])
+                metrics.count("command.sent")
+                self.last_acked_seq = seq
+                self.sent += 1
+            except requests.exceptions.RequestException:
+                self.failed += 1
+                metrics.count("command.failed")
+                print(f"[PC WARN] Failed to send command #{seq} '{command}', network error.")
+                # 允许主循环下一次发送同一条指令时重试
+                with self._cond:
+                    if self.last_command == command:
+                        self.last_command = ""
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def flush(self, timeout=2.0):
+        """等待队列中的指令全部发出（例如退出前的停止指令）"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._busy, timeout)
+
+    def close(self, timeout=2.0):
+        self.flush(timeout)
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+        self.session.close()
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        with self._cond:
+            pending = len(self._pending)
+        return {
+            "pending": pending,
+            "sent": self.sent,
+            "failed": self.failed,
+            "coalesced": self.coalesced,
+            "last_acked_seq": self.last_acked_seq,
+            "ack_latency_p50": latencies[len(latencies) // 2] if latencies else None,
+            "ack_latency_max": latencies[-1] if latencies else None,
+        }
@@ -0,0 +1,229 @@
+# -----------------------------------------------------------------------------
+# drink_backends.py
+# 作用：饮料检测模型的推理后端。同一份 best.pt 可以用 PyTorch 直接运行，也可以导出成
+#       ONNX（ONNX Runtime）或 OpenVINO 在没有显卡的电脑上运行，支持 int8 量化和自定义输入尺寸。
+#       int8 的含义因后端而异：OpenVINO 用校准数据做完整的静态量化（权重和激活都是 int8）；
+#       ONNX 只做权重的动态量化，激活仍是 float，YOLO 这类卷积网络在 CPU 上往往不会更快，甚至更慢；
+#       PyTorch 后端不支持 int8。要不要开 int8，以 check --int8 的实测结果为准。
+#       导出结果缓存在权重旁边，权重更新后自动重新导出。
+#       自带一致性+速度检查：在一批样例图片上和 PyTorch 结果逐框比较，并统计每种后端（及其 int8 版本）的延迟。
+# 用法：DRINK_BACKEND=openvino DRINK_INT8=1 python pc_recognition_client.py
+#       python drink_backends.py check --images samples/ --backends pytorch onnx openvino --int8
+# -----------------------------------------------------------------------------
+import argparse
+import json
+import os
+import shutil
+import time
+
+import cv2
+import numpy as np
+
+import model_registry
+from metrics import summarize
+
+BACKENDS = ("pytorch", "onnx", "openvino")
+DEFAULT_BACKEND = os.environ.get("DRINK_BACKEND", "pytorch")
+DEFAULT_IMGSZ = int(os.environ.get("DRINK_IMGSZ", 640))
+DEFAULT_INT8 = os.environ.get("DRINK_INT8", "0").lower() in ("1", "true", "yes")
+INT8_CALIBRATION_DATA = os.environ.get("DRINK_INT8_DATA")  # OpenVINO int8 校准用的数据集 yaml，不设置时用 ultralytics 默认
+PARITY_IOU = 0.5            # 两个框 IoU 超过这个值且类别相同，认为是同一个检测
+PARITY_MIN_MATCH = 0.95     # 至少这么多 PyTorch 的框被找到，才认为后端结果一致
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def exported_path(weights, backend, imgsz, int8):
+    """导出文件应该放在哪里：权重旁边，文件名里带上输入尺寸和是否量化"""
+    stem = os.path.splitext(weights)[0]
+    suffix = f"_{imgsz}" + ("_int8" if int8 else "")
+    if backend == "onnx":
+        return f"{stem}{suffix}.onnx"
+    return f"{stem}{suffix}_openvino_model"
+
+
+def _is_fresh(path, weights):
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(weights)
+
+
+def export(weights, backend, imgsz=DEFAULT_IMGSZ, int8=False, data=INT8_CALIBRATION_DATA):
+    """把 PyTorch 权重导出成指定后端，返回导出文件路径；已经导出过且比权重新时直接返回"""
+    if backend == "pytorch":
+        if int8:
+            print("[WARN] DRINK_INT8 is ignored for the pytorch backend; "
+                  "use DRINK_BACKEND=openvino (or onnx, weight-only) for int8.")
+        return weights
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown drink detection backend '{backend}', expected one of {BACKENDS}")
+    target = exported_path(weights, backend, imgsz, int8)
+    if _is_fresh(target, weights):
+        return target
+
+    from ultralytics import YOLO
+    print(f"[INFO] Exporting {weights} to {backend} (imgsz={imgsz}, int8={int8})...")
+    # dynamic=True：饮料调度器会按 ROI 大小缩小输入尺寸，导出的模型不能写死输入形状
+    if backend == "onnx":
+        path = YOLO(weights).export(format="onnx", imgsz=imgsz, dynamic=True)
+        if int8:
+            # ultralytics 的 ONNX 导出不支持 int8，用 ONNX Runtime 做权重动态量化：
+            # 只有权重是 int8，卷积仍按 float 计算，模型变小但不一定变快，check --int8 会和 fp32 版本比较
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(path, target, weight_type=QuantType.QUInt8)
+            os.remove(path)
+            path = target
+    else:
+        options = {"int8": int8}
+        if int8 and data:
+            options["data"] = data
+        path = YOLO(weights).export(format="openvino", imgsz=imgsz, dynamic=True, **options)
+    if os.path.abspath(path) != os.path.abspath(target):
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        os.replace(path, target)
+    return target
+
+
+def load_drink_model(weights, backend=DEFAULT_BACKEND, imgsz=DEFAULT_IMGSZ, int8=DEFAULT_INT8, warmup=True):
+    """按后端导出（需要时）并通过模型注册表加载，返回和 YOLO 用法一样的模型句柄"""
+    return load_exported(export(weights, backend, imgsz, int8), backend, imgsz, warmup)
+
+
+def load_exported(path, backend=DEFAULT_BACKEND, imgsz=DEFAULT_IMGSZ, warmup=True):
+    """加载 export() 已经导出好的模型；多个进程同时加载时只能由一个进程先导出，再各自调用这里"""
+    if backend == "pytorch":
+        return model_registry.get_yolo(path, warmup=warmup, imgsz=imgsz)
+    return model_registry.get_yolo(path, warmup=warmup, imgsz=imgsz, task="detect")
+
+
+# --- 一致性和速度检查 ---
+def _detections(results):
+    """[(类别编号, 置信度, np.array([x1, y1, x2, y2]))]"""
+    return [(int(box.cls[0]), float(box.conf[0]), np.asarray(box.xyxy[0], dtype=np.float32))
+            for r in results for box in r.boxes]
+
+
+def _iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def compare(reference, candidate):
+    """把候选后端的检测和 PyTorch 的逐框贪心匹配，返回 (匹配数, IoU 列表, 置信度差列表, 多出来的框数)"""
+    used = set()
+    ious, conf_diffs = [], []
+    for cls, conf, box in sorted(reference, key=lambda d: -d[1]):
+        best, best_iou = None, PARITY_IOU
+        for i, (c_cls, c_conf, c_box) in enumerate(candidate):
+            if i in used or c_cls != cls:
+                continue
+            iou = _iou(box, c_box)
+            if iou >= best_iou:
+                best, best_iou = i, iou
+        if best is not None:
+            used.add(best)
+            ious.append(best_iou)
+            conf_diffs.append(abs(candidate[best][1] - conf))
+    return len(ious), ious, conf_diffs, len(candidate) - len(used)
+
+
+def _variants(backends, int8):
+    """要测的 (报告里的名字, 后端, 是否 int8)：PyTorch 作为基准；int8 时每个导出后端同时测 fp32 和 int8"""
+    variants = [("pytorch", "pytorch", False)]
+    for backend in backends:
+        if backend == "pytorch":
+            continue
+        variants.append((backend, backend, False))
+        if int8:
+            variants.append((f"{backend}-int8", backend, True))
+    return variants
+
+
+def check(weights, images, backends=BACKENDS, imgsz=DEFAULT_IMGSZ, int8=False, repeats=1):
+    """
+    在样例图片上运行每个后端，和 PyTorch 比较检测结果并统计延迟。
+    int8 为 True 时每个导出后端的 fp32 和 int8 版本都测，报告里 int8 版本带上相对 fp32 的加速比。
+    """
+    frames = [cv2.imread(os.path.join(images, name)) for name in sorted(os.listdir(images))
+              if name.lower().endswith(IMAGE_EXTENSIONS)]
+    if not frames:
+        raise ValueError(f"No images found in {images}")
+
+    outputs, report = {}, {}
+    for name, backend, quantized in _variants(backends, int8):
+        model = load_drink_model(weights, backend, imgsz, quantized)
+        latencies, detections = [], []
+        for frame in frames:
+            for _ in range(repeats):
+                start = time.perf_counter()
+                results = model(frame, imgsz=imgsz, verbose=False)
+                latencies.append(time.perf_counter() - start)
+            detections.append(_detections(results))
+        outputs[name] = detections
+        report[name] = {"backend": backend, "int8": quantized, "latency": summarize(latencies)}
+        if quantized:
+            fp32 = report[backend]["latency"]["p50_ms"]
+            report[name]["speedup_vs_fp32"] = fp32 / report[name]["latency"]["p50_ms"]
+
+    reference = outputs["pytorch"]
+    total = sum(len(d) for d in reference)
+    for backend, detections in outputs.items():
+        matched, ious, conf_diffs, extra = 0, [], [], 0
+        for ref, cand in zip(reference, detections):
+            m, i, c, e = compare(ref, cand)
+            matched += m
+            ious += i
+            conf_diffs += c
+            extra += e
+        match_rate = matched / total if total else 1.0
+        report[backend].update({
+            "reference_boxes": total,
+            "match_rate": match_rate,
+            "extra_boxes": extra,
+            "mean_iou": float(np.mean(ious)) if ious else None,
+            "max_conf_diff": float(max(conf_diffs)) if conf_diffs else None,
+            "parity": match_rate >= PARITY_MIN_MATCH,
+        })
+    return report
+
+
+def fastest(report):
+    """结果一致的后端里 p50 延迟最低的一个，返回它在报告里的名字"""
+    candidates = [(r["latency"]["p50_ms"], name) for name, r in report.items() if r["parity"]]
+    return min(candidates)[1] if candidates else "pytorch"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export and compare drink detector inference backends.")
+    sub = parser.add_subparsers(dest="action", required=True)
+    export_parser = sub.add_parser("export", help="export the weights for one backend")
+    export_parser.add_argument("backend", choices=BACKENDS)
+    check_parser = sub.add_parser("check", help="compare detections and latency against PyTorch")
+    check_parser.add_argument("--images", required=True, help="folder of sample images")
+    check_parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    check_parser.add_argument("--repeats", type=int, default=3, help="timed runs per image")
+    check_parser.add_argument("--output", help="write the report JSON to this file")
+    for p in (export_parser, check_parser):
+        p.add_argument("--weights", default="yolo_weights/best.pt")
+        p.add_argument("--imgsz", type=int, default=DEFAULT_IMGSZ)
+        p.add_argument("--int8", action="store_true")
+    args = parser.parse_args()
+
+    if args.action == "export":
+        print(f"[INFO] Exported to {export(args.weights, args.backend, args.imgsz, args.int8)}")
+    else:
+        report = check(args.weights, args.images, args.backends, args.imgsz, args.int8, args.repeats)
+        for name, r in report.items():
+            speedup = f"  int8 x{r['speedup_vs_fp32']:.2f}" if "speedup_vs_fp32" in r else ""
+            print(f"[INFO] {name:14s} p50 {r['latency']['p50_ms']:7.1f}ms  p90 {r['latency']['p90_ms']:7.1f}ms  "
+                  f"match {r['match_rate'] * 100:5.1f}%  extra {r['extra_boxes']:3d}  "
+                  f"{'OK' if r['parity'] else 'MISMATCH'}{speedup}")
+            if r.get("speedup_vs_fp32", 1.0) < 1.0:
+                print(f"[WARN] {name} is slower than fp32 {r['backend']}; leave DRINK_INT8 off for it.")
+        best = report[fastest(report)]
+        print(f"[INFO] Fastest backend with matching detections: {fastest(report)} "
+              f"(set DRINK_BACKEND={best['backend']}{' DRINK_INT8=1' if best['int8'] else ''})")
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
@@ -0,0 +1,160 @@
+# -----------------------------------------------------------------------------
+# drink_detector.py
+# 作用：饮料检测调度器。找饮料和靠近饮料时只关心一个类别、而且目标就在上一个框附近：
+#       - YOLO 只检测目标类别（classes 参数），不再在 Python 里遍历所有框；
+#       - 已经有框时只在框周围的 ROI 上推理，输入尺寸按 ROI 缩小，每隔几次做一次全画面刷新；
+#       - 两次推理之间用光流移动/缩放框，靠近逻辑每一帧都能拿到最新的框高度。
+# -----------------------------------------------------------------------------
+import cv2
+
+import metrics
+from face_tracker import propagate_box, features_in_box
+
+INFERENCE_INTERVAL = 3      # 每隔多少帧做一次 YOLO 推理，中间帧用光流跟踪框
+FULL_FRAME_INTERVAL = 5     # 连续多少次 ROI 推理之后强制做一次全画面检测
+ROI_MARGIN = 0.75           # ROI 在上一个框四周各扩展框宽/高的多少倍
+MIN_ROI_SIZE = 160          # ROI 的最小边长（像素）
+MAX_IMGSZ = 640             # 全画面推理的输入尺寸，ROI 推理按 ROI 大小缩小
+IMGSZ_STRIDE = 32           # YOLO 输入尺寸必须是 32 的倍数
+
+
+def class_ids(model, drink_name):
+    """目标饮料在模型里的类别编号（不区分大小写），模型不认识时返回空列表"""
+    return [i for i, name in model.names.items() if name.lower() == drink_name.lower()]
+
+
+def best_box(results, offset=(0, 0)):
+    """取置信度最高的框，返回整张图坐标下的 (x1, y1, x2, y2)"""
+    best, best_conf = None, -1.0
+    ox, oy = offset
+    for r in results:
+        for box in r.boxes:
+            confidence = float(box.conf[0])
+            if confidence > best_conf:
+                x1, y1, x2, y2 = (float(v) for v in box.xyxy[0])
+                best, best_conf = (x1 + ox, y1 + oy, x2 + ox, y2 + oy), confidence
+    return best
+
+
+def detect_batch(model, frames, drink_names, imgsz=MAX_IMGSZ):
+    """
+    多路画面一次送进 YOLO（整图，不做 ROI）：只检测这些画面的目标类别的并集，
+    每张画面只取自己目标类别里置信度最高的框。返回和 frames 一一对应的框或 None。
+    """
+    wanted = [set(class_ids(model, name)) for name in drink_names]
+    classes = sorted(set().union(*wanted)) if wanted else []
+    if not classes:
+        return [None] * len(frames)
+    with metrics.timer("drink.yolo_batch"):
+        results = model(list(frames), classes=classes, imgsz=imgsz, verbose=False)
+    boxes = []
+    for r, ids in zip(results, wanted):
+        best, best_conf = None, -1.0
+        for box in r.boxes:
+            confidence = float(box.conf[0])
+            if int(box.cls[0]) in ids and confidence > best_conf:
+                best, best_conf = tuple(float(v) for v in box.xyxy[0]), confidence
+        boxes.append(best)
+    return boxes
+
+
+class DrinkDetectionScheduler:
+    """detect(frame, drink_name) 每帧调用一次，返回目标饮料的 (x1, y1, x2, y2) 或 None"""
+
+    def __init__(self, model, inference_interval=INFERENCE_INTERVAL, full_frame_interval=FULL_FRAME_INTERVAL,
+                 roi_margin=ROI_MARGIN, min_roi_size=MIN_ROI_SIZE, imgsz=MAX_IMGSZ):
+        self.model = model
+        self.inference_interval = max(1, inference_interval)
+        self.full_frame_interval = full_frame_interval
+        self.roi_margin = roi_margin
+        self.min_roi_size = min_roi_size
+        self.imgsz = imgsz
+        self.box = None
+        self._target = None
+        self._classes = []
+        self._prev_gray = None
+        self._points = None
+        self._frames_since_inference = 0
+        self._roi_since_full = 0
+        self.full_inferences = 0
+        self.roi_inferences = 0
+        self.tracked_frames = 0
+
+    def reset(self):
+        self.box = None
+        self._prev_gray = None
+        self._points = None
+        self._frames_since_inference = 0
+        self._roi_since_full = 0
+
+    def detect(self, frame, drink_name):
+        if drink_name != self._target:
+            self.reset()
+            self._target = drink_name
+            self._classes = class_ids(self.model, drink_name)
+        if not self._classes:
+            return None
+
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        box = None
+        if self.box is not None and self._frames_since_inference + 1 < self.inference_interval:
+            box = self._track(gray)
+        if box is None:
+            box = self._infer(frame)
+            self._frames_since_inference = 0
+            self._points = features_in_box(gray, _to_trbl(box)) if box is not None else None
+        else:
+            self._frames_since_inference += 1
+            self.tracked_frames += 1
+            metrics.count("drink.tracked")
+        self.box = box
+        self._prev_gray = gray
+        return box
+
+    def _track(self, gray):
+        """用光流把上一个框移到这一帧；跟丢时返回 None，由调用方改做推理"""
+        moved = propagate_box(self._prev_gray, gray, self._points, _to_trbl(self.box))
+        if moved is None:
+            return None
+        (top, right, bottom, left), self._points = moved
+        return float(left), float(top), float(right), float(bottom)
+
+    def _infer(self, frame):
+        if self.box is not None and self._roi_since_full < self.full_frame_interval:
+            self._roi_since_full += 1
+            x1, y1, x2, y2 = self._roi(frame.shape)
+            box = self._run(frame[y1:y2, x1:x2], (x1, y1))
+            self.roi_inferences += 1
+            metrics.count("drink.roi")
+            if box is not None:
+                return box
+            # ROI 里没找到（目标移出了 ROI），马上在全画面上再找一次
+        self._roi_since_full = 0
+        self.full_inferences += 1
+        metrics.count("drink.full")
+        return self._run(frame, (0, 0))
+
+    def _roi(self, shape):
+        height, width = shape[:2]
+        x1, y1, x2, y2 = self.box
+        pad_w = max((x2 - x1) * self.roi_margin, (self.min_roi_size - (x2 - x1)) / 2)
+        pad_h = max((y2 - y1) * self.roi_margin, (self.min_roi_size - (y2 - y1)) / 2)
+        return (max(0, int(x1 - pad_w)), max(0, int(y1 - pad_h)),
+                min(width, int(x2 + pad_w)), min(height, int(y2 + pad_h)))
+
+    def _run(self, image, offset):
+        # 输入尺寸跟着图像走：小 ROI 用小输入，推理时间大致和像素数成正比
+        longest = max(image.shape[:2])
+        imgsz = min(self.imgsz, -(-longest // IMGSZ_STRIDE) * IMGSZ_STRIDE)
+        with metrics.timer("drink.yolo"):
+            results = self.model(image, classes=self._classes, imgsz=imgsz, verbose=False)
+        return best_box(results, offset)
+
+    def stats(self):
+        return {"full": self.full_inferences, "roi": self.roi_inferences, "tracked": self.tracked_frames}
+
+
+def _to_trbl(box):
+    """(x1, y1, x2, y2) -> face_tracker 使用的 (top, right, bottom, left)"""
+    x1, y1, x2, y2 = box
+    return y1, x2, y2, x1
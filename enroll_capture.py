@@ -0,0 +1,133 @@
+# -----------------------------------------------------------------------------
+# enroll_capture.py
+# 作用：注册时的样本采集。界面线程只读摄像头和显示画面，人脸检测在工作线程里做（只处理最新一帧）；
+#       每个只有一张脸的画面打两个分：人脸区域的清晰度（拉普拉斯方差）和头部朝向（5 点特征点估计），
+#       采集结束后从候选里挑出 K 张——先保证清晰，再尽量覆盖不同的朝向。
+# -----------------------------------------------------------------------------
+import threading
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from face_detector import MultiScaleFaceDetector
+
+MAX_CANDIDATES = 60         # 合格的候选样本达到这么多就停止采集
+SHARPNESS_SIZE = 128        # 人脸缩放到这个边长再算清晰度，远近不同的人脸可以直接比较
+MIN_SHARPNESS = 30.0        # 清晰度低于这个值（运动模糊、失焦）的样本直接丢弃
+POSE_WEIGHT = 2.0           # 挑选样本时朝向差异相对清晰度的权重
+
+Candidate = namedtuple("Candidate", ["frame", "box", "sharpness", "pose"])
+
+
+def sharpness(gray_face):
+    """拉普拉斯方差：越大越清晰"""
+    face = cv2.resize(gray_face, (SHARPNESS_SIZE, SHARPNESS_SIZE), interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(face, cv2.CV_64F).var())
+
+
+def head_pose(rgb_frame, box):
+    """
+    由 5 点特征点粗略估计朝向，返回 (左右, 上下)：鼻尖相对两眼中点的偏移，按两眼间距归一化。
+    找不到特征点时返回 None。
+    """
+    import face_recognition
+    landmarks = face_recognition.face_landmarks(rgb_frame, [box], model="small")
+    if not landmarks:
+        return None
+    points = landmarks[0]
+    left_eye = np.mean(points["left_eye"], axis=0)
+    right_eye = np.mean(points["right_eye"], axis=0)
+    nose = np.asarray(points["nose_tip"][0], dtype=np.float64)
+    span = np.linalg.norm(right_eye - left_eye)
+    if span == 0:
+        return None
+    eyes = (left_eye + right_eye) / 2
+    return float((nose[0] - eyes[0]) / span), float((nose[1] - eyes[1]) / span)
+
+
+def select_samples(candidates, k, pose_weight=POSE_WEIGHT):
+    """贪心挑选 k 个样本：第一张取最清晰的，之后每次取 清晰度 + 与已选样本的最小朝向差 最大的一张"""
+    if len(candidates) <= k:
+        return list(candidates)
+    sharp = np.array([c.sharpness for c in candidates])
+    sharp /= sharp.max()
+    poses = np.array([c.pose for c in candidates])
+    chosen = [int(np.argmax(sharp))]
+    min_distance = np.linalg.norm(poses - poses[chosen[0]], axis=1)
+    for _ in range(k - 1):
+        score = sharp + pose_weight * min_distance
+        score[chosen] = -np.inf
+        best = int(np.argmax(score))
+        chosen.append(best)
+        min_distance = np.minimum(min_distance, np.linalg.norm(poses - poses[best], axis=1))
+    return [candidates[i] for i in chosen]
+
+
+class CaptureWorker:
+    """后台线程：对 submit() 送来的最新一帧做检测和打分，合格的样本放进 candidates"""
+
+    def __init__(self, model="hog", max_candidates=MAX_CANDIDATES, min_sharpness=MIN_SHARPNESS):
+        # 顾客离摄像头很近，人脸很大，可以在缩小的图像上检测
+        self.detector = MultiScaleFaceDetector(model=model)
+        self.max_candidates = max_candidates
+        self.min_sharpness = min_sharpness
+        self.candidates = []
+        self.last_boxes = []        # 最近一次检测到的人脸框，给界面画框
+        self.processed = 0
+        self.blurry = 0
+        self._cond = threading.Condition()
+        self._frame = None
+        self._running = False
+        self._thread = None
+
+    @property
+    def done(self):
+        return len(self.candidates) >= self.max_candidates
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="enroll-capture", daemon=True)
+        self._thread.start()
+        return self
+
+    def submit(self, frame):
+        """交给工作线程处理；上一帧还没开始处理就直接被替换"""
+        with self._cond:
+            self._frame = frame
+            self._cond.notify()
+
+    def _run(self):
+        while self._running and not self.done:
+            with self._cond:
+                self._cond.wait_for(lambda: self._frame is not None or not self._running)
+                frame, self._frame = self._frame, None
+            if frame is not None:
+                self._process(frame)
+
+    def _process(self, frame):
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        boxes = self.detector.detect(rgb)
+        self.last_boxes = boxes
+        self.processed += 1
+        if len(boxes) != 1:     # 只采集画面里只有一张脸的帧
+            return
+        top, right, bottom, left = boxes[0]
+        face = cv2.cvtColor(frame[top:bottom, left:right], cv2.COLOR_BGR2GRAY)
+        if face.size == 0:
+            return
+        score = sharpness(face)
+        if score < self.min_sharpness:
+            self.blurry += 1
+            return
+        pose = head_pose(rgb, boxes[0])
+        if pose is not None:
+            self.candidates.append(Candidate(frame, boxes[0], score, pose))
+
+    def stop(self):
+        self._running = False
+        with self._cond:
+            self._cond.notify()
+        if self._thread is not None:
+            # 不设超时：正在处理的那一帧做完才返回，之后再读 candidates 不会和 _process 同时进行
+            self._thread.join()
@@ -0,0 +1,162 @@
+# -----------------------------------------------------------------------------
+# enroll_encoder.py
+# 作用：批量注册编码引擎。用进程池并行计算人脸嵌入，并复用采集时已经检测到的人脸框，
+#       避免对每张样本重复做人脸检测；也可以不开摄像头，直接从 dataset/<name> 文件夹注册。
+# 用法：python enroll_encoder.py dataset/Alice dataset/Bob --roster roster.csv
+#       python enroll_encoder.py --all dataset --roster roster.csv
+#       roster.csv 每行一个人：name,preference
+# -----------------------------------------------------------------------------
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from face_gallery import kmeans
+from face_store import FaceStore, STORE_DIR
+
+BOXES_FILE = "boxes.json"   # 采集时保存的人脸框：{文件名: [top, right, bottom, left]}
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+CROP_MARGIN = 0.5           # 裁剪时在人脸框四周保留的比例，给特征点定位留出空间
+SERIAL_THRESHOLD = 8        # 样本少于这个数时直接在当前进程编码，省掉进程池启动开销
+NUM_PROTOTYPES = 3          # 每个人最多保存几个原型（不同角度/表情聚成的簇）
+SAMPLES_PER_PROTOTYPE = 5   # 每多这么多个样本才多聚一个簇，样本少时只保存一个平均原型
+MIN_CLUSTER_SIZE = 3        # 成员少于这个数的簇多半是模糊或误检的样本，不作为原型
+
+
+def crop_around_box(image, box, margin=CROP_MARGIN):
+    """把图像裁剪到人脸框附近，返回 (裁剪图, 平移后的人脸框)，减少发往子进程的数据量"""
+    top, right, bottom, left = box
+    pad_y = int((bottom - top) * margin)
+    pad_x = int((right - left) * margin)
+    y0, x0 = max(0, top - pad_y), max(0, left - pad_x)
+    y1, x1 = min(image.shape[0], bottom + pad_y), min(image.shape[1], right + pad_x)
+    crop = np.ascontiguousarray(image[y0:y1, x0:x1])
+    return crop, (top - y0, right - x0, bottom - y0, left - x0)
+
+
+def _encode_sample(sample):
+    """在子进程中编码一个样本；sample 是 (RGB 图像或图片路径, 人脸框或 None)"""
+    import face_recognition     # 只在真正编码的进程里加载 dlib 模型
+    image, box = sample
+    if isinstance(image, str):
+        image = face_recognition.load_image_file(image)
+    if box is None:
+        # 没有采集时的人脸框，只能重新检测一次
+        boxes = face_recognition.face_locations(image, model='hog')
+        if len(boxes) != 1:
+            return None
+        box = boxes[0]
+    encodings = face_recognition.face_encodings(image, [tuple(box)])
+    return encodings[0] if encodings else None
+
+
+def encode_samples(samples, workers=None):
+    """并行编码一组样本，返回与 samples 一一对应的嵌入（失败的位置为 None）"""
+    samples = list(samples)
+    if len(samples) < SERIAL_THRESHOLD or workers == 1:
+        return [_encode_sample(sample) for sample in samples]
+    workers = workers or os.cpu_count()
+    chunksize = max(1, len(samples) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_encode_sample, samples, chunksize=chunksize))
+
+
+def save_boxes(folder, boxes):
+    """保存采集时检测到的人脸框，供以后从文件夹重新注册时复用"""
+    with open(os.path.join(folder, BOXES_FILE), "w", encoding="utf-8") as f:
+        json.dump({name: list(box) for name, box in boxes.items()}, f)
+
+
+def folder_samples(folder):
+    """列出一个 dataset/<name> 文件夹中的所有样本，有保存的人脸框就一起带上"""
+    boxes = {}
+    boxes_path = os.path.join(folder, BOXES_FILE)
+    if os.path.exists(boxes_path):
+        with open(boxes_path, "r", encoding="utf-8") as f:
+            boxes = json.load(f)
+    samples = []
+    for file_name in sorted(os.listdir(folder)):
+        if file_name.lower().endswith(IMAGE_EXTENSIONS):
+            samples.append((os.path.join(folder, file_name), boxes.get(file_name)))
+    return samples
+
+
+def prototypes(encodings, max_prototypes=NUM_PROTOTYPES):
+    """
+    把一个人的所有有效嵌入聚成几个原型 (k, dim)。只存一个平均向量时，不同角度的样本会被平均成
+    一个哪个角度都不太像的向量；分簇保存后，识别时取离得最近的那个原型。
+    """
+    data = np.asarray(encodings, dtype=np.float32)
+    k = max(1, min(max_prototypes, len(data) // SAMPLES_PER_PROTOTYPE))
+    if k == 1:
+        return data.mean(axis=0, keepdims=True)
+    centroids, labels = kmeans(data, k)
+    keep = np.bincount(labels, minlength=k) >= MIN_CLUSTER_SIZE
+    return centroids[keep] if keep.any() else data.mean(axis=0, keepdims=True)
+
+
+def enroll_folders(folders, preferences, store_path=STORE_DIR, workers=None):
+    """
+    从多个 dataset/<name> 文件夹批量注册：所有人的样本放进同一个进程池一起编码，
+    最后一次性写入存储。preferences 是 {名字: 饮料}，没有给出的沿用数据库中已有的偏好。
+    返回 {名字: 有效样本数}。
+    """
+    store = FaceStore(store_path)
+    owners, samples = [], []
+    for folder in folders:
+        name = os.path.basename(os.path.normpath(folder))
+        for sample in folder_samples(folder):
+            owners.append(name)
+            samples.append(sample)
+
+    encodings_by_name = {}
+    for name, encoding in zip(owners, encode_samples(samples, workers)):
+        if encoding is not None:
+            encodings_by_name.setdefault(name, []).append(encoding)
+
+    records = []
+    for name, encodings in encodings_by_name.items():
+        preference = preferences.get(name)
+        if preference is None and name in store:
+            preference = store.preference(name)
+        if preference is None:
+            print(f"[WARN] No preference for {name}, skipping. Add it to the roster.")
+            continue
+        records.append((name, prototypes(encodings), preference, len(encodings)))
+    if records:
+        store.upsert_many(records)
+    return {name: num_samples for name, _, _, num_samples in records}
+
+
+def load_roster(path):
+    """读取 name,preference 格式的名单"""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return {row[0].strip(): row[1].strip() for row in csv.reader(f) if len(row) >= 2}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Enroll faces from dataset folders without a camera.")
+    parser.add_argument("folders", nargs="*", help="dataset/<name> folders to enroll")
+    parser.add_argument("--all", metavar="DATASET_DIR", help="enroll every sub-folder of this directory")
+    parser.add_argument("--roster", help="CSV file with name,preference rows")
+    parser.add_argument("--store", default=STORE_DIR, help="face database directory")
+    parser.add_argument("--workers", type=int, default=None, help="encoder processes (default: all cores)")
+    args = parser.parse_args()
+
+    folders = list(args.folders)
+    if args.all:
+        folders += [os.path.join(args.all, d) for d in sorted(os.listdir(args.all))
+                    if os.path.isdir(os.path.join(args.all, d))]
+    if not folders:
+        parser.error("no folders given")
+
+    start = time.time()
+    enrolled = enroll_folders(folders, load_roster(args.roster) if args.roster else {},
+                              args.store, args.workers)
+    for name, num_samples in enrolled.items():
+        print(f"[SUCCESS] {name} enrolled from {num_samples} samples.")
+    print(f"[INFO] Enrolled {len(enrolled)} people in {time.time() - start:.1f}s.")
@@ -0,0 +1,113 @@
+# -----------------------------------------------------------------------------
+# face_detector.py
+# 作用：多分辨率人脸检测前端。在缩小的图像上跑检测器，再把人脸框映射回原图坐标用于编码；
+#       缩放比例根据最近几帧看到的人脸大小自动选择（顾客离得近时脸大，可以缩得更小）。
+# -----------------------------------------------------------------------------
+import os
+from collections import deque
+
+import cv2
+
+# 检测模型可以在运行时通过环境变量选择：hog（CPU 快）或 cnn（更准，最好有 GPU）
+DEFAULT_MODEL = os.environ.get("FACE_DETECTION_MODEL", "cnn")
+SCALE_LEVELS = (0.25, 0.5, 0.75, 1.0)
+MIN_FACE_HEIGHT = 90        # 不做上采样时，检测器能稳定检出的人脸高度（像素，留了余量）
+HISTORY = 10                # 参考最近多少次检测到的人脸大小
+SEARCH_SCALE = 0.5          # 最近没看到人脸时使用的比例
+FULL_SCALE_EVERY = 4        # 没看到人脸时，每隔几次用原图（带上采样）检测一次，防止漏掉远处的小脸
+
+
+class MultiScaleFaceDetector:
+    """在缩小后的图像上检测人脸，返回原图坐标的 (top, right, bottom, left) 框"""
+
+    def __init__(self, model=DEFAULT_MODEL, scale_levels=SCALE_LEVELS, min_face_height=MIN_FACE_HEIGHT,
+                 history=HISTORY, search_scale=SEARCH_SCALE, full_scale_every=FULL_SCALE_EVERY):
+        if model not in ("hog", "cnn"):
+            raise ValueError(f"Unknown face detection model '{model}', expected 'hog' or 'cnn'")
+        self.model = model
+        self.scale_levels = sorted(scale_levels)
+        self.min_face_height = min_face_height
+        self.search_scale = search_scale
+        self.full_scale_every = full_scale_every
+        self._face_heights = deque(maxlen=history)
+        self._misses = 0
+        self.last_scale = 1.0
+
+    def choose_scale(self):
+        """根据最近的人脸大小选择缩放比例：保证最小的那张脸缩放后仍能被检测到"""
+        if not self._face_heights:
+            if self.full_scale_every and self._misses % self.full_scale_every == 0:
+                return 1.0
+            return self.search_scale
+        required = self.min_face_height / min(self._face_heights)
+        for level in self.scale_levels:
+            if level >= required:
+                return level
+        return 1.0
+
+    def _prepare(self, rgb_frame):
+        """选择比例并缩小图像，返回 (比例, 检测用的图像, 上采样次数)"""
+        scale = self.choose_scale()
+        self.last_scale = scale
+        if scale < 1.0:
+            small = cv2.resize(rgb_frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            # 缩小后不再上采样，否则又回到了原图的计算量
+            return scale, small, 0
+        return scale, rgb_frame, 1
+
+    def _finish(self, rgb_frame, scale, boxes):
+        """把检测框映射回原图，并记录人脸大小用于下一次选择比例"""
+        if scale < 1.0:
+            boxes = [_rescale(box, scale, rgb_frame.shape) for box in boxes]
+        if boxes:
+            self._misses = 0
+            for top, _, bottom, _ in boxes:
+                self._face_heights.append(bottom - top)
+        else:
+            self._misses += 1
+            if self._misses >= self._face_heights.maxlen:
+                # 很久没看到人脸了，忘掉旧的人脸大小，回到搜索模式
+                self._face_heights.clear()
+        return boxes
+
+    def detect(self, rgb_frame):
+        import face_recognition     # 导入时会加载 dlib 模型，推迟到第一次检测
+        scale, image, upsample = self._prepare(rgb_frame)
+        boxes = face_recognition.face_locations(image, number_of_times_to_upsample=upsample, model=self.model)
+        return self._finish(rgb_frame, scale, boxes)
+
+    __call__ = detect
+
+
+def detect_batch(detectors, rgb_frames):
+    """
+    多路视频流一起检测，每路用自己的检测器（各自记录人脸大小）。
+    cnn 模型时把缩放后尺寸相同的图合成一批，一次送进 dlib；hog 没有批量接口，逐张检测。
+    """
+    import face_recognition
+    prepared = [detector._prepare(frame) for detector, frame in zip(detectors, rgb_frames)]
+    found = [None] * len(prepared)
+    if detectors and all(detector.model == "cnn" for detector in detectors):
+        groups = {}
+        for i, (_, image, upsample) in enumerate(prepared):
+            groups.setdefault((image.shape, upsample), []).append(i)
+        for (_, upsample), indices in groups.items():
+            images = [prepared[i][1] for i in indices]
+            batch = face_recognition.batch_face_locations(images, number_of_times_to_upsample=upsample,
+                                                          batch_size=len(images))
+            for i, boxes in zip(indices, batch):
+                found[i] = boxes
+    else:
+        for i, (detector, (_, image, upsample)) in enumerate(zip(detectors, prepared)):
+            found[i] = face_recognition.face_locations(image, number_of_times_to_upsample=upsample,
+                                                       model=detector.model)
+    return [detector._finish(frame, scale, boxes)
+            for detector, frame, (scale, _, _), boxes in zip(detectors, rgb_frames, prepared, found)]
+
+
+def _rescale(box, scale, shape):
+    """把缩小图上的框映射回原图坐标，并裁剪到图像范围内"""
+    height, width = shape[:2]
+    top, right, bottom, left = box
+    return (max(0, int(top / scale)), min(width, int(right / scale)),
+            min(height, int(bottom / scale)), max(0, int(left / scale)))
@@ -0,0 +1,236 @@
+# -----------------------------------------------------------------------------
+# face_gallery.py
+# 作用：把所有已注册用户的人脸嵌入放进一个连续的 float32 矩阵，
+#       对一帧中的所有人脸做一次批量距离计算，返回 top-k 匹配。
+#       一个身份可以有多个原型（不同角度聚类出来的多行），身份的距离取它最近的那一行。
+# -----------------------------------------------------------------------------
+import numpy as np
+
+EMBEDDING_DIM = 128          # face_recognition 的嵌入向量维度
+INITIAL_CAPACITY = 64        # 矩阵初始行数，不够时按两倍扩容
+APPROX_MIN_SIZE = 4096       # 图库小于这个规模时，近似模式也直接走精确搜索
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLES_PER_LIST = 64
+
+
+class FaceGallery:
+    """人脸特征索引：支持增量添加/删除，以及批量 top-k 查询"""
+
+    def __init__(self, dim=EMBEDDING_DIM, approximate=False, nlist=None, nprobe=8):
+        self.dim = dim
+        self.approximate = approximate  # 近似模式：倒排表(IVF)，只在最近的几个簇里搜索
+        self.nlist = nlist              # 簇的数量，None 表示按 sqrt(N) 自动选择
+        self.nprobe = nprobe            # 每次查询搜索的簇数
+        self._matrix = np.empty((INITIAL_CAPACITY, dim), dtype=np.float32)
+        self._sq_norms = np.empty(INITIAL_CAPACITY, dtype=np.float32)
+        self._names = []                # 行号 -> 名字
+        self._rows = {}                 # 名字 -> [行号]
+        self._size = 0
+        self._max_prototypes = 1        # 单个身份最多有几行，top-k 查询时据此多取候选行
+        # 近似模式的状态
+        self._centroids = None
+        self._assign = np.empty(INITIAL_CAPACITY, dtype=np.int32)
+        self._trained_size = 0
+
+    @classmethod
+    def from_database(cls, database, **kwargs):
+        """从 {名字: {"embedding": ..., ...}} 格式的数据库构建索引"""
+        gallery = cls(**kwargs)
+        for name, data in database.items():
+            gallery.add(name, data["embedding"])
+        return gallery
+
+    def __len__(self):
+        """身份数（不是行数）"""
+        return len(self._rows)
+
+    def __contains__(self, name):
+        return name in self._rows
+
+    @property
+    def names(self):
+        return list(self._rows)
+
+    @property
+    def embeddings(self):
+        """当前所有嵌入（只读视图，不复制）"""
+        view = self._matrix[:self._size]
+        view.flags.writeable = False
+        return view
+
+    # --- 增量更新 ---
+    def add(self, name, embeddings):
+        """添加一个身份，embeddings 是一个嵌入或 (k, dim) 的多个原型；名字已存在时替换它的所有原型"""
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        rows = self._rows.get(name)
+        if rows is not None and len(rows) != len(vectors):
+            self.remove(name)
+            rows = None
+        if rows is None:
+            self._reserve(self._size + len(vectors))
+            rows = list(range(self._size, self._size + len(vectors)))
+            self._size += len(vectors)
+            self._names.extend([name] * len(vectors))
+            self._rows[name] = rows
+            self._max_prototypes = max(self._max_prototypes, len(rows))
+        self._matrix[rows] = vectors
+        self._sq_norms[rows] = np.einsum("ij,ij->i", vectors, vectors)
+        if self._centroids is not None:
+            self._assign[rows] = self._nearest_centroid(vectors)
+
+    def remove(self, name):
+        """删除一个身份：用最后几行填补空位，不需要重建"""
+        rows = self._rows.pop(name, None)
+        if rows is None:
+            return False
+        # 从大到小删除，保证被挪过来的最后一行不会是这个身份自己的
+        for row in sorted(rows, reverse=True):
+            last = self._size - 1
+            if row != last:
+                last_name = self._names[last]
+                self._matrix[row] = self._matrix[last]
+                self._sq_norms[row] = self._sq_norms[last]
+                self._assign[row] = self._assign[last]
+                self._names[row] = last_name
+                owner = self._rows[last_name]
+                owner[owner.index(last)] = row
+            self._names.pop()
+            self._size = last
+        if len(rows) == self._max_prototypes:
+            self._max_prototypes = max(map(len, self._rows.values()), default=1)
+        return True
+
+    def _reserve(self, capacity):
+        if capacity <= len(self._matrix):
+            return
+        new_capacity = max(capacity, len(self._matrix) * 2)
+        matrix = np.empty((new_capacity, self.dim), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        sq_norms = np.empty(new_capacity, dtype=np.float32)
+        sq_norms[:self._size] = self._sq_norms[:self._size]
+        assign = np.empty(new_capacity, dtype=np.int32)
+        assign[:self._size] = self._assign[:self._size]
+        self._matrix, self._sq_norms, self._assign = matrix, sq_norms, assign
+
+    # --- 查询 ---
+    def search(self, encodings, k=1):
+        """
+        批量查询：encodings 是一帧中所有人脸的嵌入 (n, dim)。
+        返回 (names, distances)：names 是 n 个长度为 k 的列表（k 个不同的身份），distances 是 (n, k) 的欧氏距离，
+        每个身份取它最近的原型；不足 k 个候选时用 None / inf 补齐。
+        """
+        queries = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        n = len(queries)
+        k = max(1, int(k))
+        names = [[None] * k for _ in range(n)]
+        distances = np.full((n, k), np.inf, dtype=np.float32)
+        if n == 0 or self._size == 0:
+            return names, distances
+
+        if self._use_approximate():
+            for i, query in enumerate(queries):
+                rows = self._candidate_rows(query)
+                self._fill_top_k(query[None, :], rows, names[i:i + 1], distances[i:i + 1])
+        else:
+            self._fill_top_k(queries, None, names, distances)
+        return names, distances
+
+    def match(self, encodings, tolerance=0.6):
+        """每张人脸返回 (名字, 距离)；最近的距离超过 tolerance 时名字为 None"""
+        names, distances = self.search(encodings, k=1)
+        results = []
+        for (name,), (distance,) in zip(names, distances):
+            if name is not None and distance <= tolerance:
+                results.append((name, float(distance)))
+            else:
+                results.append((None, float(distance)))
+        return results
+
+    def _fill_top_k(self, queries, rows, names_out, distances_out):
+        # ||q - g||^2 = ||q||^2 + ||g||^2 - 2 q·g，一次矩阵乘法算完整个图库
+        if rows is None:
+            gallery = self._matrix[:self._size]
+            gallery_norms = self._sq_norms[:self._size]
+        else:
+            if len(rows) == 0:
+                return
+            gallery = self._matrix[rows]
+            gallery_norms = self._sq_norms[rows]
+        sq = np.einsum("ij,ij->i", queries, queries)[:, None] + gallery_norms[None, :]
+        sq -= 2.0 * (queries @ gallery.T)
+        np.maximum(sq, 0.0, out=sq)
+
+        # 最近的 k 个身份一定在最近的 k * 最多原型数 行里；按距离从近到远，每个身份只取第一次出现的行
+        k = distances_out.shape[1]
+        candidates = min(k * self._max_prototypes, sq.shape[1])
+        if candidates < sq.shape[1]:
+            top = np.argpartition(sq, candidates - 1, axis=1)[:, :candidates]
+        else:
+            top = np.broadcast_to(np.arange(sq.shape[1]), sq.shape)
+        top_sq = np.take_along_axis(sq, top, axis=1)
+        order = np.argsort(top_sq, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_distances = np.sqrt(np.take_along_axis(top_sq, order, axis=1))
+        for i, row_indices in enumerate(top):
+            j = 0
+            for index, distance in zip(row_indices, top_distances[i]):
+                name = self._names[index if rows is None else rows[index]]
+                if name in names_out[i][:j]:
+                    continue
+                names_out[i][j] = name
+                distances_out[i, j] = distance
+                j += 1
+                if j == k:
+                    break
+
+    # --- 近似模式（倒排表） ---
+    def _use_approximate(self):
+        if not self.approximate or self._size < APPROX_MIN_SIZE:
+            return False
+        # 图库规模翻倍或减半后重新训练簇中心
+        if (self._centroids is None or self._size > 2 * self._trained_size
+                or self._size < self._trained_size // 2):
+            self._train()
+        return True
+
+    def _train(self):
+        nlist = self.nlist or int(np.sqrt(self._size))
+        nlist = max(1, min(nlist, self._size))
+        data = self._matrix[:self._size]
+        rng = np.random.default_rng(0)
+        sample_size = min(self._size, nlist * KMEANS_SAMPLES_PER_LIST)
+        sample = data[rng.choice(self._size, sample_size, replace=False)]
+        centroids, _ = kmeans(sample, nlist, rng=rng)
+        self._centroids = centroids
+        self._assign[:self._size] = _nearest(data, centroids)
+        self._trained_size = self._size
+
+    def _nearest_centroid(self, vectors):
+        return _nearest(vectors, self._centroids)
+
+    def _candidate_rows(self, query):
+        sq = ((self._centroids - query) ** 2).sum(axis=1)
+        nprobe = min(self.nprobe, len(sq))
+        probes = np.argpartition(sq, nprobe - 1)[:nprobe]
+        return np.flatnonzero(np.isin(self._assign[:self._size], probes))
+
+
+def kmeans(data, k, iterations=KMEANS_ITERATIONS, rng=None):
+    """简单的 k-means，返回 (簇中心 (k, dim), 每个向量所属的簇)；空簇保留原来的中心"""
+    rng = rng or np.random.default_rng(0)
+    data = np.asarray(data, dtype=np.float32)
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    labels = _nearest(data, centroids)
+    for _ in range(iterations):
+        for c in range(k):
+            members = data[labels == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+        labels = _nearest(data, centroids)
+    return centroids, labels
+
+
+def _nearest(vectors, centroids):
+    """返回每个向量最近的簇中心下标"""
+    sq = (centroids ** 2).sum(axis=1)[None, :] - 2.0 * (vectors @ centroids.T)
+    return np.argmin(sq, axis=1).astype(np.int32)
@@ -0,0 +1,204 @@
+# -----------------------------------------------------------------------------
+# face_store.py
+# 作用：人脸数据库的存储格式，替代整体 pickle 的 face_database.pkl。
+#       face_db/embeddings.f32  只追加的 float32 嵌入矩阵，用 np.memmap 映射读取
+#                               （compact() 之后换成 embeddings.<版本>.f32，文件名记在 meta.json 里）
+#       face_db/meta.json       小型元数据表：嵌入文件名、名字、饮料偏好、注册时间、样本数、所在行
+# 注册时只追加新行并原子替换 meta.json；正在运行的客户端调用 refresh() 即可看到新注册的用户。
+# 用法（一次性迁移旧数据库）：python face_store.py migrate face_database.pkl
+# -----------------------------------------------------------------------------
+import json
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+
+STORE_DIR = "face_db"
+EMBEDDINGS_FILE = "embeddings.f32"
+META_FILE = "meta.json"
+EMBEDDING_DIM = 128
+
+
+class FaceStore:
+    """内存映射的人脸嵌入存储 + 元数据表"""
+
+    def __init__(self, path=STORE_DIR, dim=EMBEDDING_DIM):
+        self.path = path
+        self.dim = dim
+        self.row_bytes = dim * np.dtype(np.float32).itemsize
+        self.embeddings_path = os.path.join(path, EMBEDDINGS_FILE)
+        self.meta_path = os.path.join(path, META_FILE)
+        self.version = -1
+        self.people = {}             # 名字 -> {"rows", "preference", "enrolled_at", "num_samples"}
+        self._matrix = np.empty((0, dim), dtype=np.float32)
+        self._meta_stamp = None
+        self._synced_rows = {}       # sync_gallery() 上次同步时每个人的行号
+        self.refresh()
+
+    @classmethod
+    def exists(cls, path=STORE_DIR):
+        return os.path.exists(os.path.join(path, META_FILE))
+
+    def __len__(self):
+        return len(self.people)
+
+    def __contains__(self, name):
+        return name in self.people
+
+    # --- 读取 ---
+    def refresh(self):
+        """如果 meta.json 被其他进程更新过，重新加载元数据并重新映射嵌入文件；返回是否有变化"""
+        try:
+            stat = os.stat(self.meta_path)
+        except FileNotFoundError:
+            return False
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp == self._meta_stamp:
+            return False
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self._meta_stamp = stamp
+        if meta["version"] == self.version:
+            return False
+        if meta["dim"] != self.dim:
+            raise ValueError(f"Store dim {meta['dim']} does not match expected {self.dim}")
+        rows = meta["rows"]
+        # 旧版本的 meta.json 没有记录文件名，用的是默认的 embeddings.f32
+        self.embeddings_path = os.path.join(self.path, meta.get("embeddings", EMBEDDINGS_FILE))
+        if rows:
+            # 只映射 meta 中声明的行数，之后追加的行不会被读到
+            self._matrix = np.memmap(self.embeddings_path, dtype=np.float32, mode="r",
+                                     shape=(rows, self.dim))
+        else:
+            self._matrix = np.empty((0, self.dim), dtype=np.float32)
+        self.people = meta["people"]
+        self.version = meta["version"]
+        return True
+
+    def embeddings(self, name):
+        """返回某个人的所有嵌入行 (k, dim)"""
+        return self._matrix[self.people[name]["rows"]]
+
+    def preference(self, name):
+        return self.people[name]["preference"]
+
+    def sync_gallery(self, gallery):
+        """把存储中的增删改同步到一个 FaceGallery，只处理变化的记录；一个人的所有原型行都放进图库"""
+        for name in list(self._synced_rows):
+            if name not in self.people:
+                gallery.remove(name)
+                del self._synced_rows[name]
+        for name, record in self.people.items():
+            if self._synced_rows.get(name) != record["rows"]:
+                gallery.add(name, self._matrix[record["rows"]])
+                self._synced_rows[name] = record["rows"]
+        return gallery
+
+    # --- 写入（单个写入进程，例如 01_enroll_faces.py） ---
+    def upsert(self, name, embeddings, preference, num_samples=None):
+        """添加或更新一个人：先把嵌入追加到文件末尾，再原子替换 meta.json"""
+        self.upsert_many([(name, embeddings, preference, num_samples)])
+
+    def upsert_many(self, records):
+        """一次写入多条 (名字, 嵌入, 偏好, 样本数)，只替换一次 meta.json"""
+        os.makedirs(self.path, exist_ok=True)
+        self.refresh()
+        people = dict(self.people)
+        with open(self.embeddings_path, "ab") as f:
+            size = f.tell()
+            if size % self.row_bytes:
+                # 上次写入中断留下的半行，用 0 补齐
+                padding = self.row_bytes - size % self.row_bytes
+                f.write(b"\0" * padding)
+                size += padding
+            next_row = size // self.row_bytes
+            now = time.time()
+            for name, embeddings, preference, num_samples in records:
+                vectors = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+                f.write(vectors.tobytes())
+                people[name] = {
+                    "rows": list(range(next_row, next_row + len(vectors))),
+                    "preference": preference,
+                    "enrolled_at": now,
+                    "num_samples": num_samples,
+                }
+                next_row += len(vectors)
+            f.flush()
+            os.fsync(f.fileno())
+        self._write_meta(people, next_row)
+
+    def remove(self, name):
+        self.refresh()
+        if name not in self.people:
+            return False
+        people = dict(self.people)
+        del people[name]
+        self._write_meta(people, len(self._matrix))
+        return True
+
+    def compact(self):
+        """
+        重写嵌入文件，去掉被更新或删除后不再引用的行（客户端都停止后运行）。
+        压缩后的矩阵写进一个新文件，替换 meta.json 时才同时切换到新文件和新行号；
+        中途崩溃时旧的 meta.json 仍然指向旧文件，不会出现行号和矩阵对不上的情况。
+        """
+        self.refresh()
+        people = {}
+        chunks = []
+        next_row = 0
+        for name, record in self.people.items():
+            chunks.append(np.asarray(self._matrix[record["rows"]]))
+            people[name] = dict(record, rows=list(range(next_row, next_row + len(record["rows"]))))
+            next_row += len(record["rows"])
+        matrix = np.concatenate(chunks) if chunks else np.empty((0, self.dim), dtype=np.float32)
+        self._matrix = np.empty((0, self.dim), dtype=np.float32)  # 释放旧映射
+        old_path = self.embeddings_path
+        new_file = f"embeddings.{self.version + 1}.f32"
+        with open(os.path.join(self.path, new_file), "wb") as f:
+            f.write(matrix.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self._write_meta(people, next_row, new_file)
+        if os.path.abspath(old_path) != os.path.abspath(self.embeddings_path):
+            try:
+                os.remove(old_path)
+            except OSError:     # 还有进程映射着旧文件（Windows 上删不掉），留着不影响正确性
+                pass
+
+    def _write_meta(self, people, rows, embeddings_file=None):
+        meta = {
+            "version": self.version + 1,
+            "dim": self.dim,
+            "embeddings": embeddings_file or os.path.basename(self.embeddings_path),
+            "rows": rows,
+            "people": people,
+        }
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.meta_path)
+        self._meta_stamp = None
+        self.refresh()
+
+
+def migrate_pickle(pickle_path, store_path=STORE_DIR):
+    """把旧的 face_database.pkl 一次性迁移到新的存储格式"""
+    with open(pickle_path, "rb") as f:
+        database = pickle.load(f)
+    store = FaceStore(store_path)
+    store.upsert_many([(name, data["embedding"], data.get("preference"), None)
+                       for name, data in database.items()])
+    return store
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "migrate":
+        print("Usage: python face_store.py migrate <face_database.pkl> [store_dir]")
+        sys.exit(1)
+    target = sys.argv[3] if len(sys.argv) > 3 else STORE_DIR
+    migrated = migrate_pickle(sys.argv[2], target)
+    print(f"[INFO] Migrated {len(migrated)} identities from {sys.argv[2]} to {target}/")
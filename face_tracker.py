@@ -0,0 +1,192 @@
+# -----------------------------------------------------------------------------
+# face_tracker.py
+# 作用：人脸跟踪层。只在关键帧（或跟踪丢失时）做完整的人脸检测和编码，
+#       中间帧用 LK 光流平移/缩放人脸框；每条轨迹记住识别出的身份和嵌入，
+#       同一个人出现一次只需要编码一次，而不是每帧编码。
+# -----------------------------------------------------------------------------
+import itertools
+
+import cv2
+import numpy as np
+
+KEYFRAME_INTERVAL = 5       # 每隔多少帧做一次完整检测
+REVERIFY_INTERVAL = 3       # 已识别的轨迹每隔多少个关键帧重新编码确认身份（0 表示不再确认）
+REVERIFY_UNKNOWN = True     # 未识别的轨迹是否在每个关键帧都重新编码（人可能转过脸来了）
+IOU_MATCH_THRESHOLD = 0.3   # 关键帧上检测框与轨迹关联的最小 IoU
+MAX_MISSES = 2              # 连续多少个关键帧没有关联上检测框就删除轨迹
+MIN_FLOW_POINTS = 4         # 光流跟踪剩余特征点少于这个数就认为跟丢了
+
+_FEATURE_PARAMS = dict(maxCorners=30, qualityLevel=0.01, minDistance=5, blockSize=5)
+_FLOW_PARAMS = dict(winSize=(15, 15), maxLevel=2,
+                    criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+
+
+class Track:
+    """一条人脸轨迹：框的位置 + 识别出的身份"""
+
+    def __init__(self, track_id, box):
+        self.track_id = track_id
+        self.box = np.asarray(box, dtype=np.float32)  # (top, right, bottom, left)
+        self.name = None
+        self.distance = float("inf")
+        self.embedding = None
+        self.keyframes_since_encode = 0
+        self.misses = 0
+        self.points = None  # 光流特征点
+
+    @property
+    def location(self):
+        """face_recognition 格式的整数框"""
+        return tuple(int(round(v)) for v in self.box)
+
+    def needs_encoding(self, reverify_interval, reverify_unknown):
+        if self.embedding is None:
+            return True
+        if self.name is None:
+            return reverify_unknown
+        return reverify_interval > 0 and self.keyframes_since_encode >= reverify_interval
+
+
+class FaceTracker:
+    """
+    detect_fn(rgb) -> 人脸框列表；encode_fn(rgb, boxes) -> 嵌入列表；
+    match_fn(encodings) -> [(名字或 None, 距离)]
+    """
+
+    def __init__(self, detect_fn, encode_fn, match_fn, keyframe_interval=KEYFRAME_INTERVAL,
+                 reverify_interval=REVERIFY_INTERVAL, reverify_unknown=REVERIFY_UNKNOWN,
+                 iou_threshold=IOU_MATCH_THRESHOLD, max_misses=MAX_MISSES):
+        self.detect_fn = detect_fn
+        self.encode_fn = encode_fn
+        self.match_fn = match_fn
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.reverify_interval = reverify_interval
+        self.reverify_unknown = reverify_unknown
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.tracks = []
+        self._ids = itertools.count()
+        self._prev_gray = None
+        self._frames_since_keyframe = 0
+        self.keyframes = 0
+        self.encodings = 0
+
+    def reset(self):
+        self.tracks = []
+        self._prev_gray = None
+        self._frames_since_keyframe = 0
+
+    def update(self, rgb_frame):
+        """处理一帧，返回当前看得见的轨迹（最近一个关键帧上关联到了检测框）"""
+        gray = cv2.cvtColor(rgb_frame, cv2.COLOR_RGB2GRAY)
+        lost = False
+        is_keyframe = (self._prev_gray is None or not self.tracks
+                       or self._frames_since_keyframe + 1 >= self.keyframe_interval)
+        if not is_keyframe:
+            lost = not self._propagate(gray)
+        if is_keyframe or lost:
+            self._keyframe(rgb_frame, gray)
+            self._frames_since_keyframe = 0
+        else:
+            self._frames_since_keyframe += 1
+        self._prev_gray = gray
+        # 没关联上的轨迹还会保留几个关键帧等人回来，但它们的框和身份已经过时，不能当作"人还在"
+        return [track for track in self.tracks if track.misses == 0]
+
+    # --- 中间帧：光流传播 ---
+    def _propagate(self, gray):
+        """用光流移动每个框；任何一条轨迹跟丢都返回 False，让调用方改做关键帧"""
+        for track in self.tracks:
+            if track.misses:    # 没关联上的轨迹没有新的特征点，等下一个关键帧再关联
+                continue
+            moved = propagate_box(self._prev_gray, gray, track.points, track.box)
+            if moved is None:
+                return False
+            track.box, track.points = moved
+        return True
+
+    # --- 关键帧：检测 + 关联 + 只编码需要的轨迹 ---
+    def _keyframe(self, rgb_frame, gray):
+        self.keyframes += 1
+        boxes = [np.asarray(box, dtype=np.float32) for box in self.detect_fn(rgb_frame)]
+        unmatched_boxes = set(range(len(boxes)))
+        unmatched_tracks = set(range(len(self.tracks)))
+        pairs = sorted(((_iou(track.box, box), t, b)
+                        for t, track in enumerate(self.tracks) for b, box in enumerate(boxes)),
+                       reverse=True)
+        for iou, t, b in pairs:
+            if iou < self.iou_threshold:
+                break
+            if t in unmatched_tracks and b in unmatched_boxes:
+                track = self.tracks[t]
+                track.box = boxes[b]
+                track.misses = 0
+                track.keyframes_since_encode += 1
+                unmatched_tracks.discard(t)
+                unmatched_boxes.discard(b)
+
+        for t in unmatched_tracks:
+            self.tracks[t].misses += 1
+        self.tracks = [track for track in self.tracks if track.misses <= self.max_misses]
+        for b in sorted(unmatched_boxes):
+            self.tracks.append(Track(next(self._ids), boxes[b]))
+
+        # 只对新轨迹、未识别轨迹和到期复核的轨迹做编码，批量完成
+        visible = [track for track in self.tracks if track.misses == 0]
+        pending = [track for track in visible
+                   if track.needs_encoding(self.reverify_interval, self.reverify_unknown)]
+        if pending:
+            encodings = self.encode_fn(rgb_frame, [track.location for track in pending])
+            self.encodings += len(encodings)
+            for track, encoding, (name, distance) in zip(pending, encodings, self.match_fn(encodings)):
+                track.embedding = encoding
+                track.name = name
+                track.distance = distance
+                track.keyframes_since_encode = 0
+
+        for track in visible:
+            track.points = features_in_box(gray, track.box)
+
+
+def _iou(a, b):
+    """两个 (top, right, bottom, left) 框的交并比"""
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    inter = max(0.0, bottom - top) * max(0.0, right - left)
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    union = area_a + area_b - inter
+    return inter / union if union > 0 else 0.0
+
+
+def propagate_box(prev_gray, gray, points, box):
+    """
+    用 LK 光流把 (top, right, bottom, left) 框从上一帧移到这一帧，同时估计缩放；
+    返回 (新框, 新特征点)，特征点不够（跟丢）时返回 None
+    """
+    if points is None or len(points) < MIN_FLOW_POINTS:
+        return None
+    new_points, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, points, None, **_FLOW_PARAMS)
+    good = status.reshape(-1) == 1
+    if good.sum() < MIN_FLOW_POINTS:
+        return None
+    old_pts = points.reshape(-1, 2)[good]
+    new_pts = new_points.reshape(-1, 2)[good]
+    dx, dy = np.median(new_pts - old_pts, axis=0)
+    # 用特征点到中心距离的中位数之比估计缩放（目标走近或走远）
+    old_spread = np.median(np.linalg.norm(old_pts - old_pts.mean(axis=0), axis=1))
+    new_spread = np.median(np.linalg.norm(new_pts - new_pts.mean(axis=0), axis=1))
+    scale = new_spread / old_spread if old_spread > 1e-3 else 1.0
+    top, right, bottom, left = box
+    cx, cy = (left + right) / 2 + dx, (top + bottom) / 2 + dy
+    half_w, half_h = (right - left) / 2 * scale, (bottom - top) / 2 * scale
+    new_box = np.array([cy - half_h, cx + half_w, cy + half_h, cx - half_w], dtype=np.float32)
+    return new_box, new_pts.reshape(-1, 1, 2)
+
+
+def features_in_box(gray, box):
+    """在 (top, right, bottom, left) 框内找适合光流跟踪的角点"""
+    top, right, bottom, left = [int(round(v)) for v in box]
+    mask = np.zeros_like(gray)
+    mask[max(0, top):max(0, bottom), max(0, left):max(0, right)] = 255
+    return cv2.goodFeaturesToTrack(gray, mask=mask, **_FEATURE_PARAMS)
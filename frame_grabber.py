@@ -0,0 +1,107 @@
+# -----------------------------------------------------------------------------
+# frame_grabber.py
+# 作用：后台线程持续读取视频流，只保留最新解码的一帧（带采集时间戳），
+#       推理期间积压的旧帧直接丢弃，主循环拿到的永远是最新画面。
+# -----------------------------------------------------------------------------
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+
+# seq：帧序号；timestamp：读到这一帧的时间；age：交给调用方时已经过去的秒数；
+# dropped：到目前为止没被取走就被覆盖的帧数；motion：树莓派给出的运动分数（拿不到时为 None）
+FrameInfo = namedtuple("FrameInfo", ["seq", "timestamp", "age", "dropped", "motion"], defaults=(None,))
+
+
+class LatestFrameGrabber:
+    """最新帧抓取器：source 可以是视频流 URL、摄像头编号，或任何带 read()/release() 的对象"""
+
+    def __init__(self, source):
+        if isinstance(source, (str, int)):
+            self.cap = cv2.VideoCapture(source)
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # 部分后端支持，尽量减少内部缓冲
+        else:
+            self.cap = source
+        self._cond = threading.Condition()
+        self._frame = None
+        self._timestamp = 0.0
+        self._seq = 0           # 最新一帧的序号
+        self._read_seq = 0      # 调用方最后取走的序号
+        self._ended = False
+        self._running = False
+        self._thread = None
+        self._release_on_exit = False   # release() 等不到接收线程退出时，由接收线程退出时释放
+        self.grabbed = 0
+        self.dropped = 0
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    @property
+    def ended(self):
+        """视频流已经结束（区别于 read() 超时）"""
+        return self._ended
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="frame-grabber", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            while self._running:
+                ret, frame = self.cap.read()
+                timestamp = time.time()
+                with self._cond:
+                    if not ret:
+                        self._ended = True
+                        self._cond.notify_all()
+                        return
+                    if self._seq > self._read_seq:
+                        # 上一帧还没被取走就被新帧覆盖
+                        self.dropped += 1
+                    self._frame = frame
+                    self._timestamp = timestamp
+                    self._seq += 1
+                    self.grabbed += 1
+                    self._cond.notify_all()
+        finally:
+            with self._cond:
+                release = self._release_on_exit
+                self._thread = None
+            if release:
+                self.cap.release()
+
+    def read(self, timeout=None):
+        """
+        等待一帧比上次取走的更新的画面。返回 (ret, frame, info)；
+        视频流结束或超时时 ret 为 False。
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > self._read_seq or self._ended, timeout):
+                return False, None, None
+            if self._seq <= self._read_seq:
+                return False, None, None
+            self._read_seq = self._seq
+            info = FrameInfo(self._seq, self._timestamp, time.time() - self._timestamp, self.dropped)
+            return True, self._frame, info
+
+    def stats(self):
+        with self._cond:
+            return {"grabbed": self.grabbed, "dropped": self.dropped,
+                    "age": time.time() - self._timestamp if self._seq else None}
+
+    def release(self):
+        self._running = False
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout=1.0)
+        with self._cond:
+            if self._thread is not None:
+                # 接收线程还卡在 cap.read() 里（网络流经常这样），这时释放 VideoCapture 在 OpenCV 里是未定义行为，
+                # 可能直接崩溃；交给接收线程在 read() 返回后自己释放
+                self._release_on_exit = True
+                return
+        self.cap.release()
@@ -0,0 +1,206 @@
+# -----------------------------------------------------------------------------
+# metrics.py
+# 作用：轻量的耗时/计数统计，PC 和树莓派共用。每个阶段保留最近 HISTORY 个样本的滚动直方图，
+#       snapshot() 汇总成毫秒分位数，serve() 在后台线程提供 /metrics（JSON）。
+#       可选逐帧追踪：begin_frame()/end_frame() 之间记录的各阶段耗时写成一行 JSON。
+#       记录一个样本只是一次 perf_counter、一次加锁和一次 deque.append，可以在生产环境常开。
+# 用法：with metrics.timer("face.encode"): ...
+#       metrics.count("command.sent")
+#       with metrics.phase("models"): ...   # 启动阶段计时，report_startup() 打印
+#       METRICS_TRACE=trace.jsonl python pc_recognition_client.py  # 打开逐帧追踪
+# -----------------------------------------------------------------------------
+import json
+import os
+import threading
+import time
+from collections import deque
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HISTORY = 1024                  # 每个阶段保留的样本数
+TRACE_ENV = "METRICS_TRACE"     # 设置了这个环境变量就把逐帧追踪写到对应文件
+
+_lock = threading.Lock()
+_samples = {}   # 名字 -> deque(秒)
+_totals = {}    # 名字 -> 累计样本数
+_counters = {}  # 名字 -> 累计计数
+_startup = {}   # 启动阶段 -> 秒，按发生顺序
+_started = time.time()
+_local = threading.local()
+_trace_file = None
+_trace_lock = threading.Lock()
+
+
+def observe(name, seconds):
+    """记录一个耗时样本（秒）"""
+    with _lock:
+        samples = _samples.get(name)
+        if samples is None:
+            samples = _samples[name] = deque(maxlen=HISTORY)
+        samples.append(seconds)
+        _totals[name] = _totals.get(name, 0) + 1
+    frame = getattr(_local, "frame", None)
+    if frame is not None:
+        stages = frame["stages"]
+        stages[name] = stages.get(name, 0.0) + seconds * 1000
+
+
+def count(name, n=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+class timer:
+    """with metrics.timer("stage"): ... 记录代码块的耗时"""
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class phase(timer):
+    """with metrics.phase("models"): ... 记录一个启动阶段的耗时（只记一次，不进滚动直方图）"""
+    __slots__ = ()
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        with _lock:
+            _startup[self.name] = _startup.get(self.name, 0.0) + elapsed
+        return False
+
+
+def startup():
+    """{启动阶段: 毫秒}，按发生顺序"""
+    with _lock:
+        return {name: seconds * 1000 for name, seconds in _startup.items()}
+
+
+def report_startup(prefix="[INFO]"):
+    phases = startup()
+    for name, ms in phases.items():
+        print(f"{prefix} Startup {name}: {ms:.0f}ms")
+    print(f"{prefix} Startup total: {sum(phases.values()):.0f}ms")
+
+
+def timed(name, fn):
+    """包装一个函数，每次调用都记录耗时"""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            observe(name, time.perf_counter() - start)
+    return wrapper
+
+
+def summarize(samples):
+    """把一组秒数汇总成毫秒分位数"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "p50_ms": pct(50),
+        "p90_ms": pct(90),
+        "p99_ms": pct(99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def snapshot():
+    """当前所有阶段的分位数（最近 HISTORY 个样本）和计数器"""
+    with _lock:
+        names = list(_samples.items())
+        totals = dict(_totals)
+        counters = dict(_counters)
+    stages = {}
+    for name, samples in names:
+        summary = summarize(list(samples))
+        summary["total"] = totals.get(name, 0)
+        stages[name] = summary
+    return {"uptime_s": time.time() - _started, "startup_ms": startup(), "stages": stages, "counters": counters}
+
+
+def reset():
+    with _lock:
+        _samples.clear()
+        _totals.clear()
+        _counters.clear()
+
+
+# --- 逐帧追踪 ---
+def enable_trace(path):
+    """把之后每一帧的阶段耗时追加写到 path（每行一个 JSON）"""
+    global _trace_file
+    with _trace_lock:
+        if _trace_file is not None:
+            _trace_file.close()
+        _trace_file = open(path, "a", encoding="utf-8", buffering=1) if path else None
+
+
+def tracing():
+    return _trace_file is not None
+
+
+def begin_frame(seq=None):
+    """开始记录一帧；没有打开追踪时什么都不做"""
+    if _trace_file is not None:
+        _local.frame = {"seq": seq, "t": time.time(), "stages": {}}
+
+
+def end_frame(**fields):
+    """结束这一帧并写出一行追踪，fields 会一起写进去（例如状态、帧龄）"""
+    frame = getattr(_local, "frame", None)
+    if frame is None:
+        return
+    _local.frame = None
+    frame.update(fields)
+    line = json.dumps(frame)
+    with _trace_lock:
+        if _trace_file is not None:
+            _trace_file.write(line + "\n")
+
+
+# --- /metrics ---
+def serve(port, host="0.0.0.0", extra=None):
+    """在后台线程提供 GET /metrics；extra() 返回的字典会合并进结果（例如各组件的 stats()）"""
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            payload = snapshot()
+            if extra is not None:
+                payload.update(extra())
+            body = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+if os.environ.get(TRACE_ENV):
+    enable_trace(os.environ[TRACE_ENV])
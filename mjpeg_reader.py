@@ -0,0 +1,319 @@
+# -----------------------------------------------------------------------------
+# mjpeg_reader.py
+# 作用：直接从 socket 解析树莓派 /video_feed 的 multipart MJPEG 流（--frame 分隔），
+#       不再经过 cv2.VideoCapture：
+#       - 每个 JPEG 分段按 Content-Length 直接读进可复用的缓冲区（三个缓冲区轮换，不为每帧分配内存）；
+#       - 后台线程只收 JPEG 不解码，只有主循环真正取走的那一帧才解码，可以按需用 1/2、1/4、1/8 尺寸解码；
+#       - 每帧带上树莓派的帧序号（X-Frame-Seq）、运动分数（X-Motion-Score）和到达时间；
+#       - 断线后自动重连。
+#       MJPEGFrameGrabber 的用法和 LatestFrameGrabber 一样。
+# -----------------------------------------------------------------------------
+import io
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+import cv2
+import numpy as np
+
+import metrics
+from frame_grabber import FrameInfo
+
+CONNECT_TIMEOUT = 5.0           # 秒，连接和读取的超时
+RECONNECT_DELAY = 0.5           # 秒，第一次重连前的等待，之后每次翻倍
+MAX_RECONNECT_DELAY = 5.0
+READ_BUFFER_SIZE = 64 * 1024
+INITIAL_FRAME_BUFFER = 256 * 1024
+MAX_HEADER_LINE = 1024
+DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+class _Dechunked(io.RawIOBase):
+    """Transfer-Encoding: chunked 的解码（树莓派上的 Flask 开发服务器会这样发送视频流）"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.remaining = 0
+        self.done = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self.done:
+            return 0
+        if self.remaining == 0:
+            size_line = self.raw.readline(MAX_HEADER_LINE)
+            if not size_line:
+                return 0
+            self.remaining = int(size_line.split(b";")[0].strip() or b"0", 16)
+            if self.remaining == 0:
+                self.done = True
+                return 0
+        n = self.raw.readinto(memoryview(b)[:min(len(b), self.remaining)])
+        if not n:
+            return 0
+        self.remaining -= n
+        if self.remaining == 0:
+            self.raw.readline(MAX_HEADER_LINE)  # 每个块后面的 \r\n
+        return n
+
+
+class MJPEGReader:
+    """一条到视频流的 HTTP 连接，逐个读取 JPEG 分段（不带线程）"""
+
+    def __init__(self, url, timeout=CONNECT_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+        self._sock = None
+        self._body = None
+        self._delimiter = b"frame"
+        self._at_headers = False    # 没有 Content-Length 时，上一段已经读到了下一个分隔行
+
+    def connect(self):
+        self.close()
+        url = urlsplit(self.url)
+        host, port = url.hostname, url.port or 80
+        path = (url.path or "/") + ("?" + url.query if url.query else "")
+        sock = socket.create_connection((host, port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.sendall(f"GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\n"
+                     f"Accept: multipart/x-mixed-replace\r\nConnection: close\r\n\r\n".encode())
+        raw = sock.makefile("rb", buffering=READ_BUFFER_SIZE)
+        status = raw.readline(MAX_HEADER_LINE)
+        if len(status.split()) < 2 or status.split()[1] != b"200":
+            sock.close()
+            raise ConnectionError(f"Unexpected response from {self.url}: {status.strip()!r}")
+        headers = self._read_headers(raw)
+        content_type = headers.get(b"content-type", b"")
+        if b"boundary=" in content_type:
+            self._delimiter = content_type.split(b"boundary=")[1].split(b";")[0].strip(b'" ').strip(b"-")
+        if b"chunked" in headers.get(b"transfer-encoding", b"").lower():
+            self._body = io.BufferedReader(_Dechunked(raw), READ_BUFFER_SIZE)
+        else:
+            self._body = raw
+        self._sock = sock
+        self._at_headers = False
+        return self
+
+    def close(self):
+        if self._sock is not None:
+            # makefile() 得到的文件对象还引用着这个连接，只 close() 不会真正断开，
+            # 阻塞在 recv 上的接收线程也不会醒；先 shutdown 再关闭
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._body = None
+
+    @property
+    def connected(self):
+        return self._sock is not None
+
+    @staticmethod
+    def _read_headers(stream):
+        headers = {}
+        while True:
+            line = stream.readline(MAX_HEADER_LINE)
+            if not line:
+                raise EOFError("Stream closed while reading headers")
+            if line in (b"\r\n", b"\n"):
+                return headers
+            key, _, value = line.partition(b":")
+            headers[key.strip().lower()] = value.strip()
+
+    def _is_delimiter(self, line):
+        return line.startswith(b"--") and line.strip().strip(b"-") == self._delimiter
+
+    def read_part(self, buffer):
+        """
+        读取下一个 JPEG 分段到 buffer（bytearray，不够大时原地扩容），
+        返回 (buffer, 长度, 分段头字典)；连接断开时抛出 EOFError / OSError
+        """
+        body = self._body
+        if not self._at_headers:
+            while True:
+                line = body.readline(MAX_HEADER_LINE)
+                if not line:
+                    raise EOFError("Stream closed")
+                if self._is_delimiter(line):
+                    break
+        self._at_headers = False
+        headers = self._read_headers(body)
+        length = int(headers.get(b"content-length", 0))
+        if length:
+            if len(buffer) < length:
+                buffer.extend(bytes(length - len(buffer)))
+            view = memoryview(buffer)
+            received = 0
+            while received < length:
+                n = body.readinto(view[received:length])
+                if not n:
+                    raise EOFError("Stream closed inside a frame")
+                received += n
+            return buffer, length, headers
+        # 没有 Content-Length：一直读到下一个分隔行为止（较慢的兼容路径）
+        length = 0
+        while True:
+            line = body.readline()
+            if not line:
+                raise EOFError("Stream closed inside a frame")
+            if self._is_delimiter(line):
+                self._at_headers = True
+                break
+            end = length + len(line)
+            if len(buffer) < end:
+                buffer.extend(bytes(end - len(buffer)))
+            buffer[length:end] = line
+            length = end
+        # 去掉分隔行前面属于分隔符的 \r\n
+        if buffer[length - 2:length] == b"\r\n":
+            length -= 2
+        return buffer, length, headers
+
+
+class MJPEGFrameGrabber:
+    """
+    后台线程持续接收 JPEG，只保留最新一段；read() 时才解码。
+    scale 为 1、2、4、8，表示按原图的 1/scale 解码（JPEG 解码器直接输出小图，比先解码再缩小快得多）。
+    """
+
+    def __init__(self, url, scale=1, reconnect=True, timeout=CONNECT_TIMEOUT):
+        if scale not in DECODE_FLAGS:
+            raise ValueError(f"scale must be one of {sorted(DECODE_FLAGS)}")
+        self.url = url
+        self.scale = scale
+        self.reconnect = reconnect
+        self.reader = MJPEGReader(url, timeout)
+        self._cond = threading.Condition()
+        # 三个缓冲区轮换：一个在接收、一个是最新帧、一个正在被解码
+        self._free = [bytearray(INITIAL_FRAME_BUFFER) for _ in range(3)]
+        self._latest = None         # (buffer, 长度, 帧序号, 到达时间, 运动分数)
+        self._count = 0             # 收到的分段数
+        self._last_arrival = None
+        self._ended = False
+        self._running = False
+        self._thread = None
+        self.grabbed = 0
+        self.dropped = 0
+        self.reconnects = 0
+        self.last_seq = 0
+        try:
+            self.reader.connect()
+        except (OSError, EOFError) as e:
+            print(f"[PC WARN] Could not connect to {url}: {e}")
+
+    def isOpened(self):
+        return self.reader.connected
+
+    @property
+    def ended(self):
+        return self._ended
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="mjpeg-grabber", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        delay = RECONNECT_DELAY
+        while self._running:
+            if not self.reader.connected:
+                try:
+                    self.reader.connect()
+                    delay = RECONNECT_DELAY
+                except (OSError, EOFError) as e:
+                    print(f"[PC WARN] Reconnect to video stream failed: {e}")
+                    time.sleep(delay)
+                    delay = min(delay * 2, MAX_RECONNECT_DELAY)
+                    continue
+            with self._cond:
+                buffer = self._free.pop()
+            try:
+                buffer, length, headers = self.reader.read_part(buffer)
+            except (OSError, EOFError, ValueError) as e:
+                with self._cond:
+                    self._free.append(buffer)
+                self.reader.close()
+                if not self.reconnect or not self._running:
+                    break
+                self.reconnects += 1
+                metrics.count("stream.reconnects")
+                print(f"[PC WARN] Video stream interrupted ({e}), reconnecting...")
+                continue
+            arrival = time.time()
+            seq = int(headers.get(b"x-frame-seq", 0)) or self._count + 1
+            motion = float(headers[b"x-motion-score"]) if b"x-motion-score" in headers else None
+            with self._cond:
+                if self._latest is not None:
+                    # 上一帧还没被取走就被新帧覆盖
+                    self._free.append(self._latest[0])
+                    self.dropped += 1
+                self._latest = (buffer, length, seq, arrival, motion)
+                self._count += 1
+                self._last_arrival = arrival
+                self.grabbed += 1
+                self._cond.notify_all()
+        with self._cond:
+            self._ended = True
+            self._cond.notify_all()
+
+    def read_jpeg(self, timeout=None):
+        """
+        取走最新的 JPEG 分段，返回 (ret, buffer, 长度, info)；用完后必须调用 recycle(buffer)。
+        适合自己决定怎么解码的调用方。
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._latest is not None or self._ended, timeout):
+                return False, None, 0, None
+            if self._latest is None:
+                return False, None, 0, None
+            buffer, length, seq, arrival, motion = self._latest
+            self._latest = None
+            self.last_seq = seq
+            info = FrameInfo(seq, arrival, time.time() - arrival, self.dropped, motion)
+            return True, buffer, length, info
+
+    def recycle(self, buffer):
+        with self._cond:
+            self._free.append(buffer)
+
+    def read(self, timeout=None, scale=None):
+        """等待并解码最新一帧，返回 (ret, frame, info)；视频流结束或超时时 ret 为 False"""
+        while True:
+            ret, buffer, length, info = self.read_jpeg(timeout)
+            if not ret:
+                return False, None, None
+            try:
+                with metrics.timer("frame.decode"):
+                    frame = cv2.imdecode(np.frombuffer(buffer, dtype=np.uint8, count=length),
+                                         DECODE_FLAGS[scale or self.scale])
+            finally:
+                self.recycle(buffer)
+            if frame is not None:
+                return True, frame, info
+            metrics.count("frame.decode_failed")    # 损坏的 JPEG，等下一帧
+
+    def stats(self):
+        with self._cond:
+            return {"grabbed": self.grabbed, "dropped": self.dropped, "reconnects": self.reconnects,
+                    "last_seq": self.last_seq,
+                    "age": time.time() - self._last_arrival if self._last_arrival else None}
+
+    def release(self):
+        self._running = False
+        self.reader.close()     # 让阻塞在 socket 上的接收线程立即退出
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
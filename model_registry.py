@@ -0,0 +1,74 @@
+# -----------------------------------------------------------------------------
+# model_registry.py
+# 作用：模型注册表。每个检测/编码模型只加载一次，按路径和参数返回共享的句柄；
+#       加载后立即做一次热身推理，让第一帧真实画面不用承担内存分配和图初始化的开销，
+#       并记录每个模型的加载和热身耗时。
+# -----------------------------------------------------------------------------
+import threading
+import time
+
+import numpy as np
+
+WARMUP_IMAGE_SIZE = 640
+
+_lock = threading.Lock()
+_models = {}    # key -> 模型句柄
+_timings = {}   # key -> {"load": 秒, "warmup": 秒}
+
+
+def _get(key, load_fn, warmup_fn=None):
+    with _lock:
+        if key in _models:
+            return _models[key]
+        start = time.perf_counter()
+        model = load_fn()
+        loaded = time.perf_counter()
+        if warmup_fn is not None:
+            warmup_fn(model)
+        _timings[key] = {"load": loaded - start, "warmup": time.perf_counter() - loaded}
+        _models[key] = model
+        return model
+
+
+def get_yolo(path, warmup=True, imgsz=WARMUP_IMAGE_SIZE, **options):
+    """返回共享的 YOLO 模型；options 原样传给 YOLO()，不同参数视为不同的模型"""
+    key = ("yolo", path, imgsz, tuple(sorted(options.items())))
+
+    def load():
+        from ultralytics import YOLO
+        return YOLO(path, **options)
+
+    def warm(model):
+        model(np.zeros((imgsz, imgsz, 3), dtype=np.uint8), imgsz=imgsz, verbose=False)
+
+    return _get(key, load, warm if warmup else None)
+
+
+def get_face_models(detection_model="hog", warmup=True):
+    """
+    face_recognition 的 dlib 模型在导入模块时加载；这里统一导入，
+    并用一张空白图跑一遍检测和编码做热身。返回 face_recognition 模块本身。
+    """
+    key = ("face_recognition", detection_model)
+
+    def load():
+        import face_recognition
+        return face_recognition
+
+    def warm(face_recognition):
+        image = np.zeros((150, 150, 3), dtype=np.uint8)
+        face_recognition.face_locations(image, model=detection_model)
+        face_recognition.face_encodings(image, [(10, 140, 140, 10)])
+
+    return _get(key, load, warm if warmup else None)
+
+
+def timings():
+    """所有已加载模型的 {名字: {"load": 秒, "warmup": 秒}}"""
+    with _lock:
+        return {"/".join(str(part) for part in key if part != ()): dict(t) for key, t in _timings.items()}
+
+
+def report(prefix="[INFO]"):
+    for name, t in timings().items():
+        print(f"{prefix} Model {name}: load {t['load'] * 1000:.0f}ms, warm-up {t['warmup'] * 1000:.0f}ms")
@@ -0,0 +1,79 @@
+# -----------------------------------------------------------------------------
+# motion.py
+# 作用：廉价的画面变化检测，树莓派和 PC 共用。把画面缩到很小的灰度图，与缓慢更新的背景相减，
+#       变化像素的比例就是运动分数（0~1）。树莓派把分数放在每个 MJPEG 分段的 X-Motion-Score 头里，
+#       并在画面静止时降低发送帧率；PC 在画面静止时跳过人脸检测。
+# -----------------------------------------------------------------------------
+import time
+
+import cv2
+import numpy as np
+
+MOTION_SIZE = (80, 60)          # 计算运动分数用的灰度图尺寸
+PIXEL_THRESHOLD = 15            # 灰度差超过这个值的像素算作"变化"
+BACKGROUND_ALPHA = 0.05         # 背景的更新速度，越小越能发现缓慢走近的人
+MOTION_THRESHOLD = 0.01         # 变化像素比例超过这个值认为画面在动
+STATIC_HOLD = 3.0               # 秒，连续这么久没有运动才认为画面静止
+STATIC_RECHECK_INTERVAL = 2.0   # 秒，画面静止时也每隔这么久处理一帧，防止有人站着不动被漏掉
+
+
+class MotionDetector:
+    """update(frame) 返回这一帧相对背景的运动分数"""
+
+    def __init__(self, size=MOTION_SIZE, pixel_threshold=PIXEL_THRESHOLD, alpha=BACKGROUND_ALPHA):
+        self.size = size
+        self.pixel_threshold = pixel_threshold
+        self.alpha = alpha
+        self.background = None
+
+    def update(self, frame):
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        luma = small.astype(np.float32)
+        if self.background is None or self.background.shape != luma.shape:
+            self.background = luma
+            return 1.0      # 第一帧当作有变化，保证启动后马上处理一次
+        diff = cv2.absdiff(luma, self.background)
+        cv2.accumulateWeighted(luma, self.background, self.alpha)
+        return float(np.count_nonzero(diff > self.pixel_threshold)) / diff.size
+
+
+class MotionGate:
+    """
+    根据运动分数决定要不要处理这一帧。分数来自树莓派的 X-Motion-Score 头；
+    拿不到头（例如用 OpenCV 读流）时在本地计算。
+    """
+
+    def __init__(self, threshold=MOTION_THRESHOLD, hold=STATIC_HOLD,
+                 recheck_interval=STATIC_RECHECK_INTERVAL, clock=time.monotonic):
+        self.threshold = threshold
+        self.hold = hold
+        self.recheck_interval = recheck_interval
+        self.clock = clock
+        self.detector = MotionDetector()
+        self.score = None
+        self._last_motion = None
+        self._last_processed = None
+        self.skipped = 0
+
+    def is_static(self):
+        return self._last_motion is not None and self.clock() - self._last_motion > self.hold
+
+    def observe(self, frame, score=None):
+        """记录这一帧的运动分数（没有就本地计算），返回分数"""
+        self.score = self.detector.update(frame) if score is None else score
+        if self.score >= self.threshold or self._last_motion is None:
+            self._last_motion = self.clock()
+        return self.score
+
+    def should_process(self, frame, score=None):
+        """画面在动、刚静止不久、或者距上次处理超过 recheck_interval 时返回 True"""
+        self.observe(frame, score)
+        now = self.clock()
+        if (not self.is_static() or self._last_processed is None
+                or now - self._last_processed >= self.recheck_interval):
+            self._last_processed = now
+            return True
+        self.skipped += 1
+        return False
@@ -0,0 +1,208 @@
+# -----------------------------------------------------------------------------
+# multi_robot_client.py
+# 作用：一个 PC 进程同时驱动多台售货机器人。每台机器人有自己的视频流、指令通道和状态机，
+#       人脸数据库、人脸模型和 YOLO 只加载一份，所有机器人共用；
+#       每一轮把各路视频流的最新帧收集起来，需要找人的一起做人脸检测和比对，
+#       需要找饮料的合成一批送进 YOLO。
+# 用法：在 ROBOTS 里列出每台机器人的地址，然后 python multi_robot_client.py
+# -----------------------------------------------------------------------------
+import time
+
+import cv2
+
+import metrics
+import model_registry
+from command_channel import CommandDispatcher
+from drink_backends import load_drink_model
+from drink_detector import detect_batch as detect_drinks_batch
+from face_detector import MultiScaleFaceDetector, detect_batch as detect_faces_batch, \
+    DEFAULT_MODEL as FACE_DETECTION_MODEL
+from face_gallery import FaceGallery
+from face_store import FaceStore
+from mjpeg_reader import MJPEGFrameGrabber
+from motion import MotionGate
+from vending_state_machine import VendingStateMachine, NEEDS_FACES, NEEDS_DRINK
+from vision_pipeline import FrameResult, PipelinePerception
+
+# --- 1. 配置 ---
+ROBOTS = [
+    {"name": "robot-1", "address": "192.168.43.14:5000"},
+    {"name": "robot-2", "address": "192.168.43.15:5000"},
+]
+STREAM_FPS = 15
+STREAM_QUALITY = 80
+STREAM_IDLE_FPS = 2
+DATABASE_DIR = "face_db"
+STORE_REFRESH_INTERVAL = 2.0
+YOLO_MODEL_PATH = "yolo_weights/best.pt"
+FACE_CONFIDENCE_THRESHOLD = 0.6
+METRICS_PORT = 8000
+ROUND_IDLE_SLEEP = 0.005        # 秒，这一轮没有任何机器人来新帧时的等待
+SHOW_WINDOWS = True
+
+
+class Robot:
+    """一台机器人：视频流 + 指令通道 + 自己的状态机"""
+
+    def __init__(self, name, address, store):
+        self.name = name
+        self.stream_url = (f"http://{address}/video_feed"
+                           f"?fps={STREAM_FPS}&quality={STREAM_QUALITY}&idle_fps={STREAM_IDLE_FPS}")
+        self.grabber = MJPEGFrameGrabber(self.stream_url)
+        self.commands = CommandDispatcher(f"http://{address}/command", verbose=False)
+        # store 是所有机器人共用的，由 SharedModels.refresh() 统一刷新并同步图库；
+        # 这里也刷新的话会先把变化消费掉，图库就收不到新注册的用户
+        self.perception = PipelinePerception(store, store_refresh_interval=None)
+        # 状态机里的等待（停止旋转后等机器人稳定）不能阻塞其他机器人，改成暂停处理这台机器人的画面
+        self.machine = VendingStateMachine(self.perception, self.send_command, sleep=self.pause)
+        self.face_detector = MultiScaleFaceDetector(model=FACE_DETECTION_MODEL)  # 每路视频流各自记录人脸大小
+        self.gate = MotionGate()
+        self.paused_until = 0.0
+        self.frames = 0
+
+    def start(self):
+        self.commands.start()
+        self.grabber.start()
+        return self
+
+    def send_command(self, command, force_send=False):
+        with metrics.timer("command.send"):
+            return self.commands.send(command, force=force_send)
+
+    def pause(self, seconds):
+        self.paused_until = time.monotonic() + seconds
+
+    @property
+    def paused(self):
+        return time.monotonic() < self.paused_until
+
+    def stats(self):
+        return {"state": self.machine.state, "frames": self.frames, "stream": self.grabber.stats(),
+                "commands": self.commands.stats(), "motion_skipped": self.gate.skipped}
+
+    def close(self):
+        self.send_command("STATUS:Idle", force_send=True) # 退出前让机器人停止
+        self.grabber.release()
+        self.commands.close()
+
+
+class SharedModels:
+    """所有机器人共用的人脸库和模型，按批处理多路画面"""
+
+    def __init__(self, store_dir, yolo_model_path, face_detection_model, tolerance):
+        self.store = FaceStore(store_dir)
+        self.gallery = self.store.sync_gallery(FaceGallery())
+        self.face_recognition = model_registry.get_face_models(face_detection_model)
+        self.drink_model = load_drink_model(yolo_model_path)
+        self.tolerance = tolerance
+        self._last_store_check = time.time()
+
+    def refresh(self):
+        if time.time() - self._last_store_check > STORE_REFRESH_INTERVAL:
+            self._last_store_check = time.time()
+            if self.store.refresh():
+                self.store.sync_gallery(self.gallery)
+                print(f"[PC INFO] Face database updated ({len(self.gallery)} identities).")
+
+    def identify(self, detectors, frames):
+        """返回每一帧里识别出的名字列表；所有画面的人脸编码一次性与图库比对"""
+        rgb_frames = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for frame in frames]
+        with metrics.timer("face.face_locations"):
+            locations = detect_faces_batch(detectors, rgb_frames)
+        with metrics.timer("face.face_encodings"):
+            encodings = [self.face_recognition.face_encodings(rgb, boxes) if boxes else []
+                         for rgb, boxes in zip(rgb_frames, locations)]
+        flat = [encoding for per_frame in encodings for encoding in per_frame]
+        with metrics.timer("face.match"):
+            matches = self.gallery.match(flat, tolerance=self.tolerance) if flat else []
+        names, start = [], 0
+        for per_frame in encodings:
+            names.append([name for name, _ in matches[start:start + len(per_frame)] if name is not None])
+            start += len(per_frame)
+        return names
+
+    def find_drinks(self, frames, drink_names):
+        return detect_drinks_batch(self.drink_model, frames, drink_names)
+
+
+def run(robots, models):
+    while True:
+        models.refresh()
+        ready = []
+        for robot in robots:
+            if robot.paused:
+                continue
+            ret, frame, info = robot.grabber.read(timeout=0)
+            if ret:
+                ready.append((robot, frame, info))
+        if not ready:
+            time.sleep(ROUND_IDLE_SLEEP)
+            continue
+
+        # 找人的画面（画面静止的跳过）一起做人脸识别，找饮料的画面合成一批送进 YOLO
+        face_jobs = [(robot, frame) for robot, frame, info in ready
+                     if robot.machine.needs == NEEDS_FACES and robot.gate.should_process(frame, info.motion)]
+        drink_jobs = [(robot, frame) for robot, frame, info in ready if robot.machine.needs == NEEDS_DRINK]
+        faces, drinks = {}, {}
+        if face_jobs:
+            names = models.identify([robot.face_detector for robot, _ in face_jobs], [f for _, f in face_jobs])
+            faces = {robot: n for (robot, _), n in zip(face_jobs, names)}
+        if drink_jobs:
+            targets = [robot.machine.target_drink_name for robot, _ in drink_jobs]
+            boxes = models.find_drinks([f for _, f in drink_jobs], targets)
+            drinks = {robot: ({target.lower(): box} if box is not None else {})
+                      for (robot, _), target, box in zip(drink_jobs, targets, boxes)}
+        metrics.count("fleet.rounds")
+        metrics.count("fleet.frames", len(ready))   # 两者之比就是平均每批的画面数
+
+        for robot, frame, info in ready:
+            robot.frames += 1
+            robot.perception.use(FrameResult(robot.frames, None, info, faces.get(robot), drinks.get(robot),
+                                             {}, time.perf_counter()))
+            state = robot.machine.state
+            if robot.perception.has(robot.machine.needs):
+                state = robot.machine.step(frame)
+            if SHOW_WINDOWS:
+                cv2.putText(frame, f"{robot.name}  STATE: {state}  age: {info.age * 1000:.0f}ms",
+                            (10, frame.shape[0] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255,255,0), 2)
+                cv2.imshow(f"Smart Vending Machine - {robot.name}", frame)
+        if SHOW_WINDOWS and cv2.waitKey(1) & 0xFF == ord('q'):
+            break
+
+
+def main():
+    if not FaceStore.exists(DATABASE_DIR):
+        print(f"[PC ERROR] Could not find {DATABASE_DIR}/. Run 01_enroll_faces.py first.")
+        return
+    print(f"[PC INFO] Loading shared face database and models for {len(ROBOTS)} robots...")
+    with metrics.phase("models"):
+        models = SharedModels(DATABASE_DIR, YOLO_MODEL_PATH, FACE_DETECTION_MODEL, FACE_CONFIDENCE_THRESHOLD)
+    model_registry.report("[PC INFO]")
+
+    robots = []
+    with metrics.phase("streams"):
+        for config in ROBOTS:
+            robot = Robot(config["name"], config["address"], models.store)
+            if not robot.grabber.isOpened():
+                # 连不上的机器人也保留，后台线程会一直尝试重连
+                print(f"[PC WARN] {robot.name}: video stream not reachable yet, will keep retrying.")
+            robots.append(robot.start())
+            print(f"[PC INFO] {robot.name}: {robot.stream_url}")
+    metrics.report_startup("[PC INFO]")
+
+    metrics.serve(METRICS_PORT, extra=lambda: {"robots": {robot.name: robot.stats() for robot in robots}})
+    print(f"[PC INFO] Metrics available at http://localhost:{METRICS_PORT}/metrics")
+    try:
+        run(robots, models)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for robot in robots:
+            robot.close()
+        if SHOW_WINDOWS:
+            cv2.destroyAllWindows()
+        print("Program exited.")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,174 +3,191 @@
 # 作用：在PC上运行，接收树莓派视频流，进行AI识别，并将控制指令发回树莓派。
 # -----------------------------------------------------------------------------
 import cv2
-import face_recognition
-import pickle
-import numpy as np
-import requests
-import time
-from ultralytics import YOLO
+from mjpeg_reader import MJPEGFrameGrabber
+from face_detector import DEFAULT_MODEL as FACE_DETECTION_MODEL
+import model_registry
+import metrics
+from command_channel import CommandDispatcher
+from face_store import FaceStore
+from perception import build_local_perception
+from motion import MotionGate
+from vending_state_machine import VendingStateMachine, NEEDS_FACES
+from vision_pipeline import VisionPipeline, PipelinePerception
 
 # --- 1. 配置 ---
-PI_STREAM_URL = "http://192.168.43.14:5000/video_feed" 
+# 只请求客户端真正处理得过来的帧率和质量，减少树莓派的编码量、Wi-Fi 带宽和 PC 的解码量
+STREAM_FPS = 15
+STREAM_QUALITY = 80
+STREAM_IDLE_FPS = 2             # 画面静止时树莓派只发这么多帧，一有运动立即恢复
+PI_STREAM_URL = (f"http://192.168.43.14:5000/video_feed"
+                 f"?fps={STREAM_FPS}&quality={STREAM_QUALITY}&idle_fps={STREAM_IDLE_FPS}")
 PI_COMMAND_URL = "http://192.168.43.14:5000/command"
-DATABASE_FILE = "face_database.pkl"
+DECODE_SCALE = 1                # 1/2/4/8：按原图的几分之一解码 JPEG；只需要小图时调大，解码更快（状态机的像素阈值会按它换算）
+DATABASE_DIR = "face_db"
+STORE_REFRESH_INTERVAL = 2.0    # 秒，检查是否有新注册用户的间隔
 YOLO_MODEL_PATH = "yolo_weights/best.pt"
 FACE_CONFIDENCE_THRESHOLD = 0.6
-DRINK_CENTERING_TOLERANCE = 30  # 像素容忍度
+DRINK_CENTERING_TOLERANCE = 30  # 像素容忍度（原图分辨率，和 DECODE_SCALE 无关）
+FACE_KEYFRAME_INTERVAL = 5      # 每隔多少帧做一次完整的人脸检测+编码，中间帧用光流跟踪
+FACE_REVERIFY_INTERVAL = 3      # 已识别的人每隔多少个关键帧重新编码确认一次身份
+METRICS_PORT = 8000             # http://<PC>:8000/metrics 查看各阶段耗时；逐帧追踪用 METRICS_TRACE 环境变量打开
+# 多进程流水线：推理分给多个工作进程并行，帧通过共享内存传递。
+# 关掉时在主线程里完成全部推理（配合人脸跟踪，适合核数少的电脑）
+USE_VISION_PIPELINE = True
+PIPELINE_WORKERS = None         # None 表示按 CPU 核数自动分配；每个进程都同时加载人脸和饮料模型
+MOTION_GATING = True            # 找人时画面没有变化就跳过人脸检测
+
+# --- 2. 通信函数 ---
+# 后台线程通过持久连接发送指令，识别主循环不会因为网络卡住
+command_channel = None
 
-# --- 2. 加载所有模型 ---
-print("[PC INFO] Loading face database...")
-try:
-    with open(DATABASE_FILE, 'rb') as f:
-        database = pickle.load(f)
-    known_names = list(database.keys())
-    known_encodings = [data["embedding"] for data in database.values()]
-    print("[PC INFO] SUCCESS: Face database loaded.")
-except FileNotFoundError:
-    print(f"[PC ERROR] Could not find {DATABASE_FILE}. Run 01_enroll_faces.py first.")
-    exit()
-
-print("[PC INFO] Loading beverage detection model...")
-try:
-    drink_model = YOLO(YOLO_MODEL_PATH)
-    print(f"[PC INFO] SUCCESS: Beverage detection model loaded from {YOLO_MODEL_PATH}.")
-except Exception as e:
-    print(f"[PC ERROR] Failed to load YOLO model at {YOLO_MODEL_PATH}: {e}")
-    exit()
-
-# --- 3. 通信函数 ---
 def send_command_to_robot(command, force_send=False):
-    """向机器人发送指令，并增加逻辑避免指令刷屏"""
-    global last_command # 使用全局变量来跟踪上一个指令
-    if command != last_command or force_send:
-        print(f"[PC CMD] Sending command: '{command}'")
-        try:
-            requests.post(PI_COMMAND_URL, json={"command": command}, timeout=1)
-            last_command = command
-        except requests.exceptions.RequestException:
-            print(f"[PC WARN] Failed to send command, network error.")
-
-# --- 4. 主程序 ---
-print(f"Connecting to video stream: {PI_STREAM_URL}...")
-cap = cv2.VideoCapture(PI_STREAM_URL)
-
-if not cap.isOpened():
-    print(f"PC ERROR: Could not connect to video stream {PI_STREAM_URL}")
-else:
-    print("Connection successful! Starting system...")
-
-    # --- 状态机初始化 ---
-    STATE = "SEARCHING_PERSON"
-    target_person_name = ""
-    target_drink_name = ""
-    last_command = ""
-
-    action_timer_start = 0
-
-    APPROACH_BOX_HEIGHT_TARGET = 250 # 当饮料的包围盒高度达到这个像素值时，认为已经足够近
-    RETURN_DURATION = 3              # 秒，机器人后退返回的时间
-    TURN_180_DURATION = 2            # 秒，机器人原地180度转身需要的时间
-
+    """向机器人发送指令（非阻塞），并增加逻辑避免指令刷屏"""
+    global command_channel
+    if command_channel is None:
+        command_channel = CommandDispatcher(PI_COMMAND_URL).start()
+    with metrics.timer("command.send"):
+        return command_channel.send(command, force=force_send)
+
+# --- 3. 两种运行方式 ---
+def show(frame, state, frame_info):
+    """在每一帧上显示当前状态；按 q 返回 False"""
+    cv2.putText(frame, f"STATE: {state}  age: {frame_info.age * 1000:.0f}ms  dropped: {frame_info.dropped}",
+                (10, frame.shape[0] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255,255,0), 2)
+    cv2.imshow("Smart Vending Machine - PC Client", frame)
+    return not (cv2.waitKey(1) & 0xFF == ord('q'))
+
+def serve_metrics(cap, machine, pipeline=None):
+    """各阶段耗时、视频流和指令队列的状态，可以在运行时随时查看"""
+    def extra():
+        payload = {"stream": cap.stats(), "state": machine.state}
+        if command_channel is not None:
+            payload["commands"] = command_channel.stats()
+        if pipeline is not None:
+            payload["pipeline"] = pipeline.stats()
+        return payload
+    metrics.serve(METRICS_PORT, extra=extra)
+    print(f"[PC INFO] Metrics available at http://localhost:{METRICS_PORT}/metrics")
+
+def run_local(cap):
+    """所有推理都在主线程里完成"""
+    # 人脸检测模型由 FACE_DETECTION_MODEL 环境变量选择；所有模型加载一次并热身，第一帧不再承担初始化开销
+    with metrics.phase("models"):
+        perception = build_local_perception(
+            store_dir=DATABASE_DIR,
+            yolo_model_path=YOLO_MODEL_PATH,
+            face_detection_model=FACE_DETECTION_MODEL,
+            tolerance=FACE_CONFIDENCE_THRESHOLD,
+            keyframe_interval=FACE_KEYFRAME_INTERVAL,
+            reverify_interval=FACE_REVERIFY_INTERVAL,
+            store_refresh_interval=STORE_REFRESH_INTERVAL,
+        )
+    print(f"[PC INFO] SUCCESS: Face database loaded ({len(perception.gallery)} identities).")
+    print(f"[PC INFO] SUCCESS: Beverage detection model loaded from {YOLO_MODEL_PATH}.")
+    model_registry.report("[PC INFO]")
+    metrics.report_startup("[PC INFO]")
 
+    machine = VendingStateMachine(perception, send_command_to_robot, frame_scale=DECODE_SCALE)
+    gate = MotionGate() if MOTION_GATING else None
+    serve_metrics(cap, machine)
+    cap.start()
     while True:
-        ret, frame = cap.read()
+        with metrics.timer("frame.read"):
+            ret, frame, frame_info = cap.read()
         if not ret:
             print("Video stream ended.")
             break
-
-        # --- 状态一：寻找已注册用户 ---
-        if STATE == "SEARCHING_PERSON":
-            send_command_to_robot("STATUS:Idle") # 确保小车在找人时是静止的
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            face_locations = face_recognition.face_locations(rgb_frame, model='cnn')
-            live_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-
-            for live_encoding in live_encodings:
-                matches = face_recognition.compare_faces(known_encodings, live_encoding, tolerance=FACE_CONFIDENCE_THRESHOLD)
-                if True in matches:
-                    best_match_index = np.argmin(face_recognition.face_distance(known_encodings, live_encoding))
-                    target_person_name = known_names[best_match_index]
-                    target_drink_name = database[target_person_name]["preference"]
-                    
-                    print(f"\n[STATE CHANGE] Found {target_person_name}, who wants {target_drink_name}.")
-                    STATE = "SEARCHING_DRINK"
-                    break
-                
-        elif STATE == "ROTATING_TO_FIND_DRINK":
-            send_command_to_robot("TURN:LEFT") # 持续发送左转指令
-            drink_results = drink_model(frame, verbose=False)
-            target_found = False
-            for r in drink_results:
-                for box in r.boxes:
-                    detected_class = drink_model.names[int(box.cls[0])]
-                    if detected_class.lower() == target_drink_name.lower():
-                        print(f"\n[STATE CHANGE] Found {target_drink_name}! Now stopping rotation and preparing to approach.")
-                        send_command_to_robot("STATUS:Idle", force_send=True) # 立即停止旋转
-                        time.sleep(0.5) # 等待机器人稳定
-                        STATE = "APPROACHING_DRINK" # 切换到前进状态
-                        target_found = True
-                        break
-                if target_found: break
-
-
-        elif STATE == "APPROACHING_DRINK":
-            send_command_to_robot("MOVE:FORWARD") # 持续发送前进指令
-            drink_results = drink_model(frame, verbose=False)
-            target_in_sight = False
-            for r in drink_results:
-                for box in r.boxes:
-                    detected_class = drink_model.names[int(box.cls[0])]
-                    if detected_class.lower() == target_drink_name.lower():
-                        xyxy = box.xyxy[0]
-                        box_height = xyxy[3] - xyxy[1]
-                        
-                        # 检查是否足够近
-                        if box_height >= APPROACH_BOX_HEIGHT_TARGET:
-                            print(f"\n[STATE CHANGE] Reached {target_drink_name}. Preparing to fetch.")
-                            send_command_to_robot(f"FETCH:{target_drink_name}", force_send=True)
-                            action_timer_start = time.time() # 启动抓取计时器
-                            STATE = "FETCHING_DRINK"
-                        
-                        target_in_sight = True
-                        break
-                if target_in_sight: break
-            
-            if not target_in_sight: # 如果前进时丢失目标，则退回旋转寻找状态
-                print("[WARN] Lost sight of the drink while approaching. Returning to rotation search.")
-                STATE = "ROTATING_TO_FIND_DRINK"
-
-        # --- 状态四：执行抓取 (计时器状态) ---
-        elif STATE == "FETCHING_DRINK":
-            # 这是一个延时状态，等待机器人物理抓取动作完成
-            if time.time() - action_timer_start > 5: # 假设抓取需要5秒
-                print(f"\n[STATE CHANGE] Fetch complete. Returning to user.")
-                action_timer_start = time.time() # 重置计时器用于返回
-                STATE = "RETURNING_TO_USER"
-
-        # --- 状态五：后退返回 (计时器状态) ---
-        elif STATE == "RETURNING_TO_USER":
-            send_command_to_robot("MOVE:BACKWARD")
-            if time.time() - action_timer_start > RETURN_DURATION:
-                print(f"\n[STATE CHANGE] Returned to start position. Turning to face user.")
-                action_timer_start = time.time() # 重置计时器用于转身
-                STATE = "TURNING_TO_USER"
-
-        # --- 状态六：转身面向用户 (计时器状态) ---
-        elif STATE == "TURNING_TO_USER":
-            send_command_to_robot("TURN:LEFT") # 可以是左转或右转
-            if time.time() - action_timer_start > TURN_180_DURATION:
-                print(f"\n[STATE CHANGE] Task fully complete! Ready for next person.")
-                send_command_to_robot("STATUS:Idle", force_send=True)
-                STATE = "SEARCHING_PERSON" # 回到初始状态
-
-        # 在每一帧上显示当前状态
-        cv2.putText(frame, f"STATE: {STATE}", (10, frame.shape[0] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255,255,0), 2)
-        cv2.imshow("Smart Vending Machine - PC Client", frame)
-
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            send_command_to_robot("STATUS:Idle", force_send=True) # 退出前让机器人停止
+        metrics.begin_frame(frame_info.seq)
+        metrics.observe("frame.age", frame_info.age)
+
+        state = machine.state
+        # 找人时画面没有变化（空柜台），不做人脸检测
+        if machine.needs == NEEDS_FACES and gate is not None and not gate.should_process(frame, frame_info.motion):
+            metrics.count("motion.skipped")
+        else:
+            with metrics.timer("frame.step"):
+                state = machine.step(frame)
+        metrics.end_frame(state=state, age_ms=frame_info.age * 1000, dropped=frame_info.dropped)
+        if not show(frame, state, frame_info):
             break
 
-cap.release()
-cv2.destroyAllWindows()
-print("Program exited.")
\ No newline at end of file
+def run_pipeline(cap):
+    """推理分给多个工作进程，主进程只负责按帧序驱动状态机和显示"""
+    if not FaceStore.exists(DATABASE_DIR):
+        raise FileNotFoundError(DATABASE_DIR)
+    with metrics.phase("face database"):
+        store = FaceStore(DATABASE_DIR)
+    print(f"[PC INFO] SUCCESS: Face database found ({len(store)} identities).")
+    perception = PipelinePerception(store, STORE_REFRESH_INTERVAL)
+    machine = VendingStateMachine(perception, send_command_to_robot, frame_scale=DECODE_SCALE)
+
+    cap.start()
+    # 每个工作进程各自加载并热身模型，start() 等它们全部就绪后才返回
+    with metrics.phase("workers"):
+        pipeline = VisionPipeline(cap, DATABASE_DIR, YOLO_MODEL_PATH, FACE_DETECTION_MODEL,
+                                  tolerance=FACE_CONFIDENCE_THRESHOLD, store_refresh_interval=STORE_REFRESH_INTERVAL,
+                                  workers=PIPELINE_WORKERS, motion_gate=MotionGate() if MOTION_GATING else None,
+                                  keyframe_interval=FACE_KEYFRAME_INTERVAL,
+                                  reverify_interval=FACE_REVERIFY_INTERVAL).start()
+    metrics.report_startup("[PC INFO]")
+    serve_metrics(cap, machine, pipeline)
+    try:
+        while True:
+            with metrics.timer("frame.read"):
+                result, frame = pipeline.next_result()
+            if result is None:
+                print("Video stream ended.")
+                break
+            metrics.begin_frame(result.info.seq)
+            metrics.observe("frame.age", result.info.age)
+            perception.use(result)
+
+            state = machine.state
+            # 状态刚切换时，还在路上的帧没有新状态需要的结果，跳过这些帧
+            if perception.has(machine.needs):
+                with metrics.timer("frame.step"):
+                    state = machine.step(frame)
+                pipeline.set_needs(machine.needs, machine.target_drink_name)
+            metrics.end_frame(state=state, age_ms=result.info.age * 1000, dropped=result.info.dropped)
+            keep_running = show(frame, state, result.info)
+            pipeline.release(result)
+            if not keep_running:
+                break
+    finally:
+        pipeline.close()
+
+# --- 4. 主程序 ---
+def main():
+    print(f"Connecting to video stream: {PI_STREAM_URL}...")
+    # 后台线程直接从 socket 接收 JPEG，主循环只解码最新的一帧，推理期间积压的旧帧不解码直接丢弃；断线自动重连
+    with metrics.phase("stream"):
+        cap = MJPEGFrameGrabber(PI_STREAM_URL, scale=DECODE_SCALE)
+    if not cap.isOpened():
+        print(f"PC ERROR: Could not connect to video stream {PI_STREAM_URL}")
+        cap.release()
+        return
+
+    print("Connection successful! Loading face database and models...")
+    try:
+        if USE_VISION_PIPELINE:
+            run_pipeline(cap)
+        else:
+            run_local(cap)
+    except FileNotFoundError as e:
+        if not FaceStore.exists(DATABASE_DIR):
+            print(f"[PC ERROR] Could not find {DATABASE_DIR}/. Run 01_enroll_faces.py first "
+                  f"(or migrate an old database with: python face_store.py migrate face_database.pkl).")
+        else:
+            print(f"[PC ERROR] Could not load models (YOLO weights: {YOLO_MODEL_PATH}): {e}")
+    except RuntimeError as e:   # 视频流没有画面、工作进程加载模型时退出
+        print(f"[PC ERROR] Vision pipeline failed to start: {e}")
+    finally:  # 其他异常照常抛出，带完整的调用栈
+        send_command_to_robot("STATUS:Idle", force_send=True) # 退出前让机器人停止
+        cap.release()
+        command_channel.close() # 确保退出前的停止指令已经发出
+        cv2.destroyAllWindows()
+        print("Program exited.")
+
+# 多进程流水线用 spawn 启动工作进程，工作进程会重新导入这个文件，所以主程序必须放在这个判断里
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# -----------------------------------------------------------------------------
+# perception.py
+# 作用：状态机的"感知"部分——找出画面中已注册的用户、找出目标饮料的位置。
+#       LocalPerception 在当前进程中完成全部推理，PC 客户端和基准测试共用。
+# -----------------------------------------------------------------------------
+import time
+
+import cv2
+
+import metrics
+import model_registry
+from drink_backends import load_drink_model, DEFAULT_BACKEND, DEFAULT_IMGSZ, DEFAULT_INT8
+from drink_detector import DrinkDetectionScheduler
+from face_detector import MultiScaleFaceDetector, DEFAULT_MODEL as FACE_DETECTION_MODEL
+from face_gallery import FaceGallery
+from face_store import FaceStore, STORE_DIR
+from face_tracker import FaceTracker, KEYFRAME_INTERVAL, REVERIFY_INTERVAL
+
+YOLO_MODEL_PATH = "yolo_weights/best.pt"
+FACE_CONFIDENCE_THRESHOLD = 0.6
+STORE_REFRESH_INTERVAL = 2.0    # 秒，检查是否有新注册用户的间隔
+
+
+class LocalPerception:
+    """在当前进程里完成人脸识别和饮料检测"""
+
+    def __init__(self, store, gallery, face_tracker, drink_detector, store_refresh_interval=STORE_REFRESH_INTERVAL):
+        self.store = store
+        self.gallery = gallery
+        self.face_tracker = face_tracker
+        self.drink_detector = drink_detector
+        self.store_refresh_interval = store_refresh_interval
+        self._last_store_check = time.time()
+
+    def identify(self, frame):
+        """返回这一帧中已识别用户的名字列表"""
+        # 定期检查是否有新注册的用户，无需重启客户端
+        if time.time() - self._last_store_check > self.store_refresh_interval:
+            self._last_store_check = time.time()
+            if self.store.refresh():
+                self.store.sync_gallery(self.gallery)
+                print(f"[PC INFO] Face database updated ({len(self.gallery)} identities).")
+        with metrics.timer("face.cvtColor"):
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        # 关键帧上检测+编码并与整个图库批量比对，中间帧只移动人脸框，身份跟着轨迹走
+        with metrics.timer("face.track"):
+            tracks = self.face_tracker.update(rgb_frame)
+        return [track.name for track in tracks if track.name is not None]
+
+    def find_drink(self, frame, drink_name):
+        """返回目标饮料的 (x1, y1, x2, y2) 框，没找到返回 None"""
+        # 只检测目标类别、在上一个框周围的 ROI 上推理，两次推理之间用光流跟踪框
+        return self.drink_detector.detect(frame, drink_name)
+
+    def preference(self, name):
+        return self.store.preference(name)
+
+    def reset(self):
+        """回到找人状态前调用，重新开始人脸跟踪和饮料跟踪"""
+        self.face_tracker.reset()
+        self.drink_detector.reset()
+
+
+def build_local_perception(store_dir=STORE_DIR, yolo_model_path=YOLO_MODEL_PATH,
+                           face_detection_model=FACE_DETECTION_MODEL, tolerance=FACE_CONFIDENCE_THRESHOLD,
+                           keyframe_interval=KEYFRAME_INTERVAL, reverify_interval=REVERIFY_INTERVAL,
+                           store_refresh_interval=STORE_REFRESH_INTERVAL, drink_backend=DEFAULT_BACKEND,
+                           drink_imgsz=DEFAULT_IMGSZ, drink_int8=DEFAULT_INT8):
+    """加载人脸数据库和所有模型，组装一个 LocalPerception；数据库不存在时抛出 FileNotFoundError"""
+    if not FaceStore.exists(store_dir):
+        raise FileNotFoundError(store_dir)
+    store = FaceStore(store_dir)
+    gallery = store.sync_gallery(FaceGallery())
+
+    face_recognition = model_registry.get_face_models(face_detection_model)
+    # 人脸检测在缩小的图像上进行，比例根据最近的人脸大小自动调整
+    face_detector = MultiScaleFaceDetector(model=face_detection_model)
+    # 人脸跟踪：只在关键帧上检测和编码，轨迹会带着识别出的身份
+    face_tracker = FaceTracker(
+        detect_fn=metrics.timed("face.face_locations", face_detector.detect),
+        encode_fn=metrics.timed("face.face_encodings", face_recognition.face_encodings),
+        match_fn=metrics.timed("face.match", lambda encodings: gallery.match(encodings, tolerance=tolerance)),
+        keyframe_interval=keyframe_interval,
+        reverify_interval=reverify_interval,
+    )
+    # 饮料检测后端（PyTorch / ONNX / OpenVINO）由 DRINK_BACKEND 等环境变量选择
+    drink_model = load_drink_model(yolo_model_path, drink_backend, drink_imgsz, drink_int8)
+    drink_detector = DrinkDetectionScheduler(drink_model, imgsz=drink_imgsz)
+    return LocalPerception(store, gallery, face_tracker, drink_detector, store_refresh_interval)
@@ -0,0 +1,191 @@
+# -----------------------------------------------------------------------------
+# pi_camera_stream.py
+# 作用：在树莓派上只用一个线程采集画面，发布到共享缓冲区；所有 /video_feed 客户端
+#       都从缓冲区读取最新帧，慢的客户端直接跳帧，不会拖慢采集线程。
+#       每个客户端可以通过参数协商分辨率、JPEG 质量、帧率和是否灰度：
+#       /video_feed?width=320&height=240&quality=70&fps=10&gray=1
+#       同一帧、同一组参数只编码一次，被所有相同参数的客户端共享。
+#       每帧附带运动分数（X-Motion-Score 头）；客户端带上 idle_fps 时，画面静止期间按这个帧率发送，
+#       一有运动立即恢复正常帧率。
+# -----------------------------------------------------------------------------
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+
+import metrics
+from motion import MotionDetector, MOTION_THRESHOLD, STATIC_HOLD
+
+DEFAULT_QUALITY = 90        # 与 picamera2 默认的 JPEG 质量一致
+MIN_QUALITY, MAX_QUALITY = 10, 100
+MAX_FPS = 30
+BACKPRESSURE_MARGIN = 1.25  # 发送间隔至少是 socket 实际排空时间的这么多倍，避免帧积压在发送缓冲区
+DRAIN_SMOOTHING = 0.2       # 排空时间的指数滑动平均系数
+
+StreamProfile = namedtuple("StreamProfile", ["width", "height", "quality", "fps", "gray", "idle_fps"])
+
+
+def parse_profile(args, camera_size):
+    """从请求参数解析客户端想要的视频流格式，超出范围的值会被限制在合理区间内"""
+    cam_w, cam_h = camera_size
+    width = args.get("width", type=int)
+    height = args.get("height", type=int)
+    if width and not height:
+        height = round(width * cam_h / cam_w)
+    elif height and not width:
+        width = round(height * cam_w / cam_h)
+    width = min(max(16, width or cam_w), cam_w)
+    height = min(max(16, height or cam_h), cam_h)
+    quality = min(max(MIN_QUALITY, args.get("quality", DEFAULT_QUALITY, type=int)), MAX_QUALITY)
+    fps = min(max(0.0, args.get("fps", 0.0, type=float)), MAX_FPS)   # 0 表示不限制
+    gray = args.get("gray", "0").lower() in ("1", "true", "yes")
+    idle_fps = min(max(0.0, args.get("idle_fps", 0.0, type=float)), MAX_FPS)   # 0 表示静止时也不降帧率
+    return StreamProfile(width, height, quality, fps, gray, idle_fps)
+
+
+class FrameBroadcaster:
+    """单一采集线程 + 多客户端分发"""
+
+    def __init__(self, picam2, camera_size):
+        self.picam2 = picam2
+        self.camera_size = camera_size
+        self._cond = threading.Condition()
+        self._frame = None
+        self._seq = 0
+        self._motion = MotionDetector()
+        self._score = 1.0
+        self._last_motion = time.monotonic()
+        self._encoded = {}          # 当前帧：(宽, 高, 质量, 灰度) -> JPEG
+        self._encoded_seq = 0
+        self._encode_lock = threading.Lock()
+        self._clients = 0
+        self._running = False
+        self._thread = None
+        self.captured = 0
+        self.encoded = 0
+        self.skipped = 0            # 所有客户端累计跳过的帧数
+        self.idle_skipped = 0       # 画面静止时少发的帧数
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="camera-broadcaster", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+
+    def _run(self):
+        while self._running:
+            with self._cond:
+                # 没有客户端时不采集，节省树莓派的 CPU
+                self._cond.wait_for(lambda: self._clients > 0 or not self._running)
+            if not self._running:
+                break
+            with metrics.timer("camera.capture"):
+                frame = self.picam2.capture_array()
+            with metrics.timer("camera.motion"):
+                score = self._motion.update(frame)
+            with self._cond:
+                self._frame = frame
+                self._score = score
+                if score >= MOTION_THRESHOLD:
+                    self._last_motion = time.monotonic()
+                self._seq += 1
+                self.captured += 1
+                self._cond.notify_all()
+
+    def wait_for_frame(self, last_seq, timeout=1.0):
+        """等待比 last_seq 更新的一帧，返回 (seq, frame, 运动分数)；超时返回 (last_seq, None, None)"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > last_seq or not self._running, timeout):
+                return last_seq, None, None
+            if self._seq <= last_seq:
+                return last_seq, None, None
+            return self._seq, self._frame, self._score
+
+    def is_static(self):
+        """连续 STATIC_HOLD 秒没有运动"""
+        return time.monotonic() - self._last_motion > STATIC_HOLD
+
+    def encode(self, seq, frame, profile):
+        """按客户端的参数编码一帧；同一帧同一参数只编码一次（帧率不影响 JPEG 内容，不算在参数里）"""
+        key = (profile.width, profile.height, profile.quality, profile.gray)
+        with self._encode_lock:
+            if self._encoded_seq != seq:
+                self._encoded = {}
+                self._encoded_seq = seq
+            jpeg = self._encoded.get(key)
+            if jpeg is None:
+                encode_start = time.perf_counter()
+                image = frame
+                if (profile.width, profile.height) != self.camera_size:
+                    image = cv2.resize(image, (profile.width, profile.height), interpolation=cv2.INTER_AREA)
+                if profile.gray:
+                    image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+                _, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, profile.quality])
+                jpeg = buffer.tobytes()
+                self._encoded[key] = jpeg
+                self.encoded += 1
+                metrics.observe("camera.encode", time.perf_counter() - encode_start)
+            return jpeg
+
+    def client_stream(self, profile):
+        """
+        一个 HTTP 客户端的 MJPEG 生成器，每个分段带上帧序号。
+        生成器在 yield 之后恢复运行，说明上一段已经写进了 socket，这段时间就是客户端的排空时间；
+        发送间隔按排空时间自适应，客户端处理不过来时自动降低帧率，而不是让帧堆在发送缓冲区里。
+        """
+        with self._cond:
+            self._clients += 1
+            self._cond.notify_all()
+        try:
+            min_interval = 1.0 / profile.fps if profile.fps else 0.0
+            idle_interval = 1.0 / profile.idle_fps if profile.idle_fps else 0.0
+            drain_time = 0.0
+            next_send = 0.0
+            last_sent = 0.0
+            last_seq = 0
+            while self._running:
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                seq, frame, score = self.wait_for_frame(last_seq)
+                if frame is None:
+                    continue
+                # 画面静止时按 idle_fps 发送；有运动的帧不受限制，保证有人走近时不会被延迟
+                if idle_interval and self.is_static() and time.monotonic() - last_sent < idle_interval:
+                    with self._cond:    # 计数器被所有客户端线程共享
+                        self.idle_skipped += 1
+                    last_seq = seq
+                    continue
+                if last_seq and seq > last_seq + 1:
+                    with self._cond:
+                        self.skipped += seq - last_seq - 1
+                    metrics.count("stream.skipped", seq - last_seq - 1)
+                last_seq = seq
+                jpeg = self.encode(seq, frame, profile)
+                sent_at = last_sent = time.monotonic()
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n'
+                       b'Content-Length: ' + str(len(jpeg)).encode() + b'\r\n'
+                       b'X-Frame-Seq: ' + str(seq).encode() + b'\r\n'
+                       b'X-Motion-Score: ' + f"{score:.4f}".encode() + b'\r\n\r\n' + jpeg + b'\r\n')
+                drained = time.monotonic() - sent_at
+                metrics.observe("stream.drain", drained)
+                drain_time += DRAIN_SMOOTHING * (drained - drain_time)
+                next_send = sent_at + max(min_interval, drain_time * BACKPRESSURE_MARGIN)
+        finally:
+            with self._cond:
+                self._clients -= 1
+
+    def stats(self):
+        with self._cond:
+            return {"clients": self._clients, "seq": self._seq, "captured": self.captured,
+                    "encoded": self.encoded, "skipped": self.skipped, "idle_skipped": self.idle_skipped,
+                    "motion_score": self._score, "static": self.is_static()}
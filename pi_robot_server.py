@@ -1,42 +1,55 @@
 # -----------------------------------------------------------------------------
 # pi_robot_server.py
 # 作用：在树莓派上运行，提供视频流服务并接收PC指令以控制机器人。
+#       导入本文件不会打开摄像头和串口，main() 里才打开，可以在没有硬件的电脑上导入和测试。
 # -----------------------------------------------------------------------------
 from flask import Flask, Response, request
-from picamera2 import Picamera2
-import io
-import time
-import serial
+from werkzeug.serving import WSGIRequestHandler
+from pi_camera_stream import FrameBroadcaster, parse_profile
+from pi_serial_worker import SerialWorker
+import metrics
+
+CAMERA_SIZE = (640, 480) # 摄像头采集分辨率，也是客户端能请求的最大分辨率
+ARDUINO_PORT = '/dev/ttyACM0' # 可能需要调整端口号
+ARDUINO_BAUDRATE = 9600
+
+# 硬件句柄，由 open_arduino() / open_camera() 创建
+arduino = None
+broadcaster = None
 
 # --- 0. Arduino串口通信初始化 ---
-try:
-    arduino = serial.Serial('/dev/ttyACM0', 9600, timeout=1)  # 可能需要调整端口号
-    time.sleep(2)  # 等待Arduino初始化
-    print("[Pi INFO] Arduino connected successfully.")
-except Exception as e:
-    print(f"[Pi ERROR] Failed to connect to Arduino: {e}")
-    arduino = None
+# 串口由一个专门的工作线程独占，Flask 请求只负责把指令放进队列
+def open_arduino(port=ARDUINO_PORT, baudrate=ARDUINO_BAUDRATE):
+    global arduino
+    try:
+        arduino = SerialWorker(port, baudrate).open().start()
+        print("[Pi INFO] Arduino connected successfully.")
+    except Exception as e:
+        print(f"[Pi ERROR] Failed to connect to Arduino: {e}")
+        arduino = None
+    return arduino
 
 def send_arduino_command(command):
-    """向Arduino发送指令"""
+    """把指令放进串口发送队列，立即返回序号（不等待Arduino）"""
     if arduino and arduino.is_open:
-        try:
-            arduino.write((command + '\n').encode())
-            arduino.flush()
-            print(f"[ARDUINO CMD] Sent: {command}")
-            # 等待Arduino响应（可选）
-            time.sleep(0.1)
-        except Exception as e:
-            print(f"[ARDUINO ERROR] Failed to send command: {e}")
+        return arduino.submit(command)
     else:
         print("[ARDUINO ERROR] Arduino not connected.")
+        return None
 
 # --- 1. 摄像头初始化 ---
-print("[Pi INFO] Initializing camera...")
-picam2 = Picamera2()
-picam2.configure(picam2.create_video_configuration(main={"size": (640, 480)}))
-picam2.start()
-print("[Pi INFO] Camera started successfully.")
+def open_camera(size=CAMERA_SIZE):
+    global broadcaster
+    from picamera2 import Picamera2     # 只有树莓派上才有这个库
+    print("[Pi INFO] Initializing camera...")
+    picam2 = Picamera2()
+    # RGB888 在内存中是 BGR 顺序，可以直接交给 OpenCV 编码
+    picam2.configure(picam2.create_video_configuration(main={"size": size, "format": "RGB888"}))
+    picam2.start()
+    # 所有视频流客户端共享同一个采集线程，相同参数的客户端共享同一份 JPEG
+    broadcaster = FrameBroadcaster(picam2, size).start()
+    print("[Pi INFO] Camera started successfully.")
+    return broadcaster
 
 # --- 2. Flask 应用初始化 ---
 app = Flask(__name__)
@@ -47,83 +60,78 @@ app = Flask(__name__)
 def move_forward():
     """控制小车前进"""
     print("[ROBOT ACTION] Moving forward...")
-    send_arduino_command("FORWARD")
+    return send_arduino_command("FORWARD")
 
 def move_backward():
     """控制小车后退"""
     print("[ROBOT ACTION] Moving backward...")
-    send_arduino_command("BACKWARD")
+    return send_arduino_command("BACKWARD")
 
 def turn_left():
     """控制小车左转"""
     print("[ROBOT ACTION] Turning left...")
-    send_arduino_command("LEFT")
+    return send_arduino_command("LEFT")
 
 def turn_right():
     """控制小车右转"""
     print("[ROBOT ACTION] Turning right...")
-    send_arduino_command("RIGHT")
+    return send_arduino_command("RIGHT")
 
 def stop_all_motors():
     """停止所有移动"""
     print("[ROBOT ACTION] Stopping all movement.")
-    send_arduino_command("STOP")
+    return send_arduino_command("STOP")
 
 def fetch_drink(drink_name):
     """执行抓取饮料的机械臂动作序列"""
     print(f"[ROBOT ACTION] Starting pickup for {drink_name}...")
     # 可以发送特定的抓取指令
-    send_arduino_command(f"FETCH:{drink_name}")
+    return send_arduino_command(f"FETCH:{drink_name}")
 
 def return_to_start_position():
     """返回到初始位置"""
     print("[ROBOT ACTION] Returning to start position...")
-    send_arduino_command("RETURN_HOME")
+    return send_arduino_command("RETURN_HOME")
 
 def turn_180_degrees():
     """转身180度"""
     print("[ROBOT ACTION] Turning 180 degrees...")
-    send_arduino_command("TURN_180")
+    return send_arduino_command("TURN_180")
     
 # --- 4. 指令解析与执行 ---
 def execute_robot_command(command):
-    """解析来自PC的指令并调用相应的机器人动作函数"""
+    """解析来自PC的指令并调用相应的机器人动作函数，返回串口队列中的序号"""
     print(f"[COMMAND RECEIVED] {command}")
     
     if command == "TURN:LEFT":
-        turn_left()
+        return turn_left()
     elif command == "TURN:RIGHT":
-        turn_right()
+        return turn_right()
     elif command == "MOVE:FORWARD":
-        move_forward()
+        return move_forward()
     elif command == "MOVE:BACKWARD":
-        move_backward()
+        return move_backward()
     elif command == "RETURN:HOME":
-        return_to_start_position() # 调用返回原位的函数
+        return return_to_start_position() # 调用返回原位的函数
     elif command == "FACE:CUSTOMER":
-        turn_180_degrees() # 调用转身函数
+        return turn_180_degrees() # 调用转身函数
     elif command.startswith("FETCH:"):
         drink = command.split(":")[1]
-        fetch_drink(drink)
+        return fetch_drink(drink)
     elif command == "STATUS:Idle":
-        stop_all_motors()
+        return stop_all_motors()
     else:
         print(f"[WARN] Unknown command '{command}', doing nothing.")
+        return None
 
 # --- 5. Flask Web服务 ---
 @app.route('/video_feed')
 def video_feed():
-    """视频流路由"""
-    def generate_frames():
-        while True:
-            stream = io.BytesIO()
-            picam2.capture_file(stream, format='jpeg')
-            stream.seek(0)
-            frame = stream.read()
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-            time.sleep(0.01)
-    return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    """视频流路由：可选参数 width、height、quality、fps、gray、idle_fps（画面静止时的帧率），例如 /video_feed?width=320&fps=10&idle_fps=2"""
+    if broadcaster is None:
+        return {"status": "error", "message": "Camera not started"}, 503
+    profile = parse_profile(request.args, CAMERA_SIZE)
+    return Response(broadcaster.client_stream(profile), mimetype='multipart/x-mixed-replace; boundary=frame')
 
 @app.route('/command', methods=['POST'])
 def command_receiver():
@@ -131,20 +139,58 @@ def command_receiver():
     data = request.get_json()
     if data and 'command' in data:
         cmd = data['command']
-        execute_robot_command(cmd)
-        return {"status": "success", "command_received": cmd}, 200
+        # 只把指令放进串口队列就返回，执行情况通过 /command/<seq> 查询
+        seq = execute_robot_command(cmd)
+        return {"status": "success", "command_received": cmd, "seq": seq}, 200
     else:
         return {"status": "error", "message": "Invalid command format"}, 400
 
+@app.route('/command/<int:seq>')
+def command_status(seq):
+    """查询某条指令在串口上的状态：queued / sent / acked / dropped / timeout / late（超时后才应答）/ failed"""
+    record = arduino.status(seq) if arduino else None
+    if record is None:
+        return {"status": "error", "message": f"Unknown command seq {seq}"}, 404
+    return {"status": "success", "seq": seq, **record}, 200
+
+@app.route('/command/stats')
+def command_stats():
+    """串口队列长度、已发送/丢弃数量和 Arduino 应答往返时间"""
+    if not arduino:
+        return {"status": "error", "message": "Arduino not connected"}, 503
+    return {"status": "success", **arduino.stats()}, 200
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """采集、JPEG 编码、串口写入等各阶段最近的耗时分位数，以及视频流和串口队列的状态"""
+    payload = metrics.snapshot()
+    payload["camera"] = broadcaster.stats() if broadcaster else None
+    payload["serial"] = arduino.stats() if arduino else None
+    return payload, 200
+
 # --- 6. 主程序入口 ---
-if __name__ == '__main__':
+def main(host='0.0.0.0', port=5000):
+    # Werkzeug 默认按 HTTP/1.0 应答，每个请求之后都会关闭连接；改成 HTTP/1.1，
+    # PC 端的 requests.Session 才能在一条 keep-alive 连接上连续发送指令。
+    # 视频流没有 Content-Length，会改用 chunked 编码发送，PC 端的 MJPEG 读取器支持这种格式。
+    WSGIRequestHandler.protocol_version = "HTTP/1.1"
+    with metrics.phase("serial"):
+        open_arduino()
+    with metrics.phase("camera"):
+        open_camera()
+    metrics.report_startup("[Pi INFO]")
     print("[SERVER START] Raspberry Pi Robot Server is running...")
     try:
-        app.run(host='0.0.0.0', port=5000, threaded=True)
+        app.run(host=host, port=port, threaded=True)
     except KeyboardInterrupt:
         print("\n[SERVER STOP] Shutting down server...")
     finally:
+        if broadcaster:
+            broadcaster.stop()
         # 关闭Arduino串口连接
-        if arduino and arduino.is_open:
+        if arduino:
             arduino.close()
-            print("[Pi INFO] Arduino connection closed.")
\ No newline at end of file
+            print("[Pi INFO] Arduino connection closed.")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
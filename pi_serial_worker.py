@@ -0,0 +1,237 @@
+# -----------------------------------------------------------------------------
+# pi_serial_worker.py
+# 作用：独占 Arduino 串口的 I/O 线程。Flask 请求只把指令放进优先队列就立即返回；
+#       STOP 优先于其他所有指令，重复的运动指令直接丢弃，Arduino 的应答在后台异步读取，
+#       可以按序号查询每条指令的状态和往返时间。
+#       约定：Arduino 每执行完一条指令回一行以 \n 结尾的文本，其中带上这条指令本身（例如 "OK FORWARD"）。
+#       应答按回显的指令匹配，而不是按顺序硬配：Arduino 的调试输出不会被当成应答，
+#       超时之后才到的应答记到原来那条指令上（状态 late），不会顶替下一条指令的应答。
+# -----------------------------------------------------------------------------
+import heapq
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+
+import serial
+
+import metrics
+
+MOTION_COMMANDS = ("FORWARD", "BACKWARD", "LEFT", "RIGHT", "STOP")
+STOP_COMMAND = "STOP"
+POLL_INTERVAL = 0.01        # 串口读超时，也是工作线程的轮询间隔
+ACK_TIMEOUT = 2.0           # 超过这个时间没收到应答的指令标记为 timeout
+LATE_REPLY_WINDOW = 10.0    # 超时的指令再等这么久，期间到达的应答记为 late
+MAX_REPLY_LENGTH = 256      # 一直收不到换行时丢弃缓冲，防止噪声把缓冲撑大
+STATUS_HISTORY = 500        # 最多保留多少条指令的状态
+RTT_HISTORY = 200
+
+
+class SerialWorker:
+    """串口工作线程：优先队列发送 + 异步读取应答"""
+
+    def __init__(self, port, baudrate=9600, startup_delay=2.0):
+        self.port = port
+        self.baudrate = baudrate
+        self.startup_delay = startup_delay
+        self.serial = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._queue = []                    # 堆：(优先级, 序号, 指令)
+        self._seq = itertools.count(1)
+        self._in_flight = deque()           # 已发送、等待应答的 (序号, 指令, 发送时间)
+        self._expired = deque()             # 已超时、还可能收到迟到应答的 (序号, 指令, 发送时间)
+        self._rx = bytearray()              # 还没凑成一整行的串口数据
+        self._status = OrderedDict()        # 序号 -> {"command", "state", "rtt", "reply"}
+        self._last_motion = None            # 当前生效的运动指令，用于丢弃重复指令；发出其他动作后清空
+        self._running = False
+        self._thread = None
+        self.rtts = deque(maxlen=RTT_HISTORY)
+        self.written = 0
+        self.dropped = 0
+        self.late = 0
+        self.unmatched = 0
+
+    @property
+    def is_open(self):
+        return self.serial is not None and self.serial.is_open
+
+    def open(self):
+        self.serial = serial.Serial(self.port, self.baudrate, timeout=POLL_INTERVAL)
+        time.sleep(self.startup_delay)  # 等待Arduino初始化
+        return self
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="serial-worker", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._running = False
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        if self.is_open:
+            self.serial.close()
+
+    # --- 调用方（Flask 请求线程） ---
+    def submit(self, command):
+        """把指令放进队列并立即返回序号；被判定为重复而丢弃时也返回序号，状态为 dropped"""
+        seq = next(self._seq)
+        with self._lock:
+            if command == STOP_COMMAND:
+                # STOP 之前还没发出去的运动指令都没有意义了
+                kept = []
+                for item in self._queue:
+                    if item[2] in MOTION_COMMANDS:
+                        self.dropped += 1
+                        self._set_state(item[1], "dropped")
+                    else:
+                        kept.append(item)
+                self._queue = kept
+                heapq.heapify(self._queue)
+            # 重复的运动指令直接丢弃；STOP 为了安全永远会发送，不参与去重
+            elif command in MOTION_COMMANDS and self._is_redundant(command):
+                self.dropped += 1
+                self._status[seq] = {"command": command, "state": "dropped", "rtt": None, "reply": None}
+                self._trim_status()
+                return seq
+            priority = 0 if command == STOP_COMMAND else 1
+            heapq.heappush(self._queue, (priority, seq, command))
+            self._status[seq] = {"command": command, "state": "queued", "rtt": None, "reply": None}
+            self._trim_status()
+        self._wakeup.set()
+        return seq
+
+    def _is_redundant(self, command):
+        """同样的运动指令已经在队列里，或者正是当前生效的那条（队列里没有别的运动指令）"""
+        queued_motion = [item[2] for item in self._queue if item[2] in MOTION_COMMANDS]
+        if command in queued_motion:
+            return True
+        return not queued_motion and command == self._last_motion
+
+    def status(self, seq):
+        with self._lock:
+            record = self._status.get(seq)
+            return dict(record) if record else None
+
+    def stats(self):
+        rtts = sorted(self.rtts)
+        with self._lock:
+            return {
+                "queued": len(self._queue),
+                "in_flight": len(self._in_flight),
+                "written": self.written,
+                "dropped": self.dropped,
+                "late": self.late,
+                "unmatched": self.unmatched,
+                "rtt_p50": rtts[len(rtts) // 2] if rtts else None,
+                "rtt_max": rtts[-1] if rtts else None,
+            }
+
+    # --- 工作线程 ---
+    def _run(self):
+        while self._running:
+            if not self._poll():
+                # 没有要发的指令：最多睡一个轮询间隔（期间可能有应答到达），有新指令时立即醒来
+                self._wakeup.wait(POLL_INTERVAL)
+                self._wakeup.clear()
+
+    def _poll(self):
+        """发送队首的一条指令、处理已经到达的应答；返回这一轮有没有发送指令"""
+        item = None
+        with self._lock:
+            if self._queue:
+                item = heapq.heappop(self._queue)
+        if item is not None:
+            self._write(item[1], item[2])
+        self._read_replies()
+        self._expire_in_flight()
+        return item is not None
+
+    def _write(self, seq, command):
+        try:
+            with metrics.timer("serial.write"):
+                self.serial.write((command + '\n').encode())
+                self.serial.flush()
+        except Exception as e:
+            print(f"[ARDUINO ERROR] Failed to send command: {e}")
+            metrics.count("serial.failed")
+            with self._lock:
+                self._set_state(seq, "failed")
+            return
+        sent_at = time.perf_counter()
+        with self._lock:
+            self._in_flight.append((seq, command, sent_at))
+            self._set_state(seq, "sent")
+            # FETCH、TURN_180 之类的动作之后，机器人已经不在原来的运动状态，再来同样的运动指令不能当成重复
+            self._last_motion = command if command in MOTION_COMMANDS else None
+        self.written += 1
+        print(f"[ARDUINO CMD] Sent: {command}")
+
+    def _read_replies(self):
+        # 只读已经到达的字节，凑齐一整行（\n）才当作应答；9600 波特率下一行常常要分几次才收完
+        try:
+            waiting = self.serial.in_waiting
+            data = self.serial.read(waiting) if waiting else b""
+        except Exception:
+            return
+        self._rx += data
+        while True:
+            end = self._rx.find(b"\n")
+            if end < 0:
+                break
+            line = bytes(self._rx[:end])
+            del self._rx[:end + 1]
+            reply = line.decode(errors="replace").strip()
+            if reply:
+                self._match_reply(reply)
+        if len(self._rx) > MAX_REPLY_LENGTH:
+            self._rx.clear()
+
+    def _match_reply(self, reply):
+        """把应答记到回显的那条指令上：同名指令里取最早发出的一条（Arduino 按顺序执行）"""
+        tokens = set(reply.split())
+        now = time.perf_counter()
+        with self._lock:
+            # 超时的指令都比还在等的指令发得早，先找它们
+            for pending, state in ((self._expired, "late"), (self._in_flight, "acked")):
+                for entry in pending:
+                    seq, command, sent_at = entry
+                    if command in tokens:
+                        pending.remove(entry)
+                        rtt = now - sent_at
+                        record = self._status.get(seq)
+                        if record is not None:
+                            record.update(state=state, rtt=rtt, reply=reply)
+                        if state == "late":
+                            self.late += 1
+                            metrics.count("serial.late")
+                        else:
+                            self.rtts.append(rtt)
+                            metrics.observe("serial.rtt", rtt)
+                        return
+            self.unmatched += 1
+        metrics.count("serial.unmatched")
+        print(f"[ARDUINO INFO] {reply}")   # 不是任何指令的应答，例如 Arduino 的调试输出
+
+    def _expire_in_flight(self):
+        now = time.perf_counter()
+        with self._lock:
+            while self._in_flight and now - self._in_flight[0][2] > ACK_TIMEOUT:
+                entry = self._in_flight.popleft()
+                self._expired.append(entry)
+                self._set_state(entry[0], "timeout")
+                metrics.count("serial.timeout")
+            while self._expired and now - self._expired[0][2] > ACK_TIMEOUT + LATE_REPLY_WINDOW:
+                self._expired.popleft()
+
+    def _set_state(self, seq, state):
+        record = self._status.get(seq)
+        if record is not None:
+            record["state"] = state
+
+    def _trim_status(self):
+        while len(self._status) > STATUS_HISTORY:
+            self._status.popitem(last=False)
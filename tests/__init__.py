@@ -0,0 +1 @@
+# 单元测试：只依赖 numpy 的模块（人脸图库、注册时的原型聚类），不需要摄像头和模型
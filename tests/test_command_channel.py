@@ -0,0 +1,78 @@
+# -----------------------------------------------------------------------------
+# test_command_channel.py
+# 作用：CommandDispatcher 的去重、运动指令合并、优先指令插队和发送失败后的重试。
+#       不连网络：队列规则在没有 start() 的发送器上检查，发送线程用假的 session。
+# 用法：python -m pytest tests
+# -----------------------------------------------------------------------------
+import requests
+
+from command_channel import CommandDispatcher
+
+
+class FakeSession:
+    """记录 post 的指令；fail 为 True 时模拟网络错误"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.commands = []
+
+    def post(self, url, json, timeout):
+        if self.fail:
+            raise requests.exceptions.ConnectionError("unreachable")
+        self.commands.append(json["command"])
+        return FakeResponse()
+
+    def close(self):
+        pass
+
+
+class FakeResponse:
+    def raise_for_status(self):
+        pass
+
+
+def queued(dispatcher):
+    return [command for _, command, _, _ in dispatcher._pending]
+
+
+def test_repeated_command_is_deduped_unless_forced():
+    dispatcher = CommandDispatcher("http://robot/command", verbose=False)
+    assert dispatcher.send("MOVE:FORWARD") == 1
+    assert dispatcher.send("MOVE:FORWARD") is None
+    assert dispatcher.send("MOVE:FORWARD", force=True) == 2
+
+
+def test_new_motion_replaces_unsent_motion_but_keeps_actions():
+    dispatcher = CommandDispatcher("http://robot/command", verbose=False)
+    dispatcher.send("TURN:LEFT")
+    dispatcher.send("FETCH:Coke")
+    dispatcher.send("MOVE:FORWARD")
+    assert queued(dispatcher) == ["FETCH:Coke", "MOVE:FORWARD"]
+    assert dispatcher.coalesced == 1
+
+
+def test_priority_commands_jump_ahead_in_order():
+    dispatcher = CommandDispatcher("http://robot/command", verbose=False)
+    dispatcher.send("FETCH:Coke")
+    dispatcher.send("TURN:LEFT")
+    dispatcher.send("STOP")
+    dispatcher.send("STATUS:Idle")
+    # 停止指令取代了没发出的运动指令，两条优先指令按入队顺序排在普通指令前面
+    assert queued(dispatcher) == ["STOP", "STATUS:Idle", "FETCH:Coke"]
+
+
+def test_failed_send_allows_the_same_command_again():
+    dispatcher = CommandDispatcher("http://robot/command", verbose=False)
+    dispatcher.session = FakeSession(fail=True)
+    dispatcher.start()
+    try:
+        dispatcher.send("MOVE:FORWARD")
+        assert dispatcher.flush()
+        assert dispatcher.failed == 1
+        dispatcher.session.fail = False
+        assert dispatcher.send("MOVE:FORWARD") is not None
+        assert dispatcher.flush()
+        assert dispatcher.session.commands == ["MOVE:FORWARD"]
+        assert dispatcher.last_acked_seq == 2
+    finally:
+        dispatcher.close()
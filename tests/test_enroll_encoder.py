@@ -0,0 +1,38 @@
+# -----------------------------------------------------------------------------
+# test_enroll_encoder.py
+# 作用：注册时把一个人的嵌入聚成原型（enroll_encoder.prototypes）。
+# 用法：python -m pytest tests
+# -----------------------------------------------------------------------------
+import numpy as np
+
+from enroll_encoder import prototypes, SAMPLES_PER_PROTOTYPE
+
+DIM = 128
+
+
+def clusters(centers, per_cluster, spread=0.01, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.concatenate([center + rng.normal(scale=spread, size=(per_cluster, DIM)) for center in centers])
+
+
+def test_few_samples_give_one_mean_prototype():
+    encodings = clusters(np.eye(2, DIM), per_cluster=SAMPLES_PER_PROTOTYPE - 1)
+    result = prototypes(encodings)
+    assert result.shape == (1, DIM)
+    assert np.allclose(result[0], encodings.mean(axis=0), atol=1e-6)
+
+
+def test_separate_poses_become_separate_prototypes():
+    centers = np.eye(3, DIM)
+    result = prototypes(clusters(centers, per_cluster=7), max_prototypes=3)
+    assert result.shape == (3, DIM)
+    # 每个原型都落在某个簇中心附近，且三个簇各有一个
+    nearest = [int(np.argmin(np.linalg.norm(centers - row, axis=1))) for row in result]
+    assert sorted(nearest) == [0, 1, 2]
+    assert np.linalg.norm(result - centers[nearest], axis=1).max() < 0.05
+
+
+def test_prototype_count_is_capped():
+    result = prototypes(clusters(np.eye(4, DIM), per_cluster=10), max_prototypes=2)
+    assert 1 <= len(result) <= 2
+    assert result.dtype == np.float32
@@ -0,0 +1,128 @@
+# -----------------------------------------------------------------------------
+# test_face_gallery.py
+# 作用：FaceGallery 的批量 top-k 查询、增量增删、近似模式，以及多原型的增删。
+# 用法：python -m pytest tests
+# -----------------------------------------------------------------------------
+import numpy as np
+
+from face_gallery import FaceGallery, APPROX_MIN_SIZE
+
+DIM = 8
+
+
+def vectors(*rows):
+    """每个参数是一行的第一个分量，其余分量为 0，距离就是第一个分量之差"""
+    data = np.zeros((len(rows), DIM), dtype=np.float32)
+    data[:, 0] = rows
+    return data
+
+
+def random_gallery(count, dim=DIM, seed=0, **kwargs):
+    rng = np.random.default_rng(seed)
+    data = rng.normal(size=(count, dim)).astype(np.float32)
+    gallery = FaceGallery(dim=dim, **kwargs)
+    for i, row in enumerate(data):
+        gallery.add(f"p{i}", row)
+    return gallery, {f"p{i}": row for i, row in enumerate(data)}
+
+
+def brute_force(database, query, k):
+    distances = sorted((float(np.linalg.norm(row - query)), name) for name, row in database.items())
+    return distances[:k]
+
+
+def test_batched_search_matches_brute_force():
+    gallery, database = random_gallery(200)
+    queries = np.random.default_rng(1).normal(size=(5, DIM)).astype(np.float32)
+
+    names, distances = gallery.search(queries, k=4)
+    for i, query in enumerate(queries):
+        expected = brute_force(database, query, 4)
+        assert names[i] == [name for _, name in expected]
+        assert np.allclose(distances[i], [d for d, _ in expected], atol=1e-4)
+
+
+def test_incremental_add_replace_and_remove():
+    gallery, database = random_gallery(50)
+    # 同名再次 add 是替换，不是新增一行
+    gallery.add("p3", vectors(100.0))
+    database["p3"] = vectors(100.0)[0]
+    for name in ("p0", "p10", "p49"):
+        assert gallery.remove(name)
+        del database[name]
+    assert len(gallery) == len(database) == 47
+    assert len(gallery.embeddings) == 47
+    assert "p10" not in gallery
+
+    query = np.random.default_rng(2).normal(size=DIM).astype(np.float32)
+    names, _ = gallery.search(query, k=5)
+    assert names[0] == [name for _, name in brute_force(database, query, 5)]
+    assert gallery.match(vectors(100.0)) == [("p3", 0.0)]
+
+
+def test_match_rejects_faces_beyond_tolerance():
+    gallery = FaceGallery(dim=DIM)
+    gallery.add("alice", vectors(0.0))
+    (name, distance), = gallery.match(vectors(0.7), tolerance=0.6)
+    assert name is None
+    assert np.isclose(distance, 0.7)
+    assert FaceGallery(dim=DIM).match(vectors(0.0)) == [(None, float("inf"))]
+
+
+def test_approximate_search_finds_nearest_stored_vector():
+    gallery, database = random_gallery(APPROX_MIN_SIZE, approximate=True, nprobe=4)
+    # 查询就是图库里的向量加一点噪声，最近的那个所在的簇一定会被搜索到
+    rng = np.random.default_rng(3)
+    names = list(database)
+    picked = [names[i] for i in rng.choice(len(names), 20, replace=False)]
+    queries = np.stack([database[name] for name in picked]) + rng.normal(scale=0.01, size=(20, DIM))
+    found, _ = gallery.search(queries.astype(np.float32), k=1)
+    assert gallery._centroids is not None
+    assert [row[0] for row in found] == picked
+
+
+def test_remove_multi_prototype_identity_keeps_other_rows():
+    gallery = FaceGallery(dim=DIM)
+    gallery.add("alice", vectors(0.0, 1.0, 2.0))
+    gallery.add("bob", vectors(10.0, 11.0))
+    gallery.add("carol", vectors(20.0))
+
+    assert gallery.remove("alice")
+    assert not gallery.remove("alice")
+    assert sorted(gallery.names) == ["bob", "carol"]
+    assert len(gallery.embeddings) == 3
+    # 被挪到空位上的行仍然属于原来的身份
+    names, distances = gallery.search(vectors(10.0, 11.0, 20.0), k=1)
+    assert names == [["bob"], ["bob"], ["carol"]]
+    assert np.allclose(distances, 0.0)
+
+
+def test_search_returns_distinct_identities():
+    gallery = FaceGallery(dim=DIM)
+    gallery.add("alice", vectors(0.0, 0.1, 0.2))   # 三个原型都比其他人近
+    gallery.add("bob", vectors(1.0, 5.0))
+    gallery.add("carol", vectors(3.0))
+
+    names, distances = gallery.search(vectors(0.0), k=3)
+    assert names == [["alice", "bob", "carol"]]
+    assert np.allclose(distances, [[0.0, 1.0, 3.0]])
+
+    # 候选身份不足 k 个时用 None / inf 补齐
+    names, distances = gallery.search(vectors(0.0), k=5)
+    assert names[0][3:] == [None, None]
+    assert np.isinf(distances[0, 3:]).all()
+
+
+def test_max_prototypes_shrinks_when_largest_identity_goes():
+    gallery = FaceGallery(dim=DIM)
+    gallery.add("alice", vectors(0.0, 1.0, 2.0, 3.0))
+    gallery.add("bob", vectors(10.0, 11.0))
+    assert gallery._max_prototypes == 4
+
+    gallery.remove("alice")
+    assert gallery._max_prototypes == 2
+
+    # 用更少的原型替换时也要收缩
+    gallery.add("bob", vectors(10.0))
+    assert gallery._max_prototypes == 1
+    assert gallery.match(vectors(10.0)) == [("bob", 0.0)]
@@ -0,0 +1,116 @@
+# -----------------------------------------------------------------------------
+# test_face_store.py
+# 作用：FaceStore 的追加写入、半行补齐、跨进程 refresh、删除同步和 compact。
+# 用法：python -m pytest tests
+# -----------------------------------------------------------------------------
+import os
+
+import numpy as np
+import pytest
+
+from face_gallery import FaceGallery
+from face_store import FaceStore
+
+DIM = 4
+
+
+def vectors(*rows):
+    data = np.zeros((len(rows), DIM), dtype=np.float32)
+    data[:, 0] = rows
+    return data
+
+
+def open_store(path):
+    return FaceStore(str(path), dim=DIM)
+
+
+def test_upsert_is_seen_by_another_store_after_refresh(tmp_path):
+    writer = open_store(tmp_path)
+    reader = open_store(tmp_path)
+    assert len(reader) == 0
+
+    writer.upsert("alice", vectors(1.0, 2.0), "Coke", num_samples=10)
+    assert reader.refresh()
+    assert not reader.refresh()     # 没有新的变化
+    assert reader.preference("alice") == "Coke"
+    assert np.array_equal(reader.embeddings("alice"), vectors(1.0, 2.0))
+
+    # 更新是追加新行，旧行不再被引用
+    writer.upsert("alice", vectors(3.0), "Tea")
+    assert reader.refresh()
+    assert reader.preference("alice") == "Tea"
+    assert np.array_equal(reader.embeddings("alice"), vectors(3.0))
+
+
+def test_torn_half_row_is_padded_before_appending(tmp_path):
+    store = open_store(tmp_path)
+    store.upsert("alice", vectors(1.0), "Coke")
+    # 模拟上次写入在一行中间中断
+    with open(store.embeddings_path, "ab") as f:
+        f.write(b"\x01" * (store.row_bytes // 2))
+
+    store.upsert("bob", vectors(2.0), "Tea")
+    assert os.path.getsize(store.embeddings_path) % store.row_bytes == 0
+    assert store.people["bob"]["rows"] == [2]
+    reopened = open_store(tmp_path)
+    assert np.array_equal(reopened.embeddings("alice"), vectors(1.0))
+    assert np.array_equal(reopened.embeddings("bob"), vectors(2.0))
+
+
+def test_remove_is_synced_out_of_the_gallery(tmp_path):
+    writer = open_store(tmp_path)
+    writer.upsert_many([("alice", vectors(1.0, 1.5), "Coke", None), ("bob", vectors(5.0), "Tea", None)])
+    reader = open_store(tmp_path)
+    gallery = reader.sync_gallery(FaceGallery(dim=DIM))
+    assert sorted(gallery.names) == ["alice", "bob"]
+
+    assert writer.remove("alice")
+    assert not writer.remove("alice")
+    assert reader.refresh()
+    reader.sync_gallery(gallery)
+    assert gallery.names == ["bob"]
+    assert len(gallery.embeddings) == 1
+    assert gallery.match(vectors(1.0))[0][0] is None
+
+
+def test_compact_keeps_every_identity(tmp_path):
+    store = open_store(tmp_path)
+    store.upsert_many([("alice", vectors(1.0, 1.5), "Coke", None),
+                       ("bob", vectors(2.0), "Tea", None),
+                       ("carol", vectors(3.0), "Milk", None)])
+    store.upsert("bob", vectors(2.5, 2.6, 2.7), "Tea")
+    store.remove("carol")
+    old_path = store.embeddings_path
+    expected = {name: np.array(store.embeddings(name)) for name in store.people}
+
+    store.compact()
+    assert store.embeddings_path != old_path
+    assert not os.path.exists(old_path)
+    assert os.path.getsize(store.embeddings_path) == 5 * store.row_bytes
+    reopened = open_store(tmp_path)
+    assert sorted(reopened.people) == ["alice", "bob"]
+    for name, rows in expected.items():
+        assert np.array_equal(reopened.embeddings(name), rows)
+
+    # 压缩之后继续追加写到新文件里
+    reopened.upsert("dave", vectors(4.0), "Juice")
+    assert np.array_equal(open_store(tmp_path).embeddings("dave"), vectors(4.0))
+
+
+def test_compact_crash_before_meta_swap_keeps_old_layout(tmp_path, monkeypatch):
+    store = open_store(tmp_path)
+    store.upsert("alice", vectors(1.0), "Coke")
+    store.upsert("bob", vectors(2.0), "Tea")
+    store.upsert("alice", vectors(1.5), "Coke")   # 第 0 行不再被引用，压缩后行号会变
+
+    def crash(*args, **kwargs):
+        raise OSError("simulated crash")
+
+    monkeypatch.setattr(FaceStore, "_write_meta", crash)
+    with pytest.raises(OSError):
+        store.compact()
+    monkeypatch.undo()
+
+    reopened = open_store(tmp_path)
+    assert np.array_equal(reopened.embeddings("alice"), vectors(1.5))
+    assert np.array_equal(reopened.embeddings("bob"), vectors(2.0))
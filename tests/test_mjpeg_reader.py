@@ -0,0 +1,100 @@
+# -----------------------------------------------------------------------------
+# test_mjpeg_reader.py
+# 作用：MJPEGReader 的分段解析（有 / 没有 Content-Length）和 chunked 解码，
+#       直接在 BytesIO 上解析，不需要网络。
+# 用法：python -m pytest tests
+# -----------------------------------------------------------------------------
+import io
+
+import pytest
+
+from mjpeg_reader import MJPEGReader, _Dechunked, READ_BUFFER_SIZE
+
+
+def part(payload, seq=None, length=True):
+    headers = b"Content-Type: image/jpeg\r\n"
+    if length:
+        headers += b"Content-Length: %d\r\n" % len(payload)
+    if seq is not None:
+        headers += b"X-Frame-Seq: %d\r\n" % seq
+    return b"--frame\r\n" + headers + b"\r\n" + payload + b"\r\n"
+
+
+def chunked(data, sizes):
+    """按 sizes 把 data 切成 chunk（最后一个带扩展参数），再加上结束块"""
+    out, start = b"", 0
+    for i, size in enumerate(sizes):
+        piece = data[start:start + size]
+        start += size
+        extension = b";name=value" if i == len(sizes) - 1 else b""
+        out += b"%x%s\r\n%s\r\n" % (len(piece), extension, piece)
+    assert start == len(data)
+    return out + b"0\r\n\r\n"
+
+
+def reader_over(body):
+    reader = MJPEGReader("http://pi:5000/video_feed")
+    reader._body = body
+    return reader
+
+
+def read_payload(reader, buffer):
+    buffer, length, headers = reader.read_part(buffer)
+    return bytes(buffer[:length]), headers
+
+
+def test_parts_with_content_length():
+    frames = [b"\xff\xd8first\xff\xd9", b"\xff\xd8" + b"x" * 100 + b"\xff\xd9"]
+    reader = reader_over(io.BytesIO(part(frames[0], seq=7) + part(frames[1], seq=8)))
+    buffer = bytearray(16)      # 比第二帧小，需要原地扩容
+
+    payload, headers = read_payload(reader, buffer)
+    assert payload == frames[0]
+    assert headers[b"x-frame-seq"] == b"7"
+    payload, headers = read_payload(reader, buffer)
+    assert payload == frames[1]
+    assert len(buffer) >= len(frames[1])
+    with pytest.raises(EOFError):
+        reader.read_part(buffer)
+
+
+def test_parts_without_content_length_end_at_the_next_delimiter():
+    frames = [b"\xff\xd8line1\nline2\xff\xd9", b"\xff\xd8second\xff\xd9"]
+    stream = part(frames[0], length=False) + part(frames[1], length=False) + b"--frame--\r\n"
+    reader = reader_over(io.BytesIO(stream))
+    buffer = bytearray(8)
+
+    assert read_payload(reader, buffer)[0] == frames[0]
+    assert reader._at_headers      # 已经读过了下一段的分隔行
+    assert read_payload(reader, buffer)[0] == frames[1]
+
+
+def test_dechunked_body_is_parsed_like_a_plain_one():
+    frames = [b"\xff\xd8" + bytes(range(256)) * 3 + b"\xff\xd9", b"\xff\xd8tail\xff\xd9"]
+    stream = part(frames[0], seq=1) + part(frames[1], seq=2)
+    # chunk 边界故意落在分段头、正文和分隔行中间
+    body = io.BufferedReader(_Dechunked(io.BytesIO(chunked(stream, [5, 40, 300, len(stream) - 345]))),
+                             READ_BUFFER_SIZE)
+    reader = reader_over(body)
+    buffer = bytearray(64)
+
+    assert read_payload(reader, buffer) == (frames[0], {b"content-type": b"image/jpeg",
+                                                        b"content-length": str(len(frames[0])).encode(),
+                                                        b"x-frame-seq": b"1"})
+    assert read_payload(reader, buffer)[0] == frames[1]
+    with pytest.raises(EOFError):
+        reader.read_part(buffer)
+
+
+def test_dechunked_stops_at_the_last_chunk():
+    raw = io.BytesIO(chunked(b"hello world", [5, 6]) + b"trailing bytes")
+    decoded = _Dechunked(raw)
+    assert io.BufferedReader(decoded).read() == b"hello world"
+    assert decoded.done
+
+
+def test_stream_closed_inside_a_frame():
+    data = part(b"\xff\xd8" + b"x" * 50 + b"\xff\xd9")
+    reader = reader_over(io.BytesIO(data[:-20]))
+    with pytest.raises(EOFError):
+        reader.read_part(bytearray(16))
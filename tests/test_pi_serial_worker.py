@@ -0,0 +1,123 @@
+# -----------------------------------------------------------------------------
+# test_pi_serial_worker.py
+# 作用：SerialWorker 的 STOP 优先、重复运动指令丢弃，以及按回显匹配 Arduino 应答
+#       （分几次收到的半行、调试输出、超时之后才到的应答）。用假串口，不需要 Arduino。
+# 用法：python -m pytest tests
+# -----------------------------------------------------------------------------
+import pi_serial_worker
+from pi_serial_worker import SerialWorker
+
+
+class FakeSerial:
+    """记录写入的指令；feed() 放进去的字节由 read() 按到达的多少返回"""
+
+    is_open = True
+
+    def __init__(self):
+        self.written = []
+        self._incoming = bytearray()
+
+    def write(self, data):
+        self.written.append(data.decode().strip())
+
+    def flush(self):
+        pass
+
+    def feed(self, data):
+        self._incoming += data
+
+    @property
+    def in_waiting(self):
+        return len(self._incoming)
+
+    def read(self, size):
+        data = bytes(self._incoming[:size])
+        del self._incoming[:size]
+        return data
+
+    def close(self):
+        pass
+
+
+def make_worker():
+    worker = SerialWorker("/dev/null")
+    worker.serial = FakeSerial()
+    return worker
+
+
+def drain(worker):
+    """像工作线程一样把队列里的指令全部发出去"""
+    while worker._poll():
+        pass
+
+
+def test_stop_jumps_the_queue_and_drops_pending_motion():
+    worker = make_worker()
+    forward = worker.submit("FORWARD")
+    fetch = worker.submit("FETCH:Coke")
+    worker.submit("STOP")
+    drain(worker)
+    assert worker.serial.written == ["STOP", "FETCH:Coke"]
+    assert worker.status(forward)["state"] == "dropped"
+    assert worker.status(fetch)["state"] == "sent"
+
+
+def test_repeated_motion_is_dropped_until_another_action_runs():
+    worker = make_worker()
+    worker.submit("FORWARD")
+    assert worker.status(worker.submit("FORWARD"))["state"] == "dropped"    # 已经在队列里
+    drain(worker)
+    assert worker.status(worker.submit("FORWARD"))["state"] == "dropped"    # 正是当前生效的运动
+    worker.submit("TURN_180")
+    drain(worker)
+    # 转身之后再前进不是重复指令
+    assert worker.status(worker.submit("FORWARD"))["state"] == "queued"
+    drain(worker)
+    assert worker.serial.written == ["FORWARD", "TURN_180", "FORWARD"]
+
+
+def test_reply_split_across_reads_is_buffered_until_newline():
+    worker = make_worker()
+    seq = worker.submit("FORWARD")
+    drain(worker)
+    worker.serial.feed(b"OK FOR")
+    worker._read_replies()
+    assert worker.status(seq)["state"] == "sent"
+    worker.serial.feed(b"WARD\r\n")
+    worker._read_replies()
+    record = worker.status(seq)
+    assert record["state"] == "acked"
+    assert record["reply"] == "OK FORWARD"
+
+
+def test_replies_are_matched_by_echo_not_by_order():
+    worker = make_worker()
+    forward = worker.submit("FORWARD")
+    fetch = worker.submit("FETCH:Coke")
+    drain(worker)
+    worker.serial.feed(b"debug: motors on\nDONE FETCH:Coke\n")
+    worker._read_replies()
+    assert worker.status(fetch)["state"] == "acked"
+    assert worker.status(forward)["state"] == "sent"
+    assert worker.unmatched == 1
+
+
+def test_late_reply_is_credited_to_the_expired_command(monkeypatch):
+    worker = make_worker()
+    first = worker.submit("LEFT")
+    drain(worker)
+    monkeypatch.setattr(pi_serial_worker, "ACK_TIMEOUT", 0.0)
+    worker._expire_in_flight()
+    monkeypatch.undo()
+    assert worker.status(first)["state"] == "timeout"
+
+    second = worker.submit("RIGHT")
+    drain(worker)
+    worker.serial.feed(b"OK LEFT\n")
+    worker._read_replies()
+    assert worker.status(first)["state"] == "late"
+    assert worker.status(second)["state"] == "sent"
+    assert worker.late == 1
+    worker.serial.feed(b"OK RIGHT\n")
+    worker._read_replies()
+    assert worker.status(second)["state"] == "acked"
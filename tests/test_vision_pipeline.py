@@ -0,0 +1,124 @@
+# -----------------------------------------------------------------------------
+# test_vision_pipeline.py
+# 作用：VisionPipeline 主进程一侧的结果重排、超时跳过和工作进程退出。
+#       不启动工作进程：测试代替工作进程从任务队列取帧、往结果队列放结果。
+# 用法：python -m pytest tests
+# -----------------------------------------------------------------------------
+import numpy as np
+
+from frame_grabber import FrameInfo
+from vending_state_machine import NEEDS_FACES
+from vision_pipeline import VisionPipeline
+
+TIMEOUT = 0.2
+
+
+class FakeProcess:
+    def __init__(self):
+        self.alive = True
+        self.exitcode = None
+
+    def is_alive(self):
+        return self.alive
+
+
+def make_pipeline(workers=2, slots=4):
+    pipeline = VisionPipeline(None, "face_db", "best.pt", "hog", workers=workers, slots=slots)
+    pipeline.shape = (4, 4, 3)
+    pipeline._frames = [np.zeros(pipeline.shape, dtype=np.uint8) for _ in range(slots)]
+    for slot in range(slots):
+        pipeline._free_slots.put(slot)
+    pipeline._processes = [FakeProcess() for _ in range(workers)]
+    pipeline._live = list(range(workers))
+    return pipeline
+
+
+def submit(pipeline, needs=NEEDS_FACES):
+    slot = pipeline._free_slots.get_nowait()
+    assert pipeline._submit(slot, FrameInfo(0, 0.0, 0.0, 0), needs, None)
+    return slot
+
+
+def work(pipeline, worker, faces=()):
+    """代替工作进程处理一帧，返回它的 seq"""
+    seq, slot, kind, target = pipeline._tasks[worker].get(timeout=1.0)
+    pipeline._results.put((seq, {"faces": list(faces)}, {}))
+    return seq
+
+
+def free_slots(pipeline):
+    return pipeline._free_slots.qsize()
+
+
+def test_results_are_returned_in_frame_order():
+    pipeline = make_pipeline()
+    submit(pipeline)            # seq 1 -> 工作进程 0
+    submit(pipeline)            # seq 2 -> 工作进程 1
+    submit(pipeline, needs=None)    # seq 3 不需要推理，直接进结果队列
+    assert work(pipeline, 1, ["bob"]) == 2
+    assert work(pipeline, 0, ["alice"]) == 1
+
+    first, _ = pipeline.next_result(TIMEOUT)
+    second, _ = pipeline.next_result(TIMEOUT)
+    third, _ = pipeline.next_result(TIMEOUT)
+    assert [first.seq, second.seq, third.seq] == [1, 2, 3]
+    assert first.faces == ["alice"] and second.faces == ["bob"]
+    assert third.faces is None
+
+
+def test_timed_out_slot_is_held_until_the_late_result_arrives():
+    pipeline = make_pipeline()
+    held = submit(pipeline)     # seq 1，工作进程 0 迟迟不回
+    submit(pipeline)            # seq 2
+    work(pipeline, 1)
+
+    result, _ = pipeline.next_result(TIMEOUT)
+    assert result.seq == 2
+    assert pipeline.skipped == 1
+    pipeline.release(result)
+    # 工作进程 0 可能还在读 seq 1 的槽位，不能交给抓帧线程
+    assert free_slots(pipeline) == 3
+    assert held not in list(pipeline._free_slots.queue)
+
+    work(pipeline, 0)           # 迟到的结果
+    pipeline._ended = True
+    assert pipeline.next_result(TIMEOUT) == (None, None)
+    assert free_slots(pipeline) == 4
+    assert not pipeline._abandoned
+
+
+def test_dead_worker_is_dropped_and_its_frames_are_not_waited_for():
+    pipeline = make_pipeline()
+    submit(pipeline)            # seq 1 -> 工作进程 0，它随后退出
+    submit(pipeline)            # seq 2 -> 工作进程 1
+    pipeline._processes[0].alive = False
+    work(pipeline, 1, ["bob"])
+
+    first, _ = pipeline.next_result(TIMEOUT)
+    second, _ = pipeline.next_result(TIMEOUT)
+    assert (first.seq, first.faces) == (1, None)    # 补上的空结果，不算跳过
+    assert (second.seq, second.faces) == (2, ["bob"])
+    assert pipeline.skipped == 0
+    assert pipeline._live == [1]
+
+    # 之后的帧只分给还活着的进程
+    submit(pipeline)
+    submit(pipeline)
+    assert [pipeline._tasks[1].get(timeout=1.0)[0] for _ in range(2)] == [3, 4]
+    pipeline._processes[1].alive = False
+    assert not pipeline._submit(0, FrameInfo(0, 0.0, 0.0, 0), NEEDS_FACES, None)
+
+
+def test_slot_of_a_skipped_frame_is_freed_when_its_worker_dies():
+    pipeline = make_pipeline()
+    submit(pipeline)            # seq 1 -> 工作进程 0
+    submit(pipeline)            # seq 2 -> 工作进程 1
+    work(pipeline, 1)
+    result, _ = pipeline.next_result(TIMEOUT)
+    pipeline.release(result)
+    assert free_slots(pipeline) == 3
+
+    pipeline._processes[0].alive = False
+    pipeline._ended = True
+    assert pipeline.next_result(TIMEOUT) == (None, None)
+    assert free_slots(pipeline) == 4
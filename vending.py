@@ -0,0 +1,113 @@
+# -----------------------------------------------------------------------------
+# vending.py
+# 作用：项目的统一入口。
+#       - 命令行：python -m vending enroll | client | fleet | server，启动时打印各阶段耗时；
+#       - 组件按需导入：import vending 之后 vending.FaceStore、vending.VendingStateMachine 等
+#         在第一次访问时才导入对应模块。所有模块导入时都不加载模型、不打开摄像头/串口、不连网络，
+#         工具、基准测试可以只导入需要的部分；
+#       - python -m vending imports：逐个导入组件模块并打印耗时，检查有没有模块在导入时做了重活。
+# 用法：python -m vending client --local
+#       python -m vending server --port 5000
+# -----------------------------------------------------------------------------
+import argparse
+import importlib
+import time
+
+# 组件名 -> (模块, 属性)；属性为 None 表示模块本身
+COMPONENTS = {
+    "metrics": ("metrics", None),
+    "model_registry": ("model_registry", None),
+    "FaceStore": ("face_store", "FaceStore"),
+    "FaceGallery": ("face_gallery", "FaceGallery"),
+    "MultiScaleFaceDetector": ("face_detector", "MultiScaleFaceDetector"),
+    "FaceTracker": ("face_tracker", "FaceTracker"),
+    "DrinkDetectionScheduler": ("drink_detector", "DrinkDetectionScheduler"),
+    "load_drink_model": ("drink_backends", "load_drink_model"),
+    "build_local_perception": ("perception", "build_local_perception"),
+    "VendingStateMachine": ("vending_state_machine", "VendingStateMachine"),
+    "VisionPipeline": ("vision_pipeline", "VisionPipeline"),
+    "PipelinePerception": ("vision_pipeline", "PipelinePerception"),
+    "MJPEGFrameGrabber": ("mjpeg_reader", "MJPEGFrameGrabber"),
+    "LatestFrameGrabber": ("frame_grabber", "LatestFrameGrabber"),
+    "CommandDispatcher": ("command_channel", "CommandDispatcher"),
+    "MotionGate": ("motion", "MotionGate"),
+    "FrameBroadcaster": ("pi_camera_stream", "FrameBroadcaster"),
+    "SerialWorker": ("pi_serial_worker", "SerialWorker"),
+}
+
+# 子命令 -> (模块, 说明)；模块里的 main() 就是入口
+COMMANDS = {
+    "enroll": ("01_enroll_faces", "capture face samples and enroll a new customer (PC)"),
+    "client": ("pc_recognition_client", "run the recognition client for one robot (PC)"),
+    "fleet": ("multi_robot_client", "run one client for all robots in ROBOTS (PC)"),
+    "server": ("pi_robot_server", "run the video and command server (Raspberry Pi)"),
+}
+
+# imports 子命令检查的模块，依赖少的在前
+MODULES = ("metrics", "model_registry", "face_gallery", "face_store", "motion", "frame_grabber",
+           "mjpeg_reader", "command_channel", "face_detector", "face_tracker", "drink_detector",
+           "drink_backends", "enroll_encoder", "perception", "vending_state_machine", "vision_pipeline",
+           "pc_recognition_client", "multi_robot_client", "pi_camera_stream", "pi_serial_worker",
+           "pi_robot_server")
+
+
+def __getattr__(name):
+    """import vending 之后第一次访问某个组件时才导入它所在的模块"""
+    if name not in COMPONENTS:
+        raise AttributeError(f"module 'vending' has no attribute '{name}'")
+    module_name, attribute = COMPONENTS[name]
+    module = importlib.import_module(module_name)
+    value = module if attribute is None else getattr(module, attribute)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(COMPONENTS))
+
+
+def import_times(modules=MODULES):
+    """按顺序导入每个模块，返回 {模块: 毫秒或缺少的依赖}；共用的第三方库算在第一个导入它的模块上"""
+    times = {}
+    for name in modules:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            times[name] = f"skipped ({e})"
+            continue
+        times[name] = (time.perf_counter() - start) * 1000
+    return times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m vending", description="Smart vending robot entry points.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for command, (_, help_text) in COMMANDS.items():
+        sub.add_parser(command, help=help_text)
+    sub.choices["client"].add_argument("--local", action="store_true",
+                                       help="run all inference in the main thread instead of worker processes")
+    sub.choices["server"].add_argument("--host", default="0.0.0.0")
+    sub.choices["server"].add_argument("--port", type=int, default=5000)
+    sub.add_parser("imports", help="time importing every module (none of them should load models or hardware)")
+    args = parser.parse_args(argv)
+
+    if args.command == "imports":
+        for name, result in import_times().items():
+            print(f"[INFO] import {name:22s} {result if isinstance(result, str) else f'{result:6.1f}ms'}")
+        return
+
+    import metrics
+    with metrics.phase("import"):
+        module = importlib.import_module(COMMANDS[args.command][0])
+    if args.command == "client" and args.local:
+        module.USE_VISION_PIPELINE = False
+    if args.command == "server":
+        module.main(args.host, args.port)
+    else:
+        module.main()
+
+
+# 客户端的多进程流水线用 spawn 启动工作进程，工作进程会重新导入这个文件，所以入口必须放在这个判断里
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# -----------------------------------------------------------------------------
+# vending_state_machine.py
+# 作用：售货机器人的控制状态机。每来一帧调用一次 step()，感知交给 perception，
+#       指令交给 send_command，不直接依赖摄像头、网络或窗口，可以在无界面的基准测试中运行。
+# -----------------------------------------------------------------------------
+import time
+
+APPROACH_BOX_HEIGHT_TARGET = 250 # 当饮料的包围盒高度达到这个像素值（原图分辨率）时，认为已经足够近
+FETCH_DURATION = 5               # 秒，假设抓取需要5秒
+RETURN_DURATION = 3              # 秒，机器人后退返回的时间
+TURN_180_DURATION = 2            # 秒，机器人原地180度转身需要的时间
+SETTLE_DURATION = 0.5            # 秒，停止旋转后等待机器人稳定
+
+# 每个状态需要哪种感知结果，多进程流水线据此决定把帧送给哪类工作进程；计时状态什么都不需要
+NEEDS_FACES = "faces"
+NEEDS_DRINK = "drink"
+STATE_NEEDS = {
+    "SEARCHING_PERSON": NEEDS_FACES,
+    "ROTATING_TO_FIND_DRINK": NEEDS_DRINK,
+    "APPROACHING_DRINK": NEEDS_DRINK,
+}
+
+
+class VendingStateMachine:
+    """
+    perception 需要提供 identify(frame)、find_drink(frame, drink_name)、preference(name)、reset()；
+    send_command(command, force_send=False) 负责把指令发给机器人。
+    frame_scale：送进来的帧是原图的几分之一（例如按 1/2 解码时为 2），框的尺寸乘上它再和像素阈值比较。
+    """
+
+    def __init__(self, perception, send_command, clock=time.time, sleep=time.sleep, frame_scale=1):
+        self.perception = perception
+        self.send_command = send_command
+        self.frame_scale = frame_scale
+        self.clock = clock
+        self.sleep = sleep
+        self.state = "SEARCHING_PERSON"
+        self.target_person_name = ""
+        self.target_drink_name = ""
+        self.action_timer_start = 0
+        self.last_drink_box = None
+
+    @property
+    def needs(self):
+        """当前状态需要的感知结果：NEEDS_FACES、NEEDS_DRINK 或 None"""
+        return STATE_NEEDS.get(self.state)
+
+    def step(self, frame):
+        """处理一帧，返回处理后的状态"""
+        # --- 状态一：寻找已注册用户 ---
+        if self.state == "SEARCHING_PERSON":
+            self.send_command("STATUS:Idle") # 确保小车在找人时是静止的
+            for name in self.perception.identify(frame):
+                self.target_person_name = name
+                self.target_drink_name = self.perception.preference(name)
+
+                print(f"\n[STATE CHANGE] Found {self.target_person_name}, who wants {self.target_drink_name}.")
+                self.state = "ROTATING_TO_FIND_DRINK"
+                self.perception.reset() # 下次回到找人状态时重新开始跟踪
+                break
+
+        # --- 状态二：原地旋转寻找饮料 ---
+        elif self.state == "ROTATING_TO_FIND_DRINK":
+            self.send_command("TURN:LEFT") # 持续发送左转指令
+            box = self.perception.find_drink(frame, self.target_drink_name)
+            self.last_drink_box = box
+            if box is not None:
+                print(f"\n[STATE CHANGE] Found {self.target_drink_name}! Now stopping rotation and preparing to approach.")
+                self.send_command("STATUS:Idle", force_send=True) # 立即停止旋转
+                self.sleep(SETTLE_DURATION) # 等待机器人稳定
+                self.state = "APPROACHING_DRINK" # 切换到前进状态
+
+        # --- 状态三：向饮料前进 ---
+        elif self.state == "APPROACHING_DRINK":
+            self.send_command("MOVE:FORWARD") # 持续发送前进指令
+            box = self.perception.find_drink(frame, self.target_drink_name)
+            self.last_drink_box = box
+            if box is None: # 如果前进时丢失目标，则退回旋转寻找状态
+                print("[WARN] Lost sight of the drink while approaching. Returning to rotation search.")
+                self.state = "ROTATING_TO_FIND_DRINK"
+            elif (box[3] - box[1]) * self.frame_scale >= APPROACH_BOX_HEIGHT_TARGET: # 检查是否足够近
+                print(f"\n[STATE CHANGE] Reached {self.target_drink_name}. Preparing to fetch.")
+                self.send_command(f"FETCH:{self.target_drink_name}", force_send=True)
+                self.action_timer_start = self.clock() # 启动抓取计时器
+                self.state = "FETCHING_DRINK"
+
+        # --- 状态四：执行抓取 (计时器状态) ---
+        elif self.state == "FETCHING_DRINK":
+            # 这是一个延时状态，等待机器人物理抓取动作完成
+            if self.clock() - self.action_timer_start > FETCH_DURATION:
+                print(f"\n[STATE CHANGE] Fetch complete. Returning to user.")
+                self.action_timer_start = self.clock() # 重置计时器用于返回
+                self.state = "RETURNING_TO_USER"
+
+        # --- 状态五：后退返回 (计时器状态) ---
+        elif self.state == "RETURNING_TO_USER":
+            self.send_command("MOVE:BACKWARD")
+            if self.clock() - self.action_timer_start > RETURN_DURATION:
+                print(f"\n[STATE CHANGE] Returned to start position. Turning to face user.")
+                self.action_timer_start = self.clock() # 重置计时器用于转身
+                self.state = "TURNING_TO_USER"
+
+        # --- 状态六：转身面向用户 (计时器状态) ---
+        elif self.state == "TURNING_TO_USER":
+            self.send_command("TURN:LEFT") # 可以是左转或右转
+            if self.clock() - self.action_timer_start > TURN_180_DURATION:
+                print(f"\n[STATE CHANGE] Task fully complete! Ready for next person.")
+                self.send_command("STATUS:Idle", force_send=True)
+                self.state = "SEARCHING_PERSON" # 回到初始状态
+
+        return self.state
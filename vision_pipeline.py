@@ -0,0 +1,457 @@
+# -----------------------------------------------------------------------------
+# vision_pipeline.py
+# 作用：多进程视觉流水线。抓帧线程把最新一帧拷进共享内存槽位，只把槽位编号发给工作进程
+#       （不 pickle 整张图）。每个工作进程都加载人脸和饮料两套模型，状态机当前需要什么
+#       （找人 / 找饮料 / 都不需要），就让所有进程做什么，核数都用在当前需要的那种推理上。
+#       帧按轮转分给各进程，每个进程里有自己的人脸跟踪器：只在关键帧上检测+编码，
+#       中间帧用光流移动人脸框（跟踪的是间隔 N 帧的子序列，N 为进程数）。结果按帧序重新排好再交给状态机。
+# -----------------------------------------------------------------------------
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import metrics
+from face_tracker import KEYFRAME_INTERVAL, REVERIFY_INTERVAL
+from vending_state_machine import NEEDS_FACES, NEEDS_DRINK
+
+RESULT_TIMEOUT = 5.0        # 秒，等待某一帧结果的最长时间，超时就跳过这一帧
+FIRST_FRAME_TIMEOUT = 10.0
+WORKER_THREADS = 1          # 每个工作进程的推理线程数；多个进程各开一整套线程池会互相抢 CPU
+
+
+def default_workers():
+    """工作进程数：留一个核给抓帧和状态机"""
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+# seq：流水线内部的连续序号；slot：共享内存槽位；info：抓帧时的 FrameInfo；
+# faces：识别出的名字列表（没做人脸识别时为 None）；drinks：{类别小写: (x1, y1, x2, y2)}（没做检测时为 None）；
+# timings：工作进程里各阶段的耗时（秒）；submitted：送进流水线的 perf_counter 时间
+FrameResult = namedtuple("FrameResult", ["seq", "slot", "info", "faces", "drinks", "timings", "submitted"])
+
+
+# --- 工作进程 ---
+class _Stages:
+    """记录工作进程里每一帧各阶段的耗时：timed() 包装的函数把耗时累加到当前帧的 timings"""
+
+    def __init__(self):
+        self.timings = {}
+
+    def timed(self, name, fn):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+        return wrapper
+
+
+def _limit_threads():
+    """OpenCV / PyTorch 默认按核数开线程池，N 个工作进程各开一套就会互相抢 CPU"""
+    os.environ.setdefault("OMP_NUM_THREADS", str(WORKER_THREADS))
+    import cv2
+    cv2.setNumThreads(WORKER_THREADS)
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(WORKER_THREADS)
+
+
+def _face_analyzer(config, stages):
+    """返回 (analyze, reset)：人脸检测 -> 编码 -> 比对，关键帧之间用光流跟踪"""
+    import cv2
+    import model_registry
+    from face_detector import MultiScaleFaceDetector
+    from face_gallery import FaceGallery
+    from face_store import FaceStore
+    from face_tracker import FaceTracker
+
+    face_recognition = model_registry.get_face_models(config["face_detection_model"])
+    detector = MultiScaleFaceDetector(model=config["face_detection_model"])
+    store = FaceStore(config["store_dir"])
+    gallery = store.sync_gallery(FaceGallery())
+    tracker = FaceTracker(
+        detect_fn=stages.timed("face.face_locations", detector.detect),
+        encode_fn=stages.timed("face.face_encodings", face_recognition.face_encodings),
+        match_fn=stages.timed("face.match", lambda encodings: gallery.match(encodings, tolerance=config["tolerance"])),
+        keyframe_interval=config["keyframe_interval"],
+        reverify_interval=config["reverify_interval"],
+    )
+    to_rgb = stages.timed("face.cvtColor", cv2.cvtColor)
+    track = stages.timed("face.track", tracker.update)
+    last_check = time.time()
+
+    def analyze(frame, target):
+        nonlocal last_check
+        if time.time() - last_check > config["store_refresh_interval"]:
+            last_check = time.time()
+            if store.refresh():
+                store.sync_gallery(gallery)
+        tracks = track(to_rgb(frame, cv2.COLOR_BGR2RGB))
+        return {"faces": [t.name for t in tracks if t.name is not None]}
+
+    return analyze, tracker.reset
+
+
+def _drink_analyzer(config, stages):
+    """返回 (analyze, reset)：只检测目标饮料，在上一个框周围的 ROI 上推理，两次推理之间用光流跟踪框"""
+    from drink_backends import load_exported
+    from drink_detector import DrinkDetectionScheduler
+
+    # 主进程已经导出好了，这里只加载；各进程同时导出会互相覆盖同一个目标文件
+    model = load_exported(config["drink_model_path"], config["drink_backend"], config["drink_imgsz"])
+    scheduler = DrinkDetectionScheduler(model, imgsz=config["drink_imgsz"])
+    detect = stages.timed("drink.detect", scheduler.detect)
+
+    def analyze(frame, target):
+        if not target:
+            return {"drinks": {}}
+        box = detect(frame, target)
+        return {"drinks": {target.lower(): box} if box is not None else {}}
+
+    return analyze, scheduler.reset
+
+
+_ANALYZERS = {NEEDS_FACES: _face_analyzer, NEEDS_DRINK: _drink_analyzer}
+
+
+def _worker(index, config, slot_names, shape, tasks, results):
+    """工作进程入口：从 tasks 取 (seq, slot, kind, target)，在共享内存上原地推理，把结果放进 results"""
+    _limit_threads()
+    blocks = [shared_memory.SharedMemory(name=name) for name in slot_names]
+    frames = [np.ndarray(shape, dtype=np.uint8, buffer=block.buf) for block in blocks]
+    stages = _Stages()
+    analyzers = {kind: factory(config, stages) for kind, factory in _ANALYZERS.items()}
+    results.put(("ready", index, os.getpid()))
+    last_kind = None
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            seq, slot, kind, target = task
+            if kind != last_kind:
+                # 状态切换了（例如找到人之后开始找饮料），之前的跟踪结果作废
+                for _, reset in analyzers.values():
+                    reset()
+                last_kind = kind
+            stages.timings = timings = {}
+            try:
+                output = analyzers[kind][0](frames[slot], target)
+            except Exception as e:
+                print(f"[PC WARN] {kind} worker {index} failed on frame {seq}: {e}")
+                output = {}
+            results.put((seq, output, timings))
+    finally:
+        del frames
+        for block in blocks:
+            block.close()
+
+
+# --- 主进程 ---
+class VisionPipeline:
+    """
+    grabber 需要提供 read(timeout) -> (ret, frame, info)，例如 MJPEGFrameGrabber 或 LatestFrameGrabber。
+    用法：pipeline.start()；循环里 result, frame = pipeline.next_result()，用完调用 pipeline.release(result)。
+    """
+
+    def __init__(self, grabber, store_dir, yolo_model_path, face_detection_model, tolerance=0.6,
+                 store_refresh_interval=2.0, workers=None, slots=None, motion_gate=None,
+                 keyframe_interval=KEYFRAME_INTERVAL, reverify_interval=REVERIFY_INTERVAL):
+        self.grabber = grabber
+        self.motion_gate = motion_gate  # 找人时画面静止就不送去推理
+        self.workers = workers or default_workers()
+        # 槽位数 = 所有工作进程都在忙时还能再排一帧，再加上状态机手里的一帧
+        self.num_slots = slots or self.workers + 2
+        self.config = {
+            "store_dir": store_dir,
+            "yolo_model_path": yolo_model_path,
+            "face_detection_model": face_detection_model,
+            "tolerance": tolerance,
+            "store_refresh_interval": store_refresh_interval,
+            "keyframe_interval": keyframe_interval,
+            "reverify_interval": reverify_interval,
+        }
+        self.needs = NEEDS_FACES
+        self.target = None          # 目标饮料，饮料检测只检测这个类别
+        self._ctx = mp.get_context("spawn")    # dlib / torch 的线程在 fork 之后不安全
+        # 每个进程一个任务队列：帧按轮转分配，每个进程的跟踪器看到的是一个固定间隔的子序列
+        self._tasks = [self._ctx.Queue() for _ in range(self.workers)]
+        self._live = []             # 还活着的工作进程编号，帧在它们之间轮转
+        self._next_worker = 0
+        self._results = self._ctx.Queue()
+        self._free_slots = queue.Queue()
+        self._blocks = []
+        self._frames = []
+        self._infos = {}            # seq -> (slot, FrameInfo, 送入时间)
+        self._pending = {}          # 提前到达、还没轮到的结果
+        self._assigned = {}         # seq -> 正在处理它的工作进程编号（结果还没回来）
+        self._abandoned = {}        # seq -> 槽位：已经跳过、但工作进程可能还在读的帧，结果回来或进程退出后才归还
+        self._next_seq = 1
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._processes = []
+        self._running = False
+        self._thread = None
+        self._ended = False
+        self.submitted = 0
+        self.skipped = 0
+
+    def start(self):
+        ret, frame, info = self.grabber.read(timeout=FIRST_FRAME_TIMEOUT)
+        if not ret:
+            raise RuntimeError("No frame received from the video stream.")
+        self.shape = frame.shape
+        for _ in range(self.num_slots):
+            block = shared_memory.SharedMemory(create=True, size=frame.nbytes)
+            self._blocks.append(block)
+            self._frames.append(np.ndarray(frame.shape, dtype=np.uint8, buffer=block.buf))
+        for slot in range(self.num_slots):
+            self._free_slots.put(slot)
+
+        # 饮料模型在这里导出一次（后端由 DRINK_BACKEND 等环境变量选择），工作进程直接加载导出结果
+        from drink_backends import export, DEFAULT_BACKEND, DEFAULT_IMGSZ, DEFAULT_INT8
+        self.config.update(drink_model_path=export(self.config["yolo_model_path"], DEFAULT_BACKEND,
+                                                   DEFAULT_IMGSZ, DEFAULT_INT8),
+                           drink_backend=DEFAULT_BACKEND, drink_imgsz=DEFAULT_IMGSZ)
+        slot_names = [block.name for block in self._blocks]
+        for i, tasks in enumerate(self._tasks):
+            process = self._ctx.Process(target=_worker, name=f"vision-worker-{i}", daemon=True,
+                                        args=(i, self.config, slot_names, self.shape, tasks, self._results))
+            process.start()
+            self._processes.append(process)
+        self._live = list(range(self.workers))
+        # 等所有工作进程加载完模型，第一帧不会因为模型初始化而超时
+        ready = 0
+        while ready < len(self._processes):
+            try:
+                self._results.get(timeout=1.0)
+                ready += 1
+            except queue.Empty:
+                if not all(p.is_alive() for p in self._processes):
+                    self.close()
+                    raise RuntimeError("A vision worker exited while loading models.")
+        print(f"[PC INFO] Vision pipeline ready: {self.workers} workers (face + drink models each), "
+              f"{self.num_slots} shared frame slots.")
+
+        self._running = True
+        self._thread = threading.Thread(target=self._dispatch, name="pipeline-dispatch", daemon=True)
+        self._thread.start()
+        return self
+
+    def set_needs(self, needs, target=None):
+        """之后的帧送去哪里：NEEDS_FACES、NEEDS_DRINK 或 None（不做推理，只按顺序转交）"""
+        self.needs = needs
+        self.target = target
+
+    def _dispatch(self):
+        while self._running:
+            # 先拿到空闲槽位再取帧，保证送进流水线的总是最新画面
+            try:
+                slot = self._free_slots.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            ret, frame, info = self.grabber.read(timeout=RESULT_TIMEOUT)
+            if not ret:
+                self._free_slots.put(slot)
+                if self.grabber.ended:
+                    self._ended = True
+                    self._results.put(None)
+                    break
+                continue
+            if frame.shape != self.shape:
+                print(f"[PC WARN] Frame size changed to {frame.shape}, skipping frame.")
+                self._free_slots.put(slot)
+                continue
+            with metrics.timer("pipeline.copy"):
+                np.copyto(self._frames[slot], frame)
+            needs, target = self.needs, self.target
+            if needs == NEEDS_FACES and self.motion_gate is not None \
+                    and not self.motion_gate.should_process(frame, info.motion):
+                needs = None
+                metrics.count("motion.skipped")
+            if not self._submit(slot, info, needs, target):
+                print("[PC ERROR] All vision workers have exited, stopping the pipeline.")
+                self._ended = True
+                self._results.put(None)
+                break
+
+    def _submit(self, slot, info, needs, target):
+        """给一帧编号并交给下一个活着的工作进程（不需要推理的帧直接放进结果队列）；工作进程全部退出时返回 False"""
+        if needs in _ANALYZERS:
+            self._check_workers()
+            if not self._live:
+                return False
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            self._infos[seq] = (slot, info, time.perf_counter())
+            if needs in _ANALYZERS:
+                worker = self._live[self._next_worker % len(self._live)]
+                self._next_worker = (self._next_worker + 1) % len(self._live)
+                self._assigned[seq] = worker
+        self.submitted += 1
+        if needs in _ANALYZERS:
+            self._tasks[worker].put((seq, slot, needs, target))
+        else:
+            self._results.put((seq, {}, {}))
+        return True
+
+    def _check_workers(self):
+        """
+        把已经退出的工作进程移出轮转，返回有没有发现新退出的进程。
+        分给它们、还没回结果的帧直接补一个空结果，按顺序交给状态机，不再等 RESULT_TIMEOUT；
+        已经跳过的帧的槽位这时才能安全归还。
+        """
+        with self._lock:
+            dead = [i for i in self._live if not self._processes[i].is_alive()]
+            if not dead:
+                return False
+            self._live = [i for i in self._live if i not in dead]
+            lost = [seq for seq, worker in self._assigned.items() if worker in dead]
+            for seq in lost:
+                del self._assigned[seq]
+            freed = [self._abandoned.pop(seq) for seq in lost if seq in self._abandoned]
+            missing = [seq for seq in lost if seq in self._infos]
+        for i in dead:
+            print(f"[PC WARN] Vision worker {i} exited (code {self._processes[i].exitcode}), "
+                  f"{len(self._live)} workers left.")
+        for seq in missing:
+            self._results.put((seq, {}, {}))
+        for slot in freed:
+            self._free_slots.put(slot)
+        return True
+
+    def next_result(self, timeout=RESULT_TIMEOUT):
+        """按帧序返回下一帧的 (FrameResult, frame)；视频流结束时返回 (None, None)"""
+        while True:
+            output = self._pending.pop(self._next_seq, None)
+            if output is not None:
+                seq = self._next_seq
+                self._next_seq += 1
+                with self._lock:
+                    slot, info, submitted = self._infos.pop(seq)
+                data, timings = output
+                result = FrameResult(seq, slot, info, data.get("faces"), data.get("drinks"), timings, submitted)
+                return result, self._frames[slot]
+            try:
+                item = self._results.get(timeout=timeout)
+            except queue.Empty:
+                if not self._skip_missing():
+                    return None, None
+                continue
+            if item is None:
+                if not self._pending and self._next_seq > self._seq:
+                    return None, None
+                continue
+            seq, data, timings = item
+            with self._lock:
+                self._assigned.pop(seq, None)
+                slot = self._abandoned.pop(seq, None)
+            if slot is not None:
+                # 已经被跳过的帧迟到的结果：丢掉结果，工作进程用完了这个槽位，现在才能归还
+                self._free_slots.put(slot)
+            elif seq >= self._next_seq:
+                self._pending[seq] = (data, timings)
+
+    def _skip_missing(self):
+        """下一帧的结果迟迟不来，跳过它，避免整个流水线卡住"""
+        if self._check_workers():
+            return True     # 是工作进程退出了：它的帧已经补上了空结果
+        with self._lock:
+            seq = self._next_seq
+            entry = self._infos.pop(seq, None)
+            held = entry is not None and seq in self._assigned
+            if held:
+                # 工作进程可能还在读这个槽位，现在归还的话抓帧线程会往里写新画面，弄坏正在做的推理
+                self._abandoned[seq] = entry[0]
+        if entry is None:
+            return not self._ended
+        print(f"[PC WARN] Frame {seq} timed out in the pipeline, skipping.")
+        if not held:
+            self._free_slots.put(entry[0])
+        self._next_seq += 1
+        self.skipped += 1
+        return True
+
+    def release(self, result):
+        """状态机用完这一帧后归还槽位"""
+        metrics.observe("pipeline.latency", time.perf_counter() - result.submitted)
+        self._free_slots.put(result.slot)
+
+    def stats(self):
+        return {
+            "needs": self.needs,
+            "submitted": self.submitted,
+            "skipped": self.skipped,
+            "in_flight": self.num_slots - self._free_slots.qsize(),
+            "abandoned": len(self._abandoned),
+            "workers_alive": sum(p.is_alive() for p in self._processes),
+        }
+
+    def close(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        for tasks in self._tasks:
+            tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=2.0)
+            if process.is_alive():
+                process.terminate()
+        self._frames = []
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+
+class PipelinePerception:
+    """
+    把流水线算好的结果包装成状态机需要的感知接口；每一帧 step 之前先调用 use(result)。
+    store_refresh_interval 为 None 时不刷新 store，由共享这个 store 的调用方负责刷新。
+    """
+
+    def __init__(self, store, store_refresh_interval=2.0):
+        self.store = store
+        self.store_refresh_interval = store_refresh_interval
+        self._last_store_check = time.time()
+        self.result = None
+
+    def use(self, result):
+        self.result = result
+        for name, seconds in result.timings.items():
+            metrics.observe(name, seconds)
+        if self.store_refresh_interval is not None \
+                and time.time() - self._last_store_check > self.store_refresh_interval:
+            # 偏好饮料在主进程里查，新注册的用户也要能查到
+            self._last_store_check = time.time()
+            self.store.refresh()
+
+    def has(self, needs):
+        """这一帧有没有状态机当前需要的结果（切换状态时还在路上的帧可能没有）"""
+        if needs == NEEDS_FACES:
+            return self.result.faces is not None
+        if needs == NEEDS_DRINK:
+            return self.result.drinks is not None
+        return True
+
+    def identify(self, frame):
+        return self.result.faces or []
+
+    def find_drink(self, frame, drink_name):
+        return (self.result.drinks or {}).get(drink_name.lower())
+
+    def preference(self, name):
+        return self.store.preference(name)
+
+    def reset(self):
+        pass